@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from scripts.gig_part_assignment_precompute import precomputer, upcoming_gig_ids
+
+
+class Command(BaseCommand):
+    help = ("Solve the part assignments of every upcoming gig and report how long each took. This only checks the "
+            "solves, or captures them with SOLVER_CAPTURE_DIR set: the solution cache lives in each server process, "
+            "so nothing solved here is served, and the server processes warm their own at start-up when "
+            "GIG_PRECOMPUTE is on.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--gig", type=int, nargs="+", dest="gig_ids", help="only these gig ids")
+
+    def handle(self, *args, gig_ids=None, **options):
+        gig_ids = gig_ids or upcoming_gig_ids()
+        start = time.perf_counter()
+        for gig_id in gig_ids:
+            gig_start = time.perf_counter()
+            results = precomputer.compute(gig_id)
+            if results is None:
+                self.stdout.write(f"gig {gig_id}: not an upcoming gig, skipped")
+                continue
+            setlist, recs, _, stats = results
+            self.stdout.write(f"gig {gig_id}: {len(setlist)} setlist songs, {len(recs)} recommendations, "
+                              f"{stats.num_solved} solved in {time.perf_counter() - gig_start:.3f}s")
+        self.stdout.write(self.style.SUCCESS(f"{len(gig_ids)} gig{'' if len(gig_ids) == 1 else 's'} solved in {time.perf_counter() - start:.3f}s"))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from band.models import MemberSongCoverage
+
+
+class Command(BaseCommand):
+    help = ("Recount every member's part assignments on every song in the member song coverage table, which the "
+            "missing assignment lists read. Run it after bulk changes to part assignments, songs or members, which "
+            "skip the receivers that keep it up to date.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        with transaction.atomic():
+            MemberSongCoverage.refresh()
+        missing = MemberSongCoverage.objects.filter(num_assignments=0).count()
+        self.stdout.write(self.style.SUCCESS(f"{MemberSongCoverage.objects.count()} member song rows, {missing} with no "
+                                             f"assignments, rebuilt in {time.perf_counter() - start:.3f}s"))
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_coverage(apps, schema_editor):
+    BandMember = apps.get_model('band', 'BandMember')
+    Song = apps.get_model('band', 'Song')
+    PartAssignment = apps.get_model('band', 'PartAssignment')
+    MemberSongCoverage = apps.get_model('band', 'MemberSongCoverage')
+
+    counts = {(row['member_id'], row['song_part__song_id']): row['count']
+              for row in PartAssignment.objects.values('member_id', 'song_part__song_id').annotate(count=Count('pk'))}
+    song_ids = list(Song.objects.values_list('pk', flat=True))
+    MemberSongCoverage.objects.bulk_create([
+        MemberSongCoverage(member_id=member_id, song_id=song_id, num_assignments=counts.get((member_id, song_id), 0))
+        for member_id in BandMember.objects.values_list('pk', flat=True) for song_id in song_ids
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('band', '0028_gigpartassignmentoverride_override_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberSongCoverage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('num_assignments', models.PositiveIntegerField(default=0)),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='song_coverage', to='band.bandmember')),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='member_coverage', to='band.song')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['num_assignments', 'member'], name='coverage_missing_idx')],
+                'constraints': [models.UniqueConstraint(fields=('member', 'song'), name='unique MemberSongCoverage')],
+            },
+        ),
+        migrations.RunPython(populate_coverage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('band', '0029_membersongcoverage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='partassignment',
+            index=models.Index(fields=['performance_readiness'], name='assignment_readiness_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.urls import reverse
 from djangoyearlessdate.models import YearlessDateField
@@ -113,6 +115,9 @@ class PartAssignment(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['member', 'song_part', 'instrument'], name='unique PartAssignment')
         ]
+        indexes = [
+            models.Index(fields=['performance_readiness'], name='assignment_readiness_idx')
+        ]
 
     def __str__(self):
         return f'{self.member} plays {self.instrument} on {self.song_part}'
@@ -124,6 +129,101 @@ class PartAssignment(models.Model):
         return self.performance_readiness == PerformanceReadiness.NOT_READY
 
 
+class MemberSongCoverage(models.Model):
+    """How many PartAssignments each member has on each song, with a row for every member and song, so the songs
+    a member is missing are the rows with no assignments.
+
+    The receivers below keep it up to date as assignments, songs, parts and members change. Bulk queries skip
+    them, so run manage.py rebuild_member_song_coverage after any.
+    """
+    member = models.ForeignKey(BandMember, related_name='song_coverage', on_delete=models.CASCADE)
+    song = models.ForeignKey(Song, related_name='member_coverage', on_delete=models.CASCADE)
+    num_assignments = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['member', 'song'], name='unique MemberSongCoverage')
+        ]
+        indexes = [
+            models.Index(fields=['num_assignments', 'member'], name='coverage_missing_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.member} has {self.num_assignments} assignments on {self.song}'
+
+    @classmethod
+    def refresh(cls, member_ids: list[int] | None = None, song_ids: list[int] | None = None, create: bool = True):
+        """Recount the rows of the given members' songs, or the given songs' members, or the given members on the
+        given songs; all of them if neither is given. With create, missing rows are created first."""
+        if create:
+            members = BandMember.objects.all() if member_ids is None else BandMember.objects.filter(pk__in=member_ids)
+            songs = Song.objects.all() if song_ids is None else Song.objects.filter(pk__in=song_ids)
+            cls.objects.bulk_create([cls(member_id=member_id, song_id=song_id)
+                                     for member_id in members.values_list('pk', flat=True)
+                                     for song_id in songs.values_list('pk', flat=True)],
+                                    ignore_conflicts=True)
+
+        rows = cls.objects.all()
+        if member_ids is not None:
+            rows = rows.filter(member_id__in=member_ids)
+        if song_ids is not None:
+            rows = rows.filter(song_id__in=song_ids)
+        num_assignments = PartAssignment.objects.filter(member=OuterRef('member'), song_part__song=OuterRef('song')) \
+            .order_by().values('member').annotate(count=Count('pk')).values('count')
+        rows.update(num_assignments=Coalesce(Subquery(num_assignments), 0))
+
+
+@receiver(post_save, sender=BandMember)
+def add_member_coverage(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        MemberSongCoverage.refresh(member_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Song)
+def add_song_coverage(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        MemberSongCoverage.refresh(song_ids=[instance.pk])
+
+
+@receiver(pre_save, sender=PartAssignment)
+def remember_assignment_coverage(sender, instance, raw=False, **kwargs):
+    # an edit may move the assignment to another member or song, which then loses one
+    if instance.pk is not None and not raw:
+        instance._previous_coverage = PartAssignment.objects.filter(pk=instance.pk) \
+            .values_list('member_id', 'song_part__song_id').first()
+
+
+@receiver(post_save, sender=PartAssignment)
+def update_assignment_coverage(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    song_id = SongPart.objects.filter(pk=instance.song_part_id).values_list('song_id', flat=True).get()
+    for member_id, song_id in {(instance.member_id, song_id), getattr(instance, '_previous_coverage', None)} - {None}:
+        MemberSongCoverage.refresh(member_ids=[member_id], song_ids=[song_id])
+
+
+@receiver(post_delete, sender=PartAssignment)
+def remove_assignment_coverage(sender, instance, **kwargs):
+    # when the song is being deleted too its rows are already gone, and must not be created again
+    song_id = SongPart.objects.filter(pk=instance.song_part_id).values_list('song_id', flat=True).first()
+    if song_id is not None:
+        MemberSongCoverage.refresh(member_ids=[instance.member_id], song_ids=[song_id], create=False)
+
+
+@receiver(pre_save, sender=SongPart)
+def remember_part_song(sender, instance, raw=False, **kwargs):
+    if instance.pk is not None and not raw:
+        instance._previous_song_id = SongPart.objects.filter(pk=instance.pk).values_list('song_id', flat=True).first()
+
+
+@receiver(post_save, sender=SongPart)
+def update_part_coverage(sender, instance, raw=False, **kwargs):
+    # moving a part to another song moves its assignments with it
+    previous_song_id = getattr(instance, '_previous_song_id', None)
+    if not raw and previous_song_id is not None and previous_song_id != instance.song_id:
+        MemberSongCoverage.refresh(song_ids=[previous_song_id, instance.song_id])
+
+
 class Gig(models.Model):
     name = models.CharField(max_length=256)
     start_datetime = models.DateTimeField()
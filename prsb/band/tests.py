@@ -1,19 +1,45 @@
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
+from io import StringIO
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
 from band.models import (
     BandMember, Gig, GigAttendance, GigInstrument, GigPartAssignmentOverride,
-    GigSetlistEntry, Instrument, OverrideType, PartAssignment, PerformanceReadiness,
+    GigSetlistEntry, Instrument, MemberSongCoverage, OverrideType, PartAssignment, PerformanceReadiness,
     Song, SongPart,
 )
 from types import SimpleNamespace
+from typing import Tuple
+from unittest import mock
 
-from scripts.gig_part_assignment import get_gig_part_assignments, get_max_instrument_usage
-from band.views import GigPartAssignmentOverrideForm
+import numpy as np
+
+import scripts.gig_part_assignment as gig_part_assignment
+from scripts.gig_part_assignment import get_gig_part_assignments, get_gig_song_part_assignments, get_max_instrument_usage, \
+    get_gig_part_assignments_with_stats, load_gig_assignment_data, solve_gig_problem, ScoringConfig, SolverConfig, GigProblem, \
+    SongProblem, build_song_model, is_matching_song, solve_matching_song, solve_greedy_song, \
+    aggregate_song_model
+from scipy import optimize
+from scripts.gig_part_assignment_benchmark import BandSpec, make_synthetic_problem, populate_synthetic_band, run_suite
+from scripts.gig_part_assignment_cache import GigSolutionCache, solution_cache
+from scripts.gig_part_assignment_capture import load_song_problem, replay_corpus, replay_song_problem
+from scripts.gig_part_assignment_precompute import GigPrecomputer, precomputer
+from band import urls as band_urls
+from band.views import GigPartAssignmentOverrideForm, PartAssignmentListView, get_missing_person_songs, get_missing_songs_for_member
 
 
 class GigPartAssignmentOverrideTestCase(TestCase):
@@ -160,6 +186,34 @@ class GigPartAssignmentOverrideTestCase(TestCase):
         self.assertRedirects(response, reverse('band:gig_part_assignments_detail', kwargs={'pk': self.gig.pk}))
         self.assertFalse(GigPartAssignmentOverride.objects.filter(pk=override.pk).exists())
 
+    def test_problem_drops_not_playing_candidates(self):
+        drums_at_gig = GigInstrument.objects.get(gig=self.gig, instrument=self.drums)
+        override = GigPartAssignmentOverride.objects.create(
+            member=self.member_a.bandmember,
+            song_part=self.part_a,
+            gig_instrument=drums_at_gig,
+            override_type=OverrideType.NOT_PLAYING,
+        )
+
+        problem = load_gig_assignment_data(self.gig, [override]).problem
+        self.assertEqual(len(problem.songs), 1)
+        song_problem = problem.songs[0]
+        self.assertEqual(song_problem.num_candidates, 3)
+        self.assertEqual(song_problem.num_assignments, 3)
+
+    def test_problem_solves_identically_after_pickling(self):
+        data = load_gig_assignment_data(self.gig, [])
+        problem = pickle.loads(pickle.dumps(data.problem))
+
+        counts = np.zeros(problem.num_members, dtype=np.int64)
+        expected, expected_score = get_gig_song_part_assignments(data.problem, data.problem.songs[0], counts)
+        selected, score = get_gig_song_part_assignments(problem, problem.songs[0], counts)
+
+        np.testing.assert_array_equal(selected, expected)
+        self.assertEqual(score, expected_score)
+        gpa = data.to_gig_part_assignment(problem.songs[0], selected, score)
+        self.assertEqual({pa.song_part for pa in gpa.part_assignments}, {self.part_a, self.part_b})
+
 
 class MaxInstrumentUsageTestCase(TestCase):
     @classmethod
@@ -206,3 +260,1421 @@ class MaxInstrumentUsageTestCase(TestCase):
             [(inst.name, max_used, available) for inst, max_used, available in result],
             [("Lead", 0, 7), ("Double Tenor", 0, 1), ("Congas", 0, 1)],
         )
+
+
+class GigPartAssignmentQueryCountTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lead = Instrument.objects.create(name="Lead", order=0)
+        cls.bass = Instrument.objects.create(name="Bass", order=1)
+
+        cls.gig = Gig.objects.create(
+            name="Query Count Gig",
+            start_datetime=timezone.now(),
+            end_datetime=timezone.now() + timedelta(hours=2),
+        )
+        cls.gi_lead = GigInstrument.objects.create(gig=cls.gig, instrument=cls.lead, gig_quantity=2)
+        GigInstrument.objects.create(gig=cls.gig, instrument=cls.bass, gig_quantity=1)
+
+        for i in range(4):
+            User.objects.create_user(username=f"member{i}", first_name=f"Member{i}", last_name="Test")
+        cls.members = list(BandMember.objects.all())
+        GigAttendance.objects.bulk_create([
+            GigAttendance(gig=cls.gig, member=member, status=GigAttendance.AVAILABLE) for member in cls.members
+        ])
+
+    def _add_songs(self, start: int, stop: int):
+        songs = Song.objects.bulk_create([
+            Song(title=f"Song {i:04d}", in_gig_rotation=True) for i in range(start, stop)
+        ])
+        parts = SongPart.objects.bulk_create([
+            SongPart(song=song, name=name, _order=j) for song in songs for j, name in enumerate(["Melody", "Bass"])
+        ])
+        PartAssignment.objects.bulk_create([
+            PartAssignment(member=member, song_part=part, instrument=self.lead if part.name == "Melody" else self.bass)
+            for part in parts for member in self.members
+        ])
+        GigPartAssignmentOverride.objects.bulk_create([
+            GigPartAssignmentOverride(member=self.members[0], song_part=part, gig_instrument=self.gi_lead,
+                                      override_type=OverrideType.NOT_PLAYING)
+            for part in parts if part.name == "Melody"
+        ])
+        GigSetlistEntry.objects.bulk_create([GigSetlistEntry(gig=self.gig, song=song, _order=0) for song in songs[:2]])
+
+    def _count_queries(self) -> int:
+        overrides = list(GigPartAssignmentOverride.objects.filter(gig_instrument__gig=self.gig))
+        with CaptureQueriesContext(connection) as queries:
+            setlist, recs, _ = get_gig_part_assignments(self.gig, overrides)
+            for gpa in setlist + recs:
+                for pa in gpa.part_assignments:
+                    str(pa.song_part), str(pa.member), str(pa.instrument)
+        return len(queries)
+
+    def test_query_count_independent_of_song_count(self):
+        self._add_songs(0, 10)
+        small_counts = {}
+        for threshold in [0, 0.5]:
+            with mock.patch.object(SolverConfig, "MIN_READY_PART_COVERAGE", threshold):
+                small_counts[threshold] = self._count_queries()
+
+        self._add_songs(10, 500)
+        for threshold in [0, 0.5]:
+            with self.subTest(threshold=threshold), mock.patch.object(SolverConfig, "MIN_READY_PART_COVERAGE", threshold):
+                self.assertEqual(self._count_queries(), small_counts[threshold])
+
+    def test_readiness_subquery_only_runs_with_a_coverage_threshold(self):
+        self._add_songs(0, 3)
+        for threshold, expected in [(0, False), (0.5, True)]:
+            with self.subTest(threshold=threshold), mock.patch.object(SolverConfig, "MIN_READY_PART_COVERAGE", threshold), \
+                    CaptureQueriesContext(connection) as queries:
+                load_gig_assignment_data(self.gig, [])
+            self.assertEqual(any("has_ready_player" in query["sql"] for query in queries), expected)
+
+    def test_derived_fields_are_lazy_and_share_the_gig_roster(self):
+        self._add_songs(0, 3)
+        overrides = list(GigPartAssignmentOverride.objects.filter(gig_instrument__gig=self.gig))
+        setlist, recs, _ = get_gig_part_assignments(self.gig, overrides)
+        gpas = setlist + recs
+
+        self.assertTrue(all(gpa._non_players is None and gpa._unplayed_parts is None and gpa._unplayed_instruments is None
+                            for gpa in gpas))
+        self.assertEqual(len({id(gpa._roster) for gpa in gpas}), 1)
+        self.assertFalse(hasattr(gpas[0], "__dict__"))
+
+        song_parts = {gpa.song.id: list(gpa.song.parts.order_by("_order")) for gpa in gpas}
+        with self.assertNumQueries(0):
+            for gpa in gpas:
+                played = Counter(pa.instrument for pa in gpa.part_assignments)
+                covered = {pa.song_part for pa in gpa.part_assignments}
+                self.assertEqual(set(gpa.non_players), set(self.members) - {pa.member for pa in gpa.part_assignments})
+                self.assertEqual(gpa.unplayed_parts, [sp for sp in song_parts[gpa.song.id] if sp not in covered])
+                expected = {self.lead: 2 - played[self.lead], self.bass: 1 - played[self.bass]}
+                self.assertEqual(gpa.unplayed_instruments, {i: c for i, c in expected.items() if c != 0})
+
+
+class GigSolutionCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.song = Song.objects.create(title="Cached Song", in_gig_rotation=True)
+        cls.part = SongPart.objects.create(song=cls.song, name="Melody")
+        cls.lead = Instrument.objects.create(name="Lead", order=0)
+
+        cls.gig = Gig.objects.create(
+            name="Cache Gig",
+            start_datetime=timezone.now(),
+            end_datetime=timezone.now() + timedelta(hours=2),
+        )
+        GigInstrument.objects.create(gig=cls.gig, instrument=cls.lead, gig_quantity=1)
+
+        cls.member = User.objects.create_user(username="carol", first_name="Carol", last_name="King").bandmember
+        GigAttendance.objects.create(gig=cls.gig, member=cls.member, status=GigAttendance.AVAILABLE)
+        cls.assignment = PartAssignment.objects.create(member=cls.member, song_part=cls.part, instrument=cls.lead)
+
+    def setUp(self):
+        solution_cache.invalidate()
+
+    def test_repeated_solve_is_a_cache_hit(self):
+        get_gig_part_assignments(self.gig, [])
+        hits = solution_cache.stats()["hits"]
+
+        _, recs, _ = get_gig_part_assignments(self.gig, [])
+
+        self.assertEqual(solution_cache.stats()["hits"], hits + 1)
+        self.assertEqual([pa.member for pa in recs[0].part_assignments], [self.member])
+
+    def test_saving_part_assignment_evicts_cached_solution(self):
+        get_gig_part_assignments(self.gig, [])
+        self.assertEqual(solution_cache.stats()["size"], 1)
+
+        self.assignment.performance_readiness = PerformanceReadiness.BACKUP
+        self.assignment.save()
+        self.assertEqual(solution_cache.stats()["size"], 0)
+
+        _, recs, _ = get_gig_part_assignments(self.gig, [])
+        self.assertTrue(recs[0].part_assignments[0].is_backup())
+
+    def test_setlist_change_evicts_only_that_gig(self):
+        get_gig_part_assignments(self.gig, [])
+        solution_cache.put(self.gig.id + 1, "other", object())
+
+        GigSetlistEntry.objects.create(gig=self.gig, song=self.song)
+
+        self.assertEqual(solution_cache.stats()["size"], 1)
+        self.assertIsNotNone(solution_cache.get(self.gig.id + 1, "other"))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = GigSolutionCache(max_size=2)
+        cache.put(1, "a", "first")
+        cache.put(2, "b", "second")
+        cache.get(1, "a")
+        cache.put(3, "c", "third")
+
+        self.assertIsNone(cache.get(2, "b"))
+        self.assertEqual(cache.get(1, "a"), "first")
+        self.assertEqual(cache.stats(), {"hits": 2, "misses": 1, "size": 2, "max_size": 2})
+
+
+class RecommendationPoolTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lead = Instrument.objects.create(name="Lead", order=0)
+        cls.cello = Instrument.objects.create(name="Cello", order=1)
+
+        cls.gig = Gig.objects.create(
+            name="Pool Gig",
+            start_datetime=timezone.now(),
+            end_datetime=timezone.now() + timedelta(hours=2),
+        )
+        GigInstrument.objects.create(gig=cls.gig, instrument=cls.lead, gig_quantity=2)
+        GigInstrument.objects.create(gig=cls.gig, instrument=cls.cello, gig_quantity=1)
+
+        members = [User.objects.create_user(username=f"pool{i}", first_name=f"Pool{i}").bandmember for i in range(4)]
+        for member in members:
+            GigAttendance.objects.create(gig=cls.gig, member=member, status=GigAttendance.AVAILABLE)
+
+        for i in range(6):
+            song = Song.objects.create(title=f"Pool Song {i}", in_gig_rotation=True)
+            melody = SongPart.objects.create(song=song, name="Melody")
+            strum = SongPart.objects.create(song=song, name="Strum")
+            for j, member in enumerate(members):
+                PartAssignment.objects.create(member=member, song_part=melody if (i + j) % 2 else strum,
+                                              instrument=cls.lead if (i + j) % 3 else cls.cello)
+            if i == 0:
+                GigSetlistEntry.objects.create(gig=cls.gig, song=song)
+
+    def _solve(self, mode: str, executor: str = "thread"):
+        problem = load_gig_assignment_data(self.gig, []).problem
+        with mock.patch.object(SolverConfig, "RECOMMENDATION_MODE", mode), \
+                mock.patch.object(SolverConfig, "RECOMMENDATION_WORKERS", 2), \
+                mock.patch.object(SolverConfig, "RECOMMENDATION_EXECUTOR", executor):
+            solution = solve_gig_problem(problem)
+        return [(selected.tolist(), score) for selected, score in solution.song_results], solution.member_song_counts.tolist()
+
+    def test_thread_and_process_pools_agree(self):
+        self.assertEqual(self._solve("pool", "thread"), self._solve("pool", "process"))
+
+    def test_setlist_songs_are_unaffected_by_pool(self):
+        sequential_results, sequential_counts = self._solve("sequential")
+        pooled_results, pooled_counts = self._solve("pool")
+
+        self.assertEqual(pooled_results[0], sequential_results[0])
+        self.assertEqual(pooled_counts, sequential_counts)
+        self.assertEqual(len(pooled_results), 6)
+
+    def test_batched_matches_per_song_solves(self):
+        pooled_results, _ = self._solve("pool")
+        batched_results, _ = self._solve("batched")
+
+        self.assertEqual(len(batched_results), len(pooled_results))
+        for (_, batched_score), (_, pooled_score) in zip(batched_results, pooled_results):
+            self.assertAlmostEqual(batched_score, pooled_score)
+
+
+class MatchingFastPathTestCase(SimpleTestCase):
+    def _random_song(self, seed: int) -> Tuple[GigProblem, SongProblem]:
+        rng = np.random.default_rng(seed)
+        num_members, num_instruments, num_parts = rng.integers(1, 9), rng.integers(1, 4), rng.integers(1, 5)
+        candidates = {(int(rng.integers(num_members)), int(rng.integers(num_parts)), int(rng.integers(num_instruments)))
+                      for _ in range(rng.integers(1, 15))}
+        member, part, instrument = np.array(sorted(candidates), dtype=np.int32).T
+        song = SongProblem(song_id=seed, title="Random", in_setlist=False, num_parts=int(num_parts), member=member, part=part,
+                           instrument=instrument, readiness=rng.integers(0, 2, len(member)).astype(np.int8),
+                           num_assignments=len(member), assignment_ids=np.arange(len(member)))
+        problem = GigProblem(gig_id=0, member_ids=np.arange(num_members), instrument_ids=np.arange(num_instruments),
+                             instrument_capacity=rng.integers(1, 10, num_instruments).astype(float),
+                             instrument_counts_songs=np.ones(num_instruments, dtype=bool), songs=[song])
+        return problem, song
+
+    def test_matches_milp_objective_on_random_songs(self):
+        checked = 0
+        for seed in range(300):
+            problem, song = self._random_song(seed)
+            if not is_matching_song(problem, song):
+                continue
+            checked += 1
+
+            # large song counts make some candidates cost more than they save
+            member_song_counts = np.random.default_rng(seed).integers(0, 800, problem.num_members)
+            model = build_song_model(problem, song, member_song_counts, np.random.default_rng(seed))
+            x = solve_matching_song(song, model)
+            milp = optimize.milp(c=model.c, constraints=optimize.LinearConstraint(model.A, model.lb, model.ub),
+                                 bounds=optimize.Bounds(0, 1), integrality=np.ones_like(model.c), options={"mip_rel_gap": 0})
+
+            with self.subTest(seed=seed):
+                self.assertTrue(np.all(model.A @ x >= model.lb) and np.all(model.A @ x <= model.ub))
+                # the assignment solve is exact; HiGHS stops within its default absolute gap of 1e-6
+                self.assertLessEqual(model.c @ x, milp.fun + 1e-9)
+                self.assertLessEqual(milp.fun - model.c @ x, 1e-6)
+        self.assertGreater(checked, 100)
+
+    def test_contended_instrument_is_not_a_matching_song(self):
+        song = SongProblem(song_id=1, title="Contended", in_setlist=False, num_parts=2,
+                           member=np.array([0, 1], dtype=np.int32), part=np.array([0, 1], dtype=np.int32),
+                           instrument=np.array([0, 0], dtype=np.int32), readiness=np.zeros(2, dtype=np.int8),
+                           num_assignments=2, assignment_ids=np.arange(2))
+        problem = GigProblem(gig_id=0, member_ids=np.arange(2), instrument_ids=np.arange(1), instrument_capacity=np.array([1.0]),
+                             instrument_counts_songs=np.ones(1, dtype=bool), songs=[song])
+
+        self.assertFalse(is_matching_song(problem, song))
+        problem.instrument_capacity[0] = 2
+        self.assertTrue(is_matching_song(problem, song))
+
+
+class IncrementalSolveTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lead = Instrument.objects.create(name="Lead", order=0)
+        cls.bass = Instrument.objects.create(name="Bass", order=1)
+
+        cls.gig = Gig.objects.create(
+            name="Incremental Gig",
+            start_datetime=timezone.now(),
+            end_datetime=timezone.now() + timedelta(hours=2),
+        )
+        cls.gi_lead = GigInstrument.objects.create(gig=cls.gig, instrument=cls.lead, gig_quantity=1)
+        GigInstrument.objects.create(gig=cls.gig, instrument=cls.bass, gig_quantity=1)
+
+        cls.members = [User.objects.create_user(username=f"inc{i}", first_name=f"Inc{i}").bandmember for i in range(3)]
+        for member in cls.members:
+            GigAttendance.objects.create(gig=cls.gig, member=member, status=GigAttendance.AVAILABLE)
+
+        for i in range(5):
+            song = Song.objects.create(title=f"Incremental Song {i}", in_gig_rotation=True)
+            melody = SongPart.objects.create(song=song, name="Melody")
+            bass = SongPart.objects.create(song=song, name="Bass")
+            for member in cls.members[:2 + i % 2]:
+                PartAssignment.objects.create(member=member, song_part=melody, instrument=cls.lead)
+                PartAssignment.objects.create(member=member, song_part=bass, instrument=cls.bass)
+
+    def setUp(self):
+        solution_cache.invalidate()
+        self.previous = load_gig_assignment_data(self.gig, []).problem
+        self.trail = gig_part_assignment.SolutionTrail(gig_part_assignment._config_key(), self.previous,
+                                                       solve_gig_problem(self.previous))
+
+    def _solve_with_trail(self, problem):
+        with mock.patch.object(gig_part_assignment, "get_gig_song_part_assignments",
+                               wraps=gig_part_assignment.get_gig_song_part_assignments) as solve_song:
+            solution = solve_gig_problem(problem, self.trail)
+        return solution, solve_song.call_count
+
+    def _assert_same_solution(self, a, b):
+        self.assertEqual([(None if x is None else x.tolist(), score) for x, score in a.song_results],
+                         [(None if x is None else x.tolist(), score) for x, score in b.song_results])
+        self.assertEqual(a.member_song_counts.tolist(), b.member_song_counts.tolist())
+
+    def test_override_on_last_song_only_resolves_that_song(self):
+        last_song = self.previous.songs[-1]
+        part = SongPart.objects.filter(song_id=last_song.song_id).first()
+        override = GigPartAssignmentOverride.objects.create(member=self.members[0], song_part=part, gig_instrument=self.gi_lead,
+                                                            override_type=OverrideType.NOT_PLAYING)
+        problem = load_gig_assignment_data(self.gig, [override]).problem
+
+        solution, solved = self._solve_with_trail(problem)
+
+        self.assertEqual(solved, 1)
+        self._assert_same_solution(solution, solve_gig_problem(problem))
+
+    def test_attendance_change_falls_back_to_full_solve(self):
+        GigAttendance.objects.filter(gig=self.gig, member=self.members[2]).update(status=GigAttendance.UNAVAILABLE)
+        problem = load_gig_assignment_data(self.gig, []).problem
+
+        solution, solved = self._solve_with_trail(problem)
+
+        self.assertEqual(solved, len(problem.songs))
+        self._assert_same_solution(solution, solve_gig_problem(problem))
+
+    def test_setlist_addition_matches_full_solve(self):
+        GigSetlistEntry.objects.create(gig=self.gig, song_id=self.previous.songs[-1].song_id)
+        problem = load_gig_assignment_data(self.gig, []).problem
+
+        solution, _ = self._solve_with_trail(problem)
+
+        self._assert_same_solution(solution, solve_gig_problem(problem))
+
+    def test_stats_mark_reused_songs(self):
+        last_song = self.previous.songs[-1]
+        part = SongPart.objects.filter(song_id=last_song.song_id).first()
+        override = GigPartAssignmentOverride.objects.create(member=self.members[0], song_part=part, gig_instrument=self.gi_lead,
+                                                            override_type=OverrideType.NOT_PLAYING)
+        problem = load_gig_assignment_data(self.gig, [override]).problem
+
+        solution, _ = self._solve_with_trail(problem)
+
+        self.assertEqual([stats.song_id for stats in solution.song_stats], [song.song_id for song in problem.songs])
+        self.assertEqual([stats.method == "reused" for stats in solution.song_stats], [True] * (len(problem.songs) - 1) + [False])
+
+
+class SolverStatsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lead = Instrument.objects.create(name="Lead", order=0)
+        cls.gig = Gig.objects.create(
+            name="Stats Gig",
+            start_datetime=timezone.now(),
+            end_datetime=timezone.now() + timedelta(hours=2),
+        )
+        GigInstrument.objects.create(gig=cls.gig, instrument=cls.lead, gig_quantity=2)
+
+        members = [User.objects.create_user(username=f"stats{i}", first_name=f"Stats{i}").bandmember for i in range(3)]
+        for member in members:
+            GigAttendance.objects.create(gig=cls.gig, member=member, status=GigAttendance.AVAILABLE)
+        for i in range(3):
+            song = Song.objects.create(title=f"Stats Song {i}", in_gig_rotation=True)
+            part = SongPart.objects.create(song=song, name="Melody")
+            for member in members:
+                PartAssignment.objects.create(member=member, song_part=part, instrument=cls.lead)
+
+    def setUp(self):
+        solution_cache.clear()
+
+    def test_stats_cover_every_song(self):
+        _, recs, _, stats = get_gig_part_assignments_with_stats(self.gig, [])
+
+        self.assertFalse(stats.cache_hit)
+        self.assertEqual(sorted(song.title for song in stats.songs), sorted(gpa.song.title for gpa in recs))
+        for song in stats.songs:
+            self.assertIn(song.method, ("milp", "aggregated", "matching"))
+            # the aggregated model merges members with the same song count, so it is smaller
+            if song.method == "aggregated":
+                self.assertLess(song.num_vars, 3 + 1)
+            else:
+                self.assertEqual(song.num_vars, 3 + 1)
+            self.assertGreater(song.num_constraints, 0)
+            self.assertEqual(song.status, 0)
+        self.assertGreaterEqual(stats.total_seconds, stats.solve_seconds)
+        self.assertEqual(stats.num_solved, 3)
+
+    def test_cache_hit_is_reported(self):
+        get_gig_part_assignments_with_stats(self.gig, [])
+        _, _, _, stats = get_gig_part_assignments_with_stats(self.gig, [])
+
+        self.assertTrue(stats.cache_hit)
+
+    def test_global_setlist_mode_is_compared_with_greedy(self):
+        for song in Song.objects.filter(title__startswith="Stats Song"):
+            GigSetlistEntry.objects.create(gig=self.gig, song=song)
+        self.client.force_login(User.objects.create_superuser(username="stats-admin", password="x"))
+
+        response = self.client.get(reverse('band:gig_part_assignments_detail', kwargs={'pk': self.gig.pk}), {'setlist_mode': 'global'})
+
+        self.assertEqual([(row['requested_mode'], row['mode']) for row in response.context['setlist_results']],
+                         [("global", "global"), ("greedy", "greedy")])
+        self.assertContains(response, "?order=setlist&setlist_mode=global")
+
+    def test_songs_past_the_time_budget_are_flagged_approximate(self):
+        with mock.patch.object(SolverConfig, "GIG_TIME_BUDGET", 0), self.assertLogs("scripts.gig_part_assignment", "WARNING"):
+            _, recs, _, stats = get_gig_part_assignments_with_stats(self.gig, [])
+
+        self.assertEqual(len(recs), 3)
+        self.assertTrue(all(gpa.approximate for gpa in recs))
+        self.assertTrue(all(len(gpa.part_assignments) == 2 for gpa in recs))
+        self.assertEqual({song.method for song in stats.songs}, {"greedy"})
+        self.assertTrue(stats.approximate)
+        self.assertTrue(all(stats.is_approximate(i) for i in range(len(stats.songs))))
+        self.assertEqual(solution_cache.stats()["size"], 0)
+
+        _, recs, _, stats = get_gig_part_assignments_with_stats(self.gig, [])
+
+        self.assertFalse(any(gpa.approximate for gpa in recs))
+        self.assertFalse(stats.approximate)
+        self.assertEqual(stats.num_solved, 3)
+
+    def test_debug_panel_only_on_request(self):
+        self.client.force_login(User.objects.create_superuser(username="stats-admin", password="x"))
+        url = reverse('band:gig_part_assignments_detail', kwargs={'pk': self.gig.pk})
+
+        self.assertNotContains(self.client.get(url), "Solver Stats")
+        self.assertContains(self.client.get(url, {'solver_stats': 1}), "Solver Stats")
+
+
+class BenchmarkSuiteTestCase(TestCase):
+    spec = BandSpec(num_songs=6, num_members=5, num_instruments=3, max_parts_per_song=3, num_overrides=2, seed=3)
+
+    def test_db_band_matches_in_memory_problem(self):
+        gig = populate_synthetic_band(self.spec)
+        from_db = load_gig_assignment_data(gig, list(GigPartAssignmentOverride.objects.filter(gig_instrument__gig=gig))).problem
+        in_memory = make_synthetic_problem(self.spec)
+
+        self.assertEqual(sorted((song.num_parts, song.num_assignments, song.num_candidates) for song in from_db.songs),
+                         sorted((song.num_parts, song.num_assignments, song.num_candidates) for song in in_memory.songs))
+        self.assertEqual(sorted(from_db.instrument_capacity), sorted(in_memory.instrument_capacity))
+
+    def test_suite_reports_percentiles_and_memory(self):
+        report = run_suite(self.spec, repeats=2)
+
+        self.assertEqual(report["spec"]["num_songs"], 6)
+        for name in ("song", "gig"):
+            self.assertLessEqual(report["results"][name]["p50_seconds"], report["results"][name]["p95_seconds"])
+            self.assertGreater(report["results"][name]["peak_traced_bytes"], 0)
+
+
+class SolverCaptureTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.problem = make_synthetic_problem(BandSpec(num_songs=5, num_members=6, num_instruments=2, num_overrides=2, seed=1))
+
+    def _capture_all(self, mode="sequential"):
+        with mock.patch.object(SolverConfig, "CAPTURE_DIR", self.directory.name), \
+                mock.patch.object(SolverConfig, "CAPTURE_MPS", True), \
+                mock.patch.object(SolverConfig, "RECOMMENDATION_MODE", mode):
+            return solve_gig_problem(self.problem)
+
+    def test_replay_matches_captured_objectives(self):
+        solution = self._capture_all()
+
+        results = replay_corpus(self.directory.name)
+
+        self.assertEqual(sorted(row["song_id"] for row in results), sorted(song.song_id for song in self.problem.songs))
+        self.assertTrue(all(row["matches"] for row in results))
+        self.assertEqual(len([name for name in os.listdir(self.directory.name) if name.endswith(".mps")]), len(results))
+        for song, (selected, _) in zip(self.problem.songs, solution.song_results):
+            captured = load_song_problem(next(os.path.join(self.directory.name, name) for name in os.listdir(self.directory.name)
+                                              if name.startswith(f"gig0_song{song.song_id}_") and name.endswith(".npz")))
+            self.assertEqual(np.flatnonzero(captured["x"][:captured["num_candidates"]] > 0.5).tolist(), selected.tolist())
+            self.assertEqual(captured["member_ids"].tolist(), self.problem.member_ids[song.member].tolist())
+
+    def test_batched_solves_are_captured_per_song(self):
+        self._capture_all(mode="batched")
+
+        self.assertEqual(len(replay_corpus(self.directory.name)), len(self.problem.songs))
+
+    def test_changed_objective_is_reported(self):
+        self._capture_all()
+        path = os.path.join(self.directory.name, sorted(os.listdir(self.directory.name))[0].replace(".mps", ".npz"))
+        captured = load_song_problem(path)
+        captured["objective"] += 1
+
+        self.assertFalse(replay_song_problem(captured)["matches"])
+
+
+class SolverDeterminismTestCase(SimpleTestCase):
+    def setUp(self):
+        self.problem = make_synthetic_problem(BandSpec(num_songs=12, num_members=8, num_instruments=3, num_overrides=3, seed=4))
+
+    def _results(self, solution):
+        return [(None if x is None else x.tolist(), score) for x, score in solution.song_results]
+
+    def test_global_random_state_is_untouched(self):
+        np.random.seed(1)
+        expected = np.random.random()
+        np.random.seed(1)
+
+        solve_gig_problem(self.problem)
+
+        self.assertEqual(np.random.random(), expected)
+
+    def test_concurrent_solves_match_serial_solve(self):
+        expected = self._results(solve_gig_problem(self.problem))
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            solutions = list(executor.map(lambda _: solve_gig_problem(self.problem), range(4)))
+
+        for solution in solutions:
+            self.assertEqual(self._results(solution), expected)
+
+    def test_song_result_does_not_depend_on_solve_order(self):
+        counts = np.zeros(self.problem.num_members, dtype=np.int64)
+        forwards = [get_gig_song_part_assignments(self.problem, song, counts) for song in self.problem.songs]
+        backwards = [get_gig_song_part_assignments(self.problem, song, counts) for song in reversed(self.problem.songs)]
+
+        self.assertEqual([(x.tolist(), score) for x, score in forwards],
+                         [(x.tolist(), score) for x, score in reversed(backwards)])
+
+
+class GlobalSetlistModeTestCase(SimpleTestCase):
+    def setUp(self):
+        self.problem = make_synthetic_problem(BandSpec(num_songs=14, num_members=10, num_instruments=3, seed=5))
+        self.num_setlist = 9
+        for song in self.problem.songs[:self.num_setlist]:
+            song.in_setlist = True
+
+    def _objective(self, solution):
+        # what the global solve minimises, less the random tie-breaker
+        counts = solution.member_song_counts
+        penalty = ScoringConfig.ASSIGNMENT_PENALTY_PER_SONG * sum(k * (k - 1) * (2 * k - 1) // 6 for k in counts)
+        return penalty - sum(score for _, score in solution.song_results[:self.num_setlist])
+
+    def test_global_mode_is_at_least_as_good_as_greedy(self):
+        greedy = solve_gig_problem(self.problem, setlist_mode="greedy")
+        joint = solve_gig_problem(self.problem, setlist_mode="global")
+
+        self.assertEqual(joint.setlist_mode, "global")
+        self.assertLessEqual(self._objective(joint), self._objective(greedy) + 1e-4)
+        self.assertTrue(all(stats.method == "global" for stats in joint.song_stats[:self.num_setlist]))
+
+    def test_time_limit_falls_back_to_greedy(self):
+        with mock.patch.object(SolverConfig, "GLOBAL_TIME_LIMIT", 0):
+            solution = solve_gig_problem(self.problem, setlist_mode="global")
+
+        greedy = solve_gig_problem(self.problem, setlist_mode="greedy")
+        self.assertEqual(solution.setlist_mode, "greedy")
+        self.assertEqual([(x.tolist(), score) for x, score in solution.song_results],
+                         [(x.tolist(), score) for x, score in greedy.song_results])
+
+
+class GlobalSetlistModeWithoutSetlistTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lead = Instrument.objects.create(name="Lead", order=0)
+        cls.gig = Gig.objects.create(
+            name="Unplayable Setlist Gig",
+            start_datetime=timezone.now(),
+            end_datetime=timezone.now() + timedelta(hours=2),
+        )
+        GigInstrument.objects.create(gig=cls.gig, instrument=cls.lead, gig_quantity=1)
+        members = [User.objects.create_user(username=f"unplayable{i}", first_name=f"Unplayable{i}").bandmember for i in range(2)]
+        GigAttendance.objects.create(gig=cls.gig, member=members[0], status=GigAttendance.AVAILABLE)
+        for title, member in [("Unplayable Setlist Song", members[1]), ("Playable Song", members[0])]:
+            song = Song.objects.create(title=title, in_gig_rotation=True)
+            PartAssignment.objects.create(member=member, song_part=SongPart.objects.create(song=song, name="Melody"),
+                                          instrument=cls.lead)
+            if member == members[1]:
+                GigSetlistEntry.objects.create(gig=cls.gig, song=song)
+
+    def setUp(self):
+        solution_cache.clear()
+
+    def test_empty_setlist(self):
+        problem = make_synthetic_problem(BandSpec(num_songs=5, num_members=4, num_instruments=2, seed=7))
+        solution = solve_gig_problem(problem, setlist_mode="global")
+
+        greedy = solve_gig_problem(problem, setlist_mode="greedy")
+        self.assertEqual([(x.tolist(), score) for x, score in solution.song_results],
+                         [(x.tolist(), score) for x, score in greedy.song_results])
+
+    def test_setlist_without_candidates(self):
+        setlist, recs, _ = get_gig_part_assignments(self.gig, [], setlist_mode="global")
+
+        self.assertEqual(setlist, [])
+        self.assertEqual([gpa.song.title for gpa in recs], ["Playable Song"])
+
+
+class GreedySongHeuristicTestCase(SimpleTestCase):
+    def test_greedy_solution_is_feasible_and_no_better_than_milp(self):
+        problem = make_synthetic_problem(BandSpec(num_songs=60, num_members=12, num_instruments=4, num_overrides=20, seed=6))
+        counts = np.zeros(problem.num_members, dtype=np.int64)
+        for song in problem.songs:
+            model = build_song_model(problem, song, counts)
+            x = solve_greedy_song(problem, song, model)
+            result = optimize.milp(c=model.c, constraints=optimize.LinearConstraint(model.A, model.lb, model.ub),
+                                   bounds=optimize.Bounds(0, 1), integrality=np.ones_like(model.c))
+            if x is None:
+                self.assertFalse(result.success)
+                continue
+
+            activity = model.A @ x
+            self.assertTrue(np.all(activity >= model.lb - 1e-9) and np.all(activity <= model.ub + 1e-9))
+            self.assertGreaterEqual(model.c @ x, result.fun - 1e-6)
+
+
+class MemberAggregationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lead = Instrument.objects.create(name="Lead", order=0)
+        cls.rhythm = Instrument.objects.create(name="Rhythm", order=1)
+        cls.gig = Gig.objects.create(
+            name="Aggregation Gig",
+            start_datetime=timezone.now(),
+            end_datetime=timezone.now() + timedelta(hours=2),
+        )
+        cls.gi_lead = GigInstrument.objects.create(gig=cls.gig, instrument=cls.lead, gig_quantity=3)
+        GigInstrument.objects.create(gig=cls.gig, instrument=cls.rhythm, gig_quantity=2)
+
+        cls.members = [User.objects.create_user(username=f"agg{i}", first_name=f"Agg{i}").bandmember for i in range(12)]
+        for member in cls.members:
+            GigAttendance.objects.create(gig=cls.gig, member=member, status=GigAttendance.AVAILABLE)
+        cls.melodies = []
+        for i in range(4):
+            song = Song.objects.create(title=f"Aggregation Song {i}", in_gig_rotation=True)
+            melody = SongPart.objects.create(song=song, name="Melody")
+            harmony = SongPart.objects.create(song=song, name="Harmony")
+            cls.melodies.append(melody)
+            # eight interchangeable members who know both parts, and four who can only back up the melody
+            for member in cls.members[:8]:
+                PartAssignment.objects.create(member=member, song_part=melody, instrument=cls.lead)
+                PartAssignment.objects.create(member=member, song_part=harmony, instrument=cls.rhythm)
+            for member in cls.members[8:]:
+                PartAssignment.objects.create(member=member, song_part=melody, instrument=cls.lead,
+                                              performance_readiness=PerformanceReadiness.BACKUP)
+
+    def _solve_both_ways(self, problem, song):
+        counts = np.zeros(problem.num_members, dtype=np.int64)
+        with mock.patch.object(SolverConfig, "MATCHING_FAST_PATH", False):
+            with mock.patch.object(SolverConfig, "AGGREGATE_MEMBERS", False):
+                full = get_gig_song_part_assignments(problem, song, counts)
+            aggregated = get_gig_song_part_assignments(problem, song, counts)
+        return full, aggregated
+
+    def test_aggregated_model_is_smaller_and_feasible(self):
+        problem = load_gig_assignment_data(self.gig, []).problem
+        counts = np.zeros(problem.num_members, dtype=np.int64)
+        for song in problem.songs:
+            model = build_song_model(problem, song, counts)
+            aggregated = aggregate_song_model(problem, song, model, counts)
+
+            self.assertIsNotNone(aggregated)
+            self.assertLessEqual(len(aggregated.c), len(model.c) // 4)
+            self.assertLess(aggregated.A.shape[0], model.A.shape[0])
+
+            result = optimize.milp(c=aggregated.c, constraints=optimize.LinearConstraint(aggregated.A, aggregated.lb, aggregated.ub),
+                                   bounds=optimize.Bounds(0, aggregated.var_ub), integrality=np.ones_like(aggregated.c))
+            x = aggregated.expand(result.x, model, np.random.default_rng(0))
+            activity = model.A @ x
+            self.assertTrue(np.all(activity >= model.lb - 1e-9) and np.all(activity <= model.ub + 1e-9))
+            self.assertTrue(np.all((x == 0) | (x == 1)))
+
+    def test_aggregated_score_matches_full_milp(self):
+        problem = load_gig_assignment_data(self.gig, []).problem
+        for song in problem.songs:
+            (_, full_score), (selected, aggregated_score) = self._solve_both_ways(problem, song)
+
+            self.assertAlmostEqual(aggregated_score, full_score, delta=1e-5)
+            self.assertEqual(len(selected), 3 + 2)
+
+    def test_forced_member_is_kept(self):
+        override = GigPartAssignmentOverride.objects.create(member=self.members[3], song_part=self.melodies[0],
+                                                            gig_instrument=self.gi_lead, override_type=OverrideType.ASSIGN)
+        problem = load_gig_assignment_data(self.gig, [override]).problem
+        song = next(song for song in problem.songs if song.song_id == self.melodies[0].song_id)
+        (_, full_score), (selected, aggregated_score) = self._solve_both_ways(problem, song)
+
+        self.assertAlmostEqual(aggregated_score, full_score, delta=1e-5)
+        forced = np.arange(song.num_candidates) >= song.num_assignments
+        self.assertTrue(np.all(np.isin(np.flatnonzero(forced), selected)))
+
+
+class SongCoverageFilterTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lead = Instrument.objects.create(name="Lead", order=0)
+        cls.gig = Gig.objects.create(
+            name="Coverage Gig",
+            start_datetime=timezone.now(),
+            end_datetime=timezone.now() + timedelta(hours=2),
+        )
+        cls.gi_lead = GigInstrument.objects.create(gig=cls.gig, instrument=cls.lead, gig_quantity=4)
+        cls.members = [User.objects.create_user(username=f"cov{i}", first_name=f"Cov{i}").bandmember for i in range(4)]
+        for member in cls.members:
+            GigAttendance.objects.create(gig=cls.gig, member=member, status=GigAttendance.AVAILABLE)
+
+        # one song with every part ready, and three with one ready part out of four
+        cls.songs = {}
+        for title, num_ready in (("Covered", 4), ("Sparse", 1), ("Sparse Setlist", 1), ("Sparse Override", 1)):
+            song = Song.objects.create(title=title, in_gig_rotation=True)
+            for j, member in enumerate(cls.members):
+                part = SongPart.objects.create(song=song, name=f"Part {j}")
+                PartAssignment.objects.create(member=member, song_part=part, instrument=cls.lead,
+                                              performance_readiness=PerformanceReadiness.READY if j < num_ready else PerformanceReadiness.BACKUP)
+            cls.songs[title] = song
+        GigSetlistEntry.objects.create(gig=cls.gig, song=cls.songs["Sparse Setlist"])
+        GigPartAssignmentOverride.objects.create(member=cls.members[3], song_part=cls.songs["Sparse Override"].parts.last(),
+                                                 gig_instrument=cls.gi_lead, override_type=OverrideType.ASSIGN)
+
+    def setUp(self):
+        solution_cache.clear()
+        self.overrides = list(GigPartAssignmentOverride.objects.filter(gig_instrument__gig=self.gig))
+
+    def test_low_coverage_recommendations_are_skipped(self):
+        with mock.patch.object(SolverConfig, "MIN_READY_PART_COVERAGE", 0.5):
+            setlist, recs, _, stats = get_gig_part_assignments_with_stats(self.gig, self.overrides)
+
+        self.assertEqual([gpa.song.title for gpa in setlist], ["Sparse Setlist"])
+        self.assertEqual(sorted(gpa.song.title for gpa in recs), ["Covered", "Sparse Override"])
+        self.assertEqual([(c.song.title, c.num_ready_parts, c.num_parts) for c in stats.skipped_songs], [("Sparse", 1, 4)])
+        self.assertEqual(stats.num_solved, 3)
+
+    def test_every_song_is_solved_by_default(self):
+        _, recs, _, stats = get_gig_part_assignments_with_stats(self.gig, self.overrides)
+
+        self.assertEqual(sorted(gpa.song.title for gpa in recs), ["Covered", "Sparse", "Sparse Override"])
+        self.assertEqual(stats.skipped_songs, [])
+
+    def test_skipped_songs_are_listed_on_the_page(self):
+        self.client.force_login(User.objects.create_superuser(username="coverage-admin", password="x"))
+
+        with mock.patch.object(SolverConfig, "MIN_READY_PART_COVERAGE", 0.5):
+            response = self.client.get(reverse('band:gig_part_assignments_detail', kwargs={'pk': self.gig.pk}))
+
+        self.assertContains(response, "Not Enough Ready Players (1 song)")
+        self.assertContains(response, "1 / 4")
+
+
+class RankedRecommendationsTestCase(SimpleTestCase):
+    def setUp(self):
+        self.problem = make_synthetic_problem(BandSpec(num_songs=40, num_members=10, num_instruments=3, seed=8))
+        for song in self.problem.songs[:3]:
+            song.in_setlist = True
+
+    def _solve(self, mode: str, trail=None):
+        with mock.patch.object(SolverConfig, "RECOMMENDATION_MODE", mode), \
+                mock.patch.object(SolverConfig, "RECOMMENDATION_TOP_K", 5), \
+                mock.patch.object(SolverConfig, "RECOMMENDATION_EXECUTOR", "thread"):
+            return solve_gig_problem(self.problem, trail)
+
+    def _top(self, solution, k):
+        recs = [(score, i) for i, (song, (selected, score)) in enumerate(zip(self.problem.songs, solution.song_results))
+                if not song.in_setlist and selected is not None]
+        return sorted(recs, reverse=True)[:k]
+
+    def test_top_recommendations_are_exact(self):
+        exact = self._solve("pool")
+        ranked = self._solve("ranked")
+
+        self.assertEqual(self._top(ranked, 5), self._top(exact, 5))
+        for i in (i for _, i in self._top(ranked, 5)):
+            self.assertFalse(ranked.is_estimated(i))
+            self.assertEqual(ranked.song_results[i][0].tolist(), exact.song_results[i][0].tolist())
+        self.assertEqual([(x.tolist(), score) for x, score in ranked.song_results[:3]],
+                         [(x.tolist(), score) for x, score in exact.song_results[:3]])
+
+    def test_estimates_bound_the_exact_scores(self):
+        exact = self._solve("pool")
+        ranked = self._solve("ranked")
+
+        estimated = [i for i in range(len(self.problem.songs)) if ranked.is_estimated(i)]
+        self.assertGreater(len(estimated), 0)
+        fifth_best = self._top(ranked, 5)[-1][0]
+        for i in estimated:
+            self.assertEqual(ranked.song_stats[i].method, "bound")
+            self.assertGreaterEqual(ranked.song_results[i][1], exact.song_results[i][1] - 1e-9)
+            self.assertLessEqual(ranked.song_results[i][1], fifth_best)
+
+    def test_trail_reuses_only_exact_songs(self):
+        with mock.patch.object(SolverConfig, "RECOMMENDATION_MODE", "ranked"), \
+                mock.patch.object(SolverConfig, "RECOMMENDATION_TOP_K", 5):
+            first = solve_gig_problem(self.problem)
+            trail = gig_part_assignment.SolutionTrail(gig_part_assignment._config_key(), self.problem, first)
+            second = solve_gig_problem(self.problem, trail)
+
+        self.assertEqual([(x.tolist(), score) for x, score in second.song_results],
+                         [(x.tolist(), score) for x, score in first.song_results])
+        for i, stats in enumerate(second.song_stats):
+            self.assertEqual(stats.method == "reused", not first.is_estimated(i))
+
+
+class GigPrecomputeTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lead = Instrument.objects.create(name="Lead", order=0)
+        cls.gig = Gig.objects.create(
+            name="Precompute Gig",
+            start_datetime=timezone.now() + timedelta(days=1),
+            end_datetime=timezone.now() + timedelta(days=1, hours=2),
+        )
+        cls.past_gig = Gig.objects.create(
+            name="Past Gig",
+            start_datetime=timezone.now() - timedelta(days=1),
+            end_datetime=timezone.now() - timedelta(days=1) + timedelta(hours=2),
+        )
+        GigInstrument.objects.create(gig=cls.gig, instrument=cls.lead, gig_quantity=1)
+        cls.member = User.objects.create_user(username="precompute", first_name="Pre").bandmember
+        song = Song.objects.create(title="Precomputed Song", in_gig_rotation=True)
+        cls.part_assignment = PartAssignment.objects.create(member=cls.member, song_part=SongPart.objects.create(song=song, name="Melody"),
+                                                            instrument=cls.lead)
+
+    def setUp(self):
+        solution_cache.clear()
+
+    @override_settings(GIG_PRECOMPUTE=True)
+    def test_changes_schedule_their_gig_after_commit(self):
+        with mock.patch.object(precomputer, "schedule") as schedule, self.captureOnCommitCallbacks(execute=True):
+            GigAttendance.objects.create(gig=self.gig, member=self.member, status=GigAttendance.AVAILABLE)
+            self.assertFalse(schedule.called)
+
+        schedule.assert_called_once_with(self.gig.id)
+
+    @override_settings(GIG_PRECOMPUTE=True)
+    def test_availability_form_schedules_its_gig(self):
+        self.client.force_login(User.objects.create_superuser(username="availability-admin", password="x"))
+        data = {'form-TOTAL_FORMS': 1, 'form-INITIAL_FORMS': 1, 'form-0-member_id': self.member.pk,
+                'form-0-status': GigAttendance.AVAILABLE}
+        with mock.patch.object(precomputer, "schedule") as schedule, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('band:gig_availability_update', kwargs={'gig_id': self.gig.pk}), data)
+
+        self.assertRedirects(response, reverse('band:gig_detail', kwargs={'pk': self.gig.pk}), fetch_redirect_response=False)
+        self.assertTrue(GigAttendance.objects.filter(gig=self.gig, member=self.member).exists())
+        schedule.assert_called_once_with(self.gig.id)
+
+    @override_settings(GIG_PRECOMPUTE=True)
+    def test_part_assignment_change_schedules_only_upcoming_gigs(self):
+        with mock.patch.object(GigPrecomputer, "schedule") as schedule, self.captureOnCommitCallbacks(execute=True):
+            self.part_assignment.performance_readiness = PerformanceReadiness.BACKUP
+            self.part_assignment.save()
+
+        schedule.assert_called_once_with(self.gig.id)
+
+    def test_nothing_is_scheduled_when_disabled(self):
+        with mock.patch.object(precomputer, "schedule") as schedule, self.captureOnCommitCallbacks(execute=True):
+            GigAttendance.objects.create(gig=self.gig, member=self.member, status=GigAttendance.AVAILABLE)
+
+        self.assertFalse(schedule.called)
+
+    def test_a_queued_gig_is_submitted_once(self):
+        background = GigPrecomputer()
+        background._executor = mock.Mock()
+
+        background.schedule(self.gig.id)
+        background.schedule(self.gig.id)
+
+        self.assertEqual(background._executor.submit.call_count, 1)
+        self.assertEqual(background._queued, {self.gig.id})
+
+    def test_compute_warms_the_solution_cache(self):
+        GigAttendance.objects.create(gig=self.gig, member=self.member, status=GigAttendance.AVAILABLE)
+        background = GigPrecomputer()
+
+        _, recs, _, _ = background.compute(self.gig.id)
+        self.assertEqual([gpa.song.title for gpa in recs], ["Precomputed Song"])
+
+        _, _, _, stats = get_gig_part_assignments_with_stats(self.gig, [])
+        self.assertTrue(stats.cache_hit)
+        self.assertIsNone(background.compute(self.past_gig.id))
+
+    @override_settings(GIG_PRECOMPUTE=True)
+    def test_view_shows_an_edit_while_its_recompute_is_queued(self):
+        GigAttendance.objects.create(gig=self.gig, member=self.member, status=GigAttendance.AVAILABLE)
+        self.client.force_login(User.objects.create_superuser(username="precompute-admin", password="x"))
+        url = reverse('band:gig_part_assignments_detail', kwargs={'pk': self.gig.pk})
+        GigPrecomputer().compute(self.gig.id)
+        self.addCleanup(precomputer._queued.clear)
+
+        with mock.patch.object(precomputer, "_executor", mock.Mock()), self.captureOnCommitCallbacks(execute=True):
+            GigSetlistEntry.objects.create(gig=self.gig, song=self.part_assignment.song_part.song)
+        response = self.client.get(url)
+
+        self.assertEqual([gpa.song.title for gpa in response.context["gig_part_assignments_setlist"]], ["Precomputed Song"])
+        self.assertFalse(response.context["stale"])
+
+    def test_warm_up_command_solves_upcoming_gigs(self):
+        out = StringIO()
+        call_command("precompute_gig_assignments", stdout=out)
+
+        self.assertIn(f"gig {self.gig.id}: 0 setlist songs", out.getvalue())
+        self.assertNotIn(f"gig {self.past_gig.id}:", out.getvalue())
+        self.assertIn("1 gig solved", out.getvalue())
+
+
+class SolverConcurrencyTestCase(SimpleTestCase):
+    def setUp(self):
+        solution_cache.clear()
+        self.problem = make_synthetic_problem(BandSpec(num_songs=10, num_members=6, num_instruments=2, seed=9))
+
+    def test_concurrent_requests_share_one_solve(self):
+        started, release = threading.Event(), threading.Event()
+        real_solve = gig_part_assignment.iter_solve_gig_problem
+        calls = []
+
+        def slow_solve(*args, **kwargs):
+            calls.append(args)
+            started.set()
+            release.wait(10)
+            return (yield from real_solve(*args, **kwargs))
+
+        with mock.patch.object(gig_part_assignment, "iter_solve_gig_problem", slow_solve), ThreadPoolExecutor(2) as pool:
+            leader = pool.submit(gig_part_assignment.get_gig_solution, self.problem)
+            started.wait(10)
+            follower = pool.submit(gig_part_assignment.get_gig_solution, self.problem)
+            release.set()
+            (leader_solution, leader_hit), (follower_solution, follower_hit) = leader.result(), follower.result()
+
+        self.assertEqual(len(calls), 1)
+        self.assertIs(follower_solution, leader_solution)
+        self.assertFalse(leader_hit)
+        self.assertTrue(follower_hit)
+
+    def test_busy_solver_raises_only_when_stale_results_are_allowed(self):
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        with mock.patch.object(gig_part_assignment, "_solve_slots", slots):
+            with self.assertRaises(gig_part_assignment.SolverBusy):
+                gig_part_assignment.get_gig_solution(self.problem, allow_stale=True)
+            slots.release()
+            _, cache_hit = gig_part_assignment.get_gig_solution(self.problem, allow_stale=True)
+
+        self.assertFalse(cache_hit)
+        self.assertEqual(gig_part_assignment._in_flight, {})
+
+    def test_busy_leader_hands_the_solve_to_a_blocking_follower(self):
+        checking, go = threading.Event(), threading.Event()
+
+        class GatedSlots(threading.BoundedSemaphore):
+            def acquire(self, blocking=True, timeout=None):
+                if not blocking:
+                    checking.set()
+                    go.wait(10)
+                return super().acquire(blocking, timeout)
+
+        slots = GatedSlots(1)
+        slots.acquire()
+        with mock.patch.object(gig_part_assignment, "_solve_slots", slots), ThreadPoolExecutor(2) as pool:
+            leader = pool.submit(gig_part_assignment.get_gig_solution, self.problem, allow_stale=True)
+            checking.wait(10)
+            follower = pool.submit(gig_part_assignment.get_gig_solution, self.problem)
+            while not follower.running():
+                time.sleep(0.01)
+            time.sleep(0.05)
+            go.set()
+            with self.assertRaises(gig_part_assignment.SolverBusy):
+                leader.result(10)
+            slots.release()
+            solution, cache_hit = follower.result(10)
+
+        self.assertFalse(cache_hit)
+        self.assertEqual(len(solution.song_results), len(self.problem.songs))
+        self.assertEqual(gig_part_assignment._in_flight, {})
+
+    def test_stale_requests_share_the_solve_in_progress(self):
+        started, release = threading.Event(), threading.Event()
+        real_solve = gig_part_assignment.iter_solve_gig_problem
+        calls = []
+
+        def slow_solve(*args, **kwargs):
+            calls.append(args)
+            started.set()
+            release.wait(10)
+            return (yield from real_solve(*args, **kwargs))
+
+        with mock.patch.object(gig_part_assignment, "iter_solve_gig_problem", slow_solve), ThreadPoolExecutor(2) as pool:
+            leader = pool.submit(gig_part_assignment.get_gig_solution, self.problem, allow_stale=True)
+            started.wait(10)
+            follower = pool.submit(gig_part_assignment.get_gig_solution, self.problem, allow_stale=True)
+            while not follower.running():
+                time.sleep(0.01)
+            release.set()
+            (leader_solution, leader_hit), (follower_solution, follower_hit) = leader.result(10), follower.result(10)
+
+        self.assertEqual(len(calls), 1)
+        self.assertIs(follower_solution, leader_solution)
+        self.assertEqual(len(leader_solution.song_results), len(self.problem.songs))
+        self.assertFalse(leader_hit)
+        self.assertTrue(follower_hit)
+        self.assertEqual(gig_part_assignment._in_flight, {})
+
+    def test_abandoned_streamed_solve_is_taken_over(self):
+        solving = gig_part_assignment.iter_gig_solution(self.problem)
+        next(solving)
+        with ThreadPoolExecutor(1) as pool:
+            follower = pool.submit(gig_part_assignment.get_gig_solution, self.problem)
+            while not follower.running():
+                time.sleep(0.01)
+            solving.close()
+            solution, cache_hit = follower.result(10)
+
+        self.assertFalse(cache_hit)
+        self.assertEqual(len(solution.song_results), len(self.problem.songs))
+        self.assertEqual(gig_part_assignment._in_flight, {})
+
+
+class StaleResultsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lead = Instrument.objects.create(name="Lead", order=0)
+        cls.gig = Gig.objects.create(
+            name="Busy Gig",
+            start_datetime=timezone.now(),
+            end_datetime=timezone.now() + timedelta(hours=2),
+        )
+        GigInstrument.objects.create(gig=cls.gig, instrument=cls.lead, gig_quantity=2)
+        cls.members = [User.objects.create_user(username=f"busy{i}", first_name=f"Busy{i}").bandmember for i in range(2)]
+        part = SongPart.objects.create(song=Song.objects.create(title="Busy Song", in_gig_rotation=True), name="Melody")
+        for member in cls.members:
+            PartAssignment.objects.create(member=member, song_part=part, instrument=cls.lead)
+        GigAttendance.objects.create(gig=cls.gig, member=cls.members[0], status=GigAttendance.AVAILABLE)
+
+    def setUp(self):
+        solution_cache.clear()
+
+    def test_busy_solver_serves_the_last_results_marked_stale(self):
+        _, recs, _, _ = get_gig_part_assignments_with_stats(self.gig, [])
+        GigAttendance.objects.create(gig=self.gig, member=self.members[1], status=GigAttendance.AVAILABLE)
+        self.client.force_login(User.objects.create_superuser(username="busy-admin", password="x"))
+
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        with mock.patch.object(gig_part_assignment, "_solve_slots", slots):
+            _, stale_recs, _, stats = get_gig_part_assignments_with_stats(self.gig, [], allow_stale=True)
+            response = self.client.get(reverse('band:gig_part_assignments_detail', kwargs={'pk': self.gig.pk}))
+
+        self.assertTrue(stats.stale)
+        self.assertIs(stale_recs, recs)
+        self.assertEqual(len(stale_recs[0].part_assignments), 1)
+        self.assertContains(response, "Out of date:")
+
+        _, fresh_recs, _, stats = get_gig_part_assignments_with_stats(self.gig, [], allow_stale=True)
+        self.assertFalse(stats.stale)
+        self.assertEqual(len(fresh_recs[0].part_assignments), 2)
+
+
+class StreamedPartAssignmentsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lead = Instrument.objects.create(name="Lead", order=0)
+        cls.gig = Gig.objects.create(
+            name="Streamed Gig",
+            start_datetime=timezone.now(),
+            end_datetime=timezone.now() + timedelta(hours=2),
+        )
+        GigInstrument.objects.create(gig=cls.gig, instrument=cls.lead, gig_quantity=2)
+        members = [User.objects.create_user(username=f"stream{i}", first_name=f"Stream{i}").bandmember for i in range(2)]
+        for title in ("Opener", "Encore", "Maybe"):
+            part = SongPart.objects.create(song=Song.objects.create(title=title, in_gig_rotation=True), name="Melody")
+            for member in members:
+                PartAssignment.objects.create(member=member, song_part=part, instrument=cls.lead)
+        for member in members:
+            GigAttendance.objects.create(gig=cls.gig, member=member, status=GigAttendance.AVAILABLE)
+        GigSetlistEntry.objects.create(gig=cls.gig, song=Song.objects.get(title="Opener"))
+
+    def setUp(self):
+        solution_cache.clear()
+        self.client.force_login(User.objects.create_superuser(username="stream-admin", password="x"))
+
+    def test_events_arrive_setlist_first_and_end_with_the_usual_results(self):
+        events = list(gig_part_assignment.iter_gig_part_assignments(self.gig, []))
+
+        self.assertEqual([event[0] for event in events], ["setlist", "recommendation", "recommendation", "done"])
+        self.assertEqual([gpa.song.title for gpa in events[0][1]], ["Opener"])
+        self.assertEqual({event[1].song.title for event in events[1:3]}, {"Encore", "Maybe"})
+        setlist, recs, _, _ = events[-1][1]
+        expected_setlist, expected_recs, _, _ = get_gig_part_assignments_with_stats(self.gig, [])
+        self.assertEqual([gpa.song for gpa in setlist], [gpa.song for gpa in expected_setlist])
+        self.assertEqual([gpa.song for gpa in recs], [gpa.song for gpa in expected_recs])
+
+    def test_streamed_page_has_every_section(self):
+        url = reverse('band:gig_part_assignments_detail', kwargs={'pk': self.gig.pk})
+        response = self.client.get(url, {'stream': 1})
+
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content).decode()
+        self.assertNotIn("<!-- stream -->", content)
+        sections = ["Part Assignment Overrides", "Setlist Songs", "Opener", "Song Recommendations", "Encore", "Maybe",
+                    "Number of Songs per Person", "Options and Settings", "toggleUnutilizedRows"]
+        positions = [content.index(section) for section in sections]
+        self.assertEqual(positions[:4], sorted(positions[:4]))
+        self.assertLess(max(positions[4:6]), positions[6])
+        self.assertEqual(positions[6:], sorted(positions[6:]))
+        self.assertIn('data-score="', content)
+        self.assertEqual(content.count("Add to Setlist"), 2)
+
+
+class SongDetailTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        lead = Instrument.objects.create(name="Lead", order=0)
+        cls.song = Song.objects.create(title="Detail Song")
+        cls.melody = SongPart.objects.create(song=cls.song, name="Melody")
+        cls.harmony = SongPart.objects.create(song=cls.song, name="Harmony")
+        other_part = SongPart.objects.create(song=Song.objects.create(title="Other Song"), name="Melody")
+        cls.player, cls.other_player, cls.missing = [
+            User.objects.create_user(username=f"detail{i}", first_name=f"Detail{i}").bandmember for i in range(3)
+        ]
+        User.objects.create_user(username="detail-inactive", is_active=False)
+        PartAssignment.objects.create(member=cls.player, song_part=cls.melody, instrument=lead)
+        PartAssignment.objects.create(member=cls.other_player, song_part=cls.melody, instrument=lead)
+        PartAssignment.objects.create(member=cls.missing, song_part=other_part, instrument=lead)
+
+    def test_missing_parts_and_members(self):
+        response = self.client.get(reverse('band:song_detail', kwargs={'pk': self.song.pk}))
+
+        self.assertEqual(list(response.context['missing_parts']), [self.harmony])
+        self.assertEqual(list(response.context['missing_members']), [self.missing])
+
+
+class MemberSongCoverageTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lead = Instrument.objects.create(name="Lead", order=0)
+        cls.first, cls.second = [User.objects.create_user(username=f"coverage{i}", first_name=f"Coverage{i}").bandmember
+                                 for i in range(2)]
+        cls.song = Song.objects.create(title="Covered Song")
+        cls.other_song = Song.objects.create(title="Other Song")
+        cls.melody = SongPart.objects.create(song=cls.song, name="Melody")
+        cls.bass = SongPart.objects.create(song=cls.song, name="Bass")
+
+    def _counts(self) -> dict:
+        return {(row.member, row.song): row.num_assignments for row in MemberSongCoverage.objects.all()}
+
+    def _assert_rebuild_agrees(self):
+        counts = self._counts()
+        MemberSongCoverage.objects.update(num_assignments=0)
+        call_command("rebuild_member_song_coverage", stdout=StringIO())
+        self.assertEqual(self._counts(), counts)
+
+    def test_new_members_and_songs_get_rows(self):
+        self.assertEqual(self._counts(), {(m, s): 0 for m in (self.first, self.second) for s in (self.song, self.other_song)})
+        third = User.objects.create_user(username="coverage2").bandmember
+        song = Song.objects.create(title="New Song")
+        self.assertEqual(MemberSongCoverage.objects.filter(member=third).count(), 3)
+        self.assertEqual(MemberSongCoverage.objects.filter(song=song).count(), 3)
+
+    def test_assignment_changes_are_counted(self):
+        assignment = PartAssignment.objects.create(member=self.first, song_part=self.melody, instrument=self.lead)
+        PartAssignment.objects.create(member=self.first, song_part=self.bass, instrument=self.lead)
+        self.assertEqual(self._counts()[self.first, self.song], 2)
+        self._assert_rebuild_agrees()
+
+        assignment.member = self.second
+        assignment.save()
+        self.assertEqual(self._counts()[self.first, self.song], 1)
+        self.assertEqual(self._counts()[self.second, self.song], 1)
+
+        self.bass.song = self.other_song
+        self.bass.save()
+        self.assertEqual(self._counts()[self.first, self.song], 0)
+        self.assertEqual(self._counts()[self.first, self.other_song], 1)
+        self._assert_rebuild_agrees()
+
+        assignment.delete()
+        self.assertEqual(self._counts()[self.second, self.song], 0)
+        self.other_song.delete()
+        self.assertEqual(set(self._counts()), {(self.first, self.song), (self.second, self.song)})
+        self._assert_rebuild_agrees()
+
+    def test_missing_lists_read_the_zero_rows(self):
+        PartAssignment.objects.create(member=self.first, song_part=self.melody, instrument=self.lead)
+        User.objects.create_user(username="coverage-inactive", is_active=False)
+
+        self.assertEqual(list(get_missing_songs_for_member(self.first)), [self.other_song])
+        self.assertEqual(get_missing_person_songs(), [
+            ("Coverage1", "Covered Song"),
+            ("Coverage0", "Other Song"),
+            ("Coverage1", "Other Song"),
+        ])
+
+
+class PartAssignmentListTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lead = Instrument.objects.create(name="Lead", order=0)
+        cls.bass = Instrument.objects.create(name="Bass", order=1)
+        cls.members = [User.objects.create_user(username=f"list{i}", first_name=f"List{i}").bandmember for i in range(3)]
+        inactive = User.objects.create_user(username="list-inactive", first_name="Inactive", is_active=False).bandmember
+        for k, title in enumerate(["Alpha", "Bravo", "Charlie", "Delta"]):
+            song = Song.objects.create(title=title)
+            if title == "Bravo":
+                continue
+            for part_name, instrument in [("Melody", cls.lead), ("Bass", cls.bass)]:
+                part = SongPart.objects.create(song=song, name=part_name)
+                for i, member in enumerate(cls.members + [inactive]):
+                    if (i + k) % 3:
+                        PartAssignment.objects.create(
+                            member=member, song_part=part, instrument=instrument,
+                            performance_readiness=PerformanceReadiness.BACKUP if i == 1 else PerformanceReadiness.READY)
+
+    def _pages(self, page_size: int, **params) -> list[list]:
+        url = reverse('band:part_assignment_list')
+        pages = []
+        with mock.patch.object(PartAssignmentListView, "page_size", page_size):
+            query = params
+            while True:
+                response = self.client.get(url, query)
+                pages.append(response.context['rows'])
+                if 'next_page_query' not in response.context:
+                    return pages
+                query = QueryDict(response.context['next_page_query'])
+
+    @staticmethod
+    def _keys(rows: list) -> list:
+        return [(part_assignment.pk if part_assignment else None, member, song) for part_assignment, member, song in rows]
+
+    def test_pages_cover_every_row_once_in_order(self):
+        [everything] = self._pages(1000)
+        pages = self._pages(2)
+
+        self.assertTrue(all(sum(pa is not None for pa, _, _ in page) <= 2 for page in pages))
+        self.assertEqual(self._keys([row for page in pages for row in page]), self._keys(everything))
+        expected = list(PartAssignment.objects.filter(member__user__is_active=True).order_by(*PartAssignmentListView.ordering))
+        self.assertEqual([pa for pa, _, _ in everything if pa is not None], expected)
+        self.assertEqual([(member, song) for pa, member, song in everything if pa is None], get_missing_person_songs())
+        self.assertIn(("List0", "Bravo"), [(member, song) for _, member, song in everything])
+
+    def test_filters(self):
+        member = self.members[0]
+        rows = [row for page in self._pages(2, member=member.pk) for row in page]
+        self.assertTrue(rows)
+        self.assertTrue(all(pa.member == member for pa, _, _ in rows if pa is not None))
+        self.assertTrue(all(missing == "List0" for pa, missing, _ in rows if pa is None))
+
+        rows = [row for page in self._pages(2, readiness=PerformanceReadiness.BACKUP, instrument=self.bass.pk) for row in page]
+        self.assertTrue(rows)
+        self.assertTrue(all(pa is not None and pa.is_backup() and pa.instrument == self.bass for pa, _, _ in rows))
+
+    def test_missing_members_stay_with_their_song_whatever_the_title_case(self):
+        for title in ["apple", "Banana"]:
+            part = SongPart.objects.create(song=Song.objects.create(title=title), name="Melody")
+            PartAssignment.objects.create(member=self.members[0], song_part=part, instrument=self.lead)
+        [everything] = self._pages(1000)
+        pages = self._pages(1)
+
+        self.assertEqual(self._keys([row for page in pages for row in page]), self._keys(everything))
+        for title in ["apple", "Banana"]:
+            indexes = [i for i, (_, _, song) in enumerate(everything) if song == title]
+            self.assertEqual(indexes, list(range(indexes[0], indexes[0] + 3)))
+            self.assertEqual([member for _, member, _ in everything[indexes[0]:indexes[-1] + 1]], [None, "List1", "List2"])
+
+    def test_bad_cursor_starts_over(self):
+        response = self.client.get(reverse('band:part_assignment_list'), {'after': 'tampered'})
+        [first_page] = self._pages(1000)
+        self.assertEqual(self._keys(response.context['rows']), self._keys(first_page))
+
+
+class ViewQueryBudgetTestCase(TestCase):
+    """Every page of band/urls.py, measured at two data sizes: a page must not run more queries than its budget,
+    and must not run more queries on the bigger data set."""
+
+    # maximum number of queries per page, including the session and user lookups of the logged-in request
+    BUDGETS = {
+        "login": 0,
+        "logout": 4,
+        "index": 0,
+        "profile_detail": 4,
+        "profile_update": 3,
+        "password_change": 2,
+        "password_change_done": 2,
+        "member_list": 1,
+        "member_detail": 5,
+        "member_part_assignment_create": 4,
+        "member_part_assignment_update": 10,
+        "song_list": 1,
+        "song_create": 0,
+        "song_detail": 5,
+        "song_update": 1,
+        "song_part_assignment_create": 4,
+        "song_part_assignment_update": 10,
+        "part_assignment_list": 6,
+        "part_assignment_create": 3,
+        "part_assignment_update": 9,
+        "gig_list": 2,
+        "gig_create": 1,
+        "gig_detail": 9,
+        "gig_update": 5,
+        "gig_availability_update": 3,
+        "gig_part_assignments_detail": 9,
+        "gig_part_assignment_override_create": 4,
+        "gig_part_assignment_override_delete": 3,
+        "gig_part_assignment_print": 9,
+        "gig_part_assignment_by_member": 9,
+        "gig_setlist_update": 5,
+        "gig_setlist_add_song": 2,
+        "instrument_list": 1,
+        "health": 1,
+        "api_instruments": 1,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lead = Instrument.objects.create(name="Lead", order=0)
+        cls.bass = Instrument.objects.create(name="Bass", order=1)
+        cls.gig = Gig.objects.create(
+            name="Budget Gig",
+            start_datetime=timezone.now() + timedelta(days=1),
+            end_datetime=timezone.now() + timedelta(days=1, hours=2),
+        )
+        cls.gi_lead = GigInstrument.objects.create(gig=cls.gig, instrument=cls.lead, gig_quantity=2)
+        GigInstrument.objects.create(gig=cls.gig, instrument=cls.bass, gig_quantity=1)
+        cls.user = User.objects.create_superuser(username="budget-admin", password="x", first_name="Budget", last_name="Admin")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.members, self.songs = [], []
+
+    def _seed(self, count: int):
+        """Add count members, songs and gigs, with the assignments, attendance, setlist entries and overrides
+        between them."""
+        start = len(self.members)
+        for i in range(start, start + count):
+            member = User.objects.create_user(username=f"budget{i}", first_name=f"Budget{i}", last_name="Member").bandmember
+            self.members.append(member)
+            GigAttendance.objects.create(gig=self.gig, member=member,
+                                         status=list(GigAttendance.AVAILABILITY_CHOICES)[i % len(GigAttendance.AVAILABILITY_CHOICES)])
+            song = Song.objects.create(title=f"Budget Song {i:03d}", in_gig_rotation=True, duration=timedelta(minutes=3))
+            SongPart.objects.create(song=song, name="Melody")
+            SongPart.objects.create(song=song, name="Bass")
+            self.songs.append(song)
+            Gig.objects.create(name=f"Budget Gig {i}", start_datetime=timezone.now() - timedelta(days=i + 1),
+                               end_datetime=timezone.now() - timedelta(days=i + 1) + timedelta(hours=2))
+        PartAssignment.objects.bulk_create([
+            PartAssignment(member=member, song_part=part, instrument=self.lead if part.name == "Melody" else self.bass,
+                           performance_readiness=PerformanceReadiness.READY if (i + j) % 4 else PerformanceReadiness.BACKUP)
+            for i, member in enumerate(self.members) for j, song in enumerate(self.songs) for part in song.parts.all()
+            if (i + j) % 3 and (i >= start or j >= start)
+        ])
+        MemberSongCoverage.refresh()
+        for song in self.songs[start::2]:
+            GigSetlistEntry.objects.create(gig=self.gig, song=song)
+        GigSetlistEntry.objects.create(gig=self.gig, break_duration=timedelta(minutes=10))
+        GigPartAssignmentOverride.objects.create(member=self.members[-1], song_part=self.songs[-1].parts.first(),
+                                                 gig_instrument=self.gi_lead, override_type=OverrideType.NOT_PLAYING)
+
+    def _requests(self):
+        """(name, method, path) of every page, for the first member, song, part assignment and gig."""
+        member, song, gig = self.members[0], self.songs[0], self.gig
+        part_assignment = PartAssignment.objects.filter(member=member).order_by("id").first()
+        song_part_assignment = PartAssignment.objects.filter(song_part__song=song).order_by("id").first()
+        override = GigPartAssignmentOverride.objects.order_by("id").first()
+        return [
+            ("login", "get", reverse("band:login")),
+            ("logout", "post", reverse("band:logout")),
+            ("index", "get", reverse("band:index")),
+            ("profile_detail", "get", reverse("band:profile_detail")),
+            ("profile_update", "get", reverse("band:profile_update")),
+            ("password_change", "get", reverse("band:password_change")),
+            ("password_change_done", "get", reverse("band:password_change_done")),
+            ("member_list", "get", reverse("band:member_list")),
+            ("member_detail", "get", reverse("band:member_detail", kwargs={"pk": member.pk})),
+            ("member_part_assignment_create", "get", reverse("band:member_part_assignment_create", kwargs={"member_id": member.pk})),
+            ("member_part_assignment_update", "get", reverse("band:member_part_assignment_update",
+                                                             kwargs={"member_id": member.pk, "pk": part_assignment.pk})),
+            ("song_list", "get", reverse("band:song_list")),
+            ("song_create", "get", reverse("band:song_create")),
+            ("song_detail", "get", reverse("band:song_detail", kwargs={"pk": song.pk})),
+            ("song_update", "get", reverse("band:song_update", kwargs={"pk": song.pk})),
+            ("song_part_assignment_create", "get", reverse("band:song_part_assignment_create", kwargs={"song_id": song.pk})),
+            ("song_part_assignment_update", "get", reverse("band:song_part_assignment_update",
+                                                           kwargs={"song_id": song.pk, "pk": song_part_assignment.pk})),
+            ("part_assignment_list", "get", reverse("band:part_assignment_list")),
+            ("part_assignment_create", "get", reverse("band:part_assignment_create")),
+            ("part_assignment_update", "get", reverse("band:part_assignment_update", kwargs={"pk": part_assignment.pk})),
+            ("gig_list", "get", reverse("band:gig_list")),
+            ("gig_create", "get", reverse("band:gig_create")),
+            ("gig_detail", "get", reverse("band:gig_detail", kwargs={"pk": gig.pk})),
+            ("gig_update", "get", reverse("band:gig_update", kwargs={"pk": gig.pk})),
+            ("gig_availability_update", "get", reverse("band:gig_availability_update", kwargs={"gig_id": gig.pk})),
+            ("gig_part_assignments_detail", "get", reverse("band:gig_part_assignments_detail", kwargs={"pk": gig.pk})),
+            ("gig_part_assignment_override_create", "get", reverse("band:gig_part_assignment_override_create", kwargs={"pk": gig.pk})),
+            ("gig_part_assignment_override_delete", "post", reverse("band:gig_part_assignment_override_delete",
+                                                                    kwargs={"pk": gig.pk, "override_id": override.pk})),
+            ("gig_part_assignment_print", "get", reverse("band:gig_part_assignment_print", kwargs={"pk": gig.pk}) + "?order=setlist"),
+            ("gig_part_assignment_by_member", "get", reverse("band:gig_part_assignment_by_member", kwargs={"pk": gig.pk})),
+            ("gig_setlist_update", "get", reverse("band:gig_setlist_update", kwargs={"gig_id": gig.pk})),
+            ("gig_setlist_add_song", "post", reverse("band:gig_setlist_add_song", kwargs={"gig_id": gig.pk, "song_id": song.pk})),
+            ("instrument_list", "get", reverse("band:instrument_list")),
+            ("health", "get", "/health/"),
+            ("api_instruments", "get", reverse("band:api_instruments")),
+        ]
+
+    def _measure(self) -> dict[str, int]:
+        counts = {}
+        for name, method, path in self._requests():
+            solution_cache.clear()
+            self.client.force_login(self.user)
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(self.client, method)(path)
+            self.assertLess(response.status_code, 400, name)
+            counts[name] = len(queries)
+        return counts
+
+    def test_every_page_stays_within_its_query_budget(self):
+        self._seed(3)
+        small = self._measure()
+        self._seed(12)
+        large = self._measure()
+
+        # a new page needs a budget too
+        self.assertLessEqual({pattern.name for pattern in band_urls.urlpatterns if pattern.name}, set(self.BUDGETS))
+        self.assertEqual(set(small), set(self.BUDGETS))
+        for name, budget in self.BUDGETS.items():
+            with self.subTest(name):
+                self.assertLessEqual(small[name], budget)
+                self.assertEqual(large[name], small[name], "query count grows with the data")
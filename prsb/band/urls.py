@@ -11,8 +11,8 @@ from . import views
 
 app_name = "band"
 urlpatterns = [
-    path("accounts/login/", LoginView.as_view(template_name="band/registration/login.html")),
-    path("accounts/logout/", LogoutView.as_view(next_page="login"), name="logout"),
+    path("accounts/login/", LoginView.as_view(template_name="band/registration/login.html"), name="login"),
+    path("accounts/logout/", LogoutView.as_view(next_page=reverse_lazy("band:login")), name="logout"),
 
     path("", views.index, name='index'),
 
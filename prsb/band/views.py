@@ -1,20 +1,27 @@
 from datetime import timedelta
 
-from django.contrib.auth.models import User
-from django.db.models import Exists, OuterRef, Subquery
+from django.conf import settings
+from django.core import signing
+from django.db.models import Exists, OuterRef, Q, Subquery
 from django import forms
-from django.db import connection
+from django.db import connection, transaction
 from django.forms import modelformset_factory, formset_factory, inlineformset_factory
-from django.http import HttpResponseRedirect, JsonResponse
+from django.http import HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.views import generic
 from tinymce.models import HTMLField
 
-from scripts.gig_part_assignment import get_gig_part_assignments, get_max_instrument_usage, GigPartAssignment
+from scripts.gig_part_assignment import get_gig_part_assignments_with_stats, iter_gig_part_assignments, \
+    get_max_instrument_usage, GigPartAssignment, SolverConfig, SETLIST_MODES
+from scripts.gig_part_assignment_cache import solution_cache
+from scripts.gig_part_assignment_precompute import precomputer
 from .models import Song, Gig, GigAttendance, BandMember, PartAssignment, Instrument, SongPart, \
-    GigPartAssignmentOverride, GigInstrument, GigSetlistEntry, OverrideType, PerformanceReadiness
+    GigPartAssignmentOverride, GigInstrument, GigSetlistEntry, OverrideType, PerformanceReadiness, MemberSongCoverage
 
 
 def index(request):
@@ -23,11 +30,11 @@ def index(request):
 
 class MemberListView(generic.ListView):
     def get_queryset(self):
-        return BandMember.objects.filter(user__is_active=True).order_by('user__first_name', 'user__last_name')
+        return BandMember.objects.filter(user__is_active=True).select_related('user').order_by('user__first_name', 'user__last_name')
 
 
 def get_missing_songs_for_member(member: BandMember):
-    return Song.objects.filter(~Exists(PartAssignment.objects.filter(member=member, song_part__song=OuterRef("pk"))))
+    return Song.objects.filter(member_coverage__member=member, member_coverage__num_assignments=0)
 
 
 class MemberDetailView(generic.DetailView):
@@ -40,14 +47,14 @@ class MemberDetailView(generic.DetailView):
 
         context["part_assignments"] = PartAssignment.objects.filter(
             member=current_member
-        ).order_by('song_part__song__title', 'song_part___order', 'instrument__name')
+        ).select_related('song_part__song', 'instrument').order_by('song_part__song__title', 'song_part___order', 'instrument__name')
 
         context["missing_songs"] = get_missing_songs_for_member(current_member)
 
         context["upcoming_gig_attendance"] = GigAttendance.objects.filter(
             member=current_member,
             gig__start_datetime__gte=timezone.now()
-        )
+        ).select_related('gig')
         return context
 
 
@@ -102,15 +109,20 @@ class SongDetailView(generic.DetailView):
 
         song = context['song']
 
-        context["part_assignments"] = part_assignments = PartAssignment.objects.filter(
+        context["part_assignments"] = PartAssignment.objects.filter(
             song_part__song=song
-        ).order_by('song_part___order', 'instrument__name', 'member__user__first_name', 'member__user__last_name')
+        ).select_related('song_part', 'instrument', 'member__user').order_by('song_part___order', 'instrument__name',
+                                                                              'member__user__first_name', 'member__user__last_name')
 
-        all_parts = SongPart.objects.filter(song=song)
-        context['missing_parts'] = [p for p in all_parts if p not in {pa.song_part for pa in part_assignments}]
+        context['missing_parts'] = SongPart.objects.filter(
+            ~Exists(PartAssignment.objects.filter(song_part=OuterRef("pk"))),
+            song=song
+        )
 
-        all_members = BandMember.objects.filter(user__is_active=True)
-        context['missing_members'] = [m for m in all_members if m not in {pa.member for pa in part_assignments}]
+        context['missing_members'] = BandMember.objects.filter(
+            ~Exists(PartAssignment.objects.filter(member=OuterRef("pk"), song_part__song=song)),
+            user__is_active=True
+        ).select_related('user')
 
         return context
 
@@ -135,63 +147,128 @@ class SongCreateView(generic.CreateView):
               'form']
 
 
-def get_missing_person_songs():
-    with connection.cursor() as cursor:
-        query = f"""
-            WITH missing_ids AS (
-                SELECT
-                    b.user_id,
-                    s.title
-                FROM
-                    {BandMember._meta.db_table} b,
-                    {Song._meta.db_table} s
-                WHERE
-                    NOT EXISTS (
-                        SELECT 
-                            1
-                        FROM 
-                            {PartAssignment._meta.db_table} p
-                        INNER JOIN 
-                            {SongPart._meta.db_table} sp
-                        ON
-                            p.song_part_id = sp.id
-                        WHERE
-                            p.member_id = b.user_id
-                            AND sp.song_id = s.id
-                    )
-                )
-                SELECT
-                    u.first_name || ' ' || u.last_name AS name,
-                    m.title
-                FROM
-                    missing_ids m
-                INNER JOIN
-                    {User._meta.db_table} u
-                ON
-                    m.user_id = u.id
-                WHERE
-                    u.is_active
-                ORDER BY
-                    title, name
-        """
-        cursor.execute(query)
-
-        return cursor.fetchall()
+def _missing_coverage(**filters):
+    return MemberSongCoverage.objects.filter(num_assignments=0, member__user__is_active=True, **filters) \
+        .select_related('member__user', 'song').order_by('song__title', 'member__user__first_name', 'member__user__last_name')
+
+
+def get_missing_person_songs(**filters) -> list[tuple[str, str]]:
+    """(member name, song title) of every active member without an assignment on a song, filtered by filters on
+    MemberSongCoverage."""
+    return [(str(coverage.member), coverage.song.title) for coverage in _missing_coverage(**filters)]
+
+
+def _after(ordering: list[str], values: list) -> Q:
+    """The rows that sort after values, for an ordering of ascending fields with a unique last one."""
+    condition = Q(**{f'{ordering[-1]}__gt': values[-1]})
+    for field, value in zip(ordering[-2::-1], values[-2::-1]):
+        condition = Q(**{f'{field}__gt': value}) | Q(**{field: value}) & condition
+    return condition
+
+
+class PartAssignmentFilterForm(forms.Form):
+    song = forms.ModelChoiceField(queryset=Song.objects.all(), required=False)
+    member = forms.ModelChoiceField(queryset=BandMember.objects.filter(user__is_active=True).select_related('user'),
+                                    required=False)
+    instrument = forms.ModelChoiceField(queryset=Instrument.objects.all(), required=False)
+    readiness = forms.ChoiceField(choices=[('', '---------')] + list(PerformanceReadiness.CHOICES.items()), required=False)
 
 
 class PartAssignmentListView(generic.ListView):
+    """Part assignments a page at a time, with the members missing from the songs on each page.
+
+    Pages are seeked to rather than counted through: the after parameter holds the sort key of the last row of the
+    previous page, so a page costs the same however far in it is.
+    """
     model = PartAssignment
+    page_size = 100
+    ordering = ['song_part__song__title', 'song_part___order', 'instrument__name', 'member__user__first_name',
+                'member__user__last_name', 'pk']
+
+    @cached_property
+    def filter_form(self) -> PartAssignmentFilterForm:
+        form = PartAssignmentFilterForm(self.request.GET)
+        # invalid filters are left out of cleaned_data
+        form.is_valid()
+        return form
+
+    @cached_property
+    def after(self) -> list | None:
+        """The sort key of the last row of the previous page, or None on the first page."""
+        try:
+            return signing.loads(self.request.GET['after']) if self.request.GET.get('after') else None
+        except signing.BadSignature:
+            return None
 
     def get_queryset(self):
-        return PartAssignment.objects.filter(member__user__is_active=True).order_by('song_part__song__title',
-                                                                                    'song_part___order',
-                                                                                    'instrument__name',
-                                                                                    'member__user__first_name',
-                                                                                    'member__user__last_name')
+        queryset = PartAssignment.objects.filter(member__user__is_active=True).select_related(
+            'song_part__song', 'instrument', 'member__user')
+
+        filters = self.filter_form.cleaned_data
+        if filters.get('song'):
+            queryset = queryset.filter(song_part__song=filters['song'])
+        if filters.get('member'):
+            queryset = queryset.filter(member=filters['member'])
+        if filters.get('instrument'):
+            queryset = queryset.filter(instrument=filters['instrument'])
+        if filters.get('readiness'):
+            queryset = queryset.filter(performance_readiness=filters['readiness'])
+
+        if self.after is not None:
+            queryset = queryset.filter(_after(self.ordering, self.after))
+        # one more than a page, to tell whether there is a next one
+        return queryset.order_by(*self.ordering)[:self.page_size + 1]
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['missing_person_songs'] = get_missing_person_songs()
+        part_assignments = list(context['object_list'])
+        next_part_assignment = part_assignments[self.page_size] if len(part_assignments) > self.page_size else None
+        has_next = next_part_assignment is not None
+        context['object_list'] = part_assignments = part_assignments[:self.page_size]
+
+        # a song's missing members go on the page its assignments end on, or for a song with none, the page with the
+        # next song's; this page's first row was the one past the end of the previous page
+        filters, after = self.filter_form.cleaned_data, self.after
+        if filters.get('instrument') or filters.get('readiness'):
+            missing = []
+        else:
+            missing_filters = {}
+            if filters.get('song'):
+                missing_filters['song'] = filters['song']
+            if filters.get('member'):
+                missing_filters['member'] = filters['member']
+            if after is not None:
+                continues = part_assignments and part_assignments[0].song_part.song.title == after[0]
+                missing_filters['song__title__gte' if continues else 'song__title__gt'] = after[0]
+            if has_next:
+                last_title = part_assignments[-1].song_part.song.title
+                continues = next_part_assignment.song_part.song.title == last_title
+                missing_filters['song__title__lt' if continues else 'song__title__lte'] = last_title
+            missing = list(_missing_coverage(**missing_filters))
+
+        rows = [(pa, None, pa.song_part.song.title) for pa in part_assignments]
+        if missing:
+            # a song's assignments go before its missing members, with the songs in the database's title order, which
+            # Python's string order need not match
+            song_ids = {pa.song_part.song_id for pa in part_assignments} | {coverage.song_id for coverage in missing}
+            song_order = {song_id: i for i, song_id in enumerate(
+                Song.objects.filter(pk__in=song_ids).order_by('title', 'pk').values_list('pk', flat=True))}
+            keyed = [((song_order[pa.song_part.song_id], 0), row) for pa, row in zip(part_assignments, rows)]
+            keyed += [((song_order[coverage.song_id], 1), (None, str(coverage.member), coverage.song.title))
+                      for coverage in missing]
+            # the sort is stable, keeping each song's rows in database order
+            rows = [row for _, row in sorted(keyed, key=lambda item: item[0])]
+        context['rows'] = rows
+
+        context['filter_form'] = self.filter_form
+        query = self.request.GET.copy()
+        query.pop('after', None)
+        context['first_page_query'] = query.urlencode() if after is not None else None
+        if has_next:
+            last = part_assignments[-1]
+            query['after'] = signing.dumps([last.song_part.song.title, last.song_part._order, last.instrument.name,
+                                            last.member.user.first_name, last.member.user.last_name, last.pk])
+            context['next_page_query'] = query.urlencode()
         return context
 
 
@@ -206,22 +283,22 @@ class PartAssignmentForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
 
         if member_id is not None:
-            self.fields['member'].initial = BandMember.objects.get(pk=member_id)
-            self.fields['member'].queryset = BandMember.objects.filter(pk=member_id)
+            self.fields['member'].initial = BandMember.objects.select_related('user').get(pk=member_id)
+            self.fields['member'].queryset = BandMember.objects.filter(pk=member_id).select_related('user')
             self.fields['member'].disabled = True
 
             self.member_id = member_id
             self.member_name = self.fields['member'].initial.user.get_full_name()
         else:
-            self.fields['member'].queryset = BandMember.objects.filter(user__is_active=True)
+            self.fields['member'].queryset = BandMember.objects.filter(user__is_active=True).select_related('user')
 
         if song_id is not None:
-            self.fields['song_part'].queryset = SongPart.objects.filter(song_id=song_id).order_by('song', '_order')
+            self.fields['song_part'].queryset = SongPart.objects.filter(song_id=song_id).select_related('song').order_by('song', '_order')
 
             self.song_id = song_id
             self.song_name = Song.objects.get(pk=song_id).title
         else:
-            self.fields['song_part'].queryset = SongPart.objects.order_by('song', '_order')
+            self.fields['song_part'].queryset = SongPart.objects.select_related('song').order_by('song', '_order')
 
 
 class PartAssignmentCreateView(generic.CreateView):
@@ -380,7 +457,7 @@ class GigDetailView(generic.DetailView):
         context = super().get_context_data(**kwargs)
         gig = context['object']
 
-        context['setlist'] = set_list = GigSetlistEntry.objects.filter(gig=gig)
+        context['setlist'] = set_list = GigSetlistEntry.objects.filter(gig=gig).select_related('song')
 
         if len(set_list) > 0:
             music_duration = timedelta()
@@ -398,13 +475,13 @@ class GigDetailView(generic.DetailView):
                 context['total_duration'] = total_duration
 
         for availability in GigAttendance.AVAILABILITY_CHOICES:
-            members = gig.gigattendance_set.filter(status=availability)
+            members = gig.gigattendance_set.filter(status=availability).select_related('member__user')
             context[f"{availability}_members"] = sorted(members, key=lambda ga: ga.member.user.get_full_name())
 
         context["missing_members"] = BandMember.objects.filter(
             ~Exists(GigAttendance.objects.filter(member=OuterRef("pk"), gig=gig)),
             user__is_active=True
-        ).order_by('user__first_name', 'user__last_name')
+        ).select_related('user').order_by('user__first_name', 'user__last_name')
 
         return context
 
@@ -448,7 +525,6 @@ class GigAvailabilityForm(forms.Form):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        print(args, kwargs)
 
         if 'initial' not in kwargs:
             return
@@ -467,7 +543,7 @@ class GigAvailabilityUpdateView(generic.View):
     def get(self, request, gig_id):
         gig = get_object_or_404(Gig, id=gig_id)
 
-        existing_gig_attendance = GigAttendance.objects.filter(gig=gig)
+        existing_gig_attendance = GigAttendance.objects.filter(gig=gig).select_related('member__user')
         initial_data = [
             {
                 'attendance_id': ga.id,
@@ -477,7 +553,8 @@ class GigAvailabilityUpdateView(generic.View):
             for ga in existing_gig_attendance
         ]
 
-        missing_members = BandMember.objects.filter(~Exists(GigAttendance.objects.filter(gig=gig, member=OuterRef('pk'))), user__is_active=True)
+        missing_members = BandMember.objects.filter(~Exists(GigAttendance.objects.filter(gig=gig, member=OuterRef('pk'))),
+                                                    user__is_active=True).select_related('user')
         initial_data += [
             {
                 'attendance_id': None,
@@ -512,6 +589,11 @@ class GigAvailabilityUpdateView(generic.View):
             GigAttendance.objects.bulk_create([GigAttendance(gig=gig, member_id=form.cleaned_data['member_id'], status=form.cleaned_data['status']) for form in new_gig_attendance])
             GigAttendance.objects.bulk_update([GigAttendance(id=form.cleaned_data['attendance_id'], status=form.cleaned_data['status']) for form in modified_gig_attendance], ['status'])
             GigAttendance.objects.filter(id__in=[form.cleaned_data['attendance_id'] for form in deleted_gig_attendance]).delete()
+            # bulk_create / bulk_update don't send post_save, so evict the gig's cached assignments and queue their
+            # recompute by hand
+            solution_cache.invalidate(gig.id)
+            if settings.GIG_PRECOMPUTE:
+                transaction.on_commit(lambda: precomputer.schedule(gig.id))
 
             return redirect('band:gig_detail', pk=gig.id)
         else:
@@ -528,7 +610,19 @@ class GigSetlistEntryForm(forms.ModelForm):
 
         self.fields['song'].queryset = Song.objects.filter(in_gig_rotation=True)
 
-GigSetlistEntryFormSet = modelformset_factory(GigSetlistEntry, form=GigSetlistEntryForm, extra=0, can_delete=True, can_delete_extra=True)
+class BaseGigSetlistEntryFormSet(forms.BaseModelFormSet):
+    @cached_property
+    def forms(self):
+        forms = super().forms
+        # every row offers the same songs, so look them up once rather than once per row
+        if forms:
+            song_choices = list(forms[0].fields['song'].choices)
+            for form in forms:
+                form.fields['song'].choices = song_choices
+        return forms
+
+GigSetlistEntryFormSet = modelformset_factory(GigSetlistEntry, form=GigSetlistEntryForm, formset=BaseGigSetlistEntryFormSet,
+                                              extra=0, can_delete=True, can_delete_extra=True)
 
 
 class GigSetlistUpdateView(generic.View):
@@ -571,29 +665,109 @@ class GigSetlistAddSongView(generic.View):
         return HttpResponseRedirect(reverse("band:gig_part_assignments_detail", kwargs={'pk': gig_id}))
 
 
+def _requested_setlist_mode(request) -> str:
+    setlist_mode = request.GET.get('setlist_mode')
+    return setlist_mode if setlist_mode in SETLIST_MODES else SolverConfig.SETLIST_MODE
+
+
+def _setlist_result(requested_mode: str, mode: str, seconds: float, counts) -> dict:
+    return {
+        'requested_mode': requested_mode,
+        'mode': mode,
+        'seconds': seconds,
+        'most_songs': max(counts.values(), default=0),
+        'fewest_songs': min(counts.values(), default=0),
+    }
+
+
 class GigPartAssignmentsDetailView(generic.TemplateView):
+    """With ?stream=1, the page is streamed: the header and overrides go out before anything is solved, then the
+    setlist songs, then each recommendation as soon as it is solved."""
     template_name = 'band/gig_part_assignments.html'
-
-    def get_context_data(self, **kwargs):
+    stream_template_name = 'band/gig_part_assignments_stream.html'
+    # where the stream template leaves room for the streamed sections
+    stream_marker = '<!-- stream -->'
+
+    def get(self, request, *args, **kwargs):
+        if not request.GET.get('stream'):
+            return super().get(request, *args, **kwargs)
+        context = self.get_page_context(**kwargs)
+        # the CSRF cookie has to be set before the body starts
+        get_token(request)
+        return StreamingHttpResponse(self.stream(context))
+
+    def get_page_context(self, **kwargs):
+        """Everything but the assignments."""
         context = super().get_context_data(**kwargs)
-        gig_id = context['pk']
+        context['gig'] = gig = Gig.objects.get(id=context['pk'])
 
-        context['gig'] = gig = Gig.objects.get(id=gig_id)
+        context['part_assignment_overrides'] = GigPartAssignmentOverride.objects.filter(gig_instrument__gig=gig) \
+            .select_related('member__user', 'song_part__song', 'gig_instrument__instrument') \
+            .order_by('song_part__song', 'song_part', 'member')
 
-        context['part_assignment_overrides'] = GigPartAssignmentOverride.objects.filter(gig_instrument__gig=gig).order_by('song_part__song', 'song_part', 'member')
+        context['setlist_mode'] = setlist_mode = _requested_setlist_mode(self.request)
+        context['setlist_modes'] = SETLIST_MODES
+        return context
 
-        context["gig_part_assignments_setlist"], context["gig_part_assignments_recs"], member_song_counts = get_gig_part_assignments(gig, context['part_assignment_overrides'])
+    def get_context_data(self, **kwargs):
+        context = self.get_page_context(**kwargs)
+        gig, setlist_mode = context['gig'], context['setlist_mode']
+
+        # a background run of the same inputs is waited for rather than repeated, and one that already finished
+        # is a cache hit
+        results = get_gig_part_assignments_with_stats(gig, context['part_assignment_overrides'], setlist_mode=setlist_mode,
+                                                      allow_stale=True)
+        context["gig_part_assignments_setlist"], context["gig_part_assignments_recs"], member_song_counts, solver_stats = results
+        context['stale'] = solver_stats.stale
+
+        # show how the global solve compares with the greedy one it replaces
+        context['setlist_results'] = [_setlist_result(setlist_mode, solver_stats.setlist_mode, solver_stats.setlist_seconds,
+                                                      member_song_counts)]
+        if setlist_mode != "greedy" and context["gig_part_assignments_setlist"]:
+            _, _, greedy_counts, greedy_stats = get_gig_part_assignments_with_stats(gig, context['part_assignment_overrides'],
+                                                                                    setlist_mode="greedy", allow_stale=True)
+            context['setlist_results'].append(_setlist_result("greedy", greedy_stats.setlist_mode, greedy_stats.setlist_seconds,
+                                                              greedy_counts))
+
+        self.add_summary_context(context, results)
+        return context
+
+    def add_summary_context(self, context, results):
+        """The context of the sections below the recommendations."""
+        setlist, recs, member_song_counts, solver_stats = results
+        if settings.DEBUG or self.request.GET.get('solver_stats'):
+            context['solver_stats'] = solver_stats
+        context['skipped_songs'] = solver_stats.skipped_songs
         context['member_song_counts'] = sorted([(k, v) for k, v in member_song_counts.items()], key=lambda x: x[1], reverse=True)
 
-        scoped_assignments = (
-            context["gig_part_assignments_setlist"]
-            if context["gig_part_assignments_setlist"]
-            else context["gig_part_assignments_recs"]
-        )
-        gig_instruments = list(GigInstrument.objects.filter(gig=gig).select_related("instrument"))
+        scoped_assignments = setlist if setlist else recs
+        gig_instruments = list(GigInstrument.objects.filter(gig=context['gig']).select_related("instrument"))
         context["max_instrument_usage"] = get_max_instrument_usage(scoped_assignments, gig_instruments)
 
-        return context
+    def stream(self, context):
+        gig, setlist_mode = context['gig'], context['setlist_mode']
+        prefix, recommendations_start, recommendations_end, suffix = \
+            render_to_string(self.stream_template_name, context, self.request).split(self.stream_marker)
+        yield prefix
+
+        events = iter_gig_part_assignments(gig, context['part_assignment_overrides'], setlist_mode, allow_stale=True)
+        for event in events:
+            if event[0] == "setlist":
+                # the greedy comparison would hold up the recommendations, so streamed pages go without it
+                _, context['gig_part_assignments_setlist'], counts, solved_mode, seconds, context['stale'] = event
+                context['setlist_results'] = [_setlist_result(setlist_mode, solved_mode, seconds, counts)]
+                yield render_to_string('band/gig_part_assignments_stale.html', context, self.request)
+                yield render_to_string('band/gig_part_assignments_setlist.html', context, self.request)
+                yield recommendations_start
+            elif event[0] == "recommendation":
+                yield render_to_string('band/gig_part_assignment_song.html', {**context, 'gpa': event[1], 'recommendation': True},
+                                       self.request)
+            else:
+                yield recommendations_end
+                self.add_summary_context(context, event[1])
+                yield render_to_string('band/gig_part_assignments_summary.html', context, self.request)
+
+        yield suffix
 
 
 class GigInstrumentChoiceField(forms.ModelChoiceField):
@@ -619,9 +793,10 @@ class GigPartAssignmentOverrideForm(forms.ModelForm):
         self.fields['member'].queryset = BandMember.objects.filter(Exists(GigAttendance.objects.filter(member=OuterRef("pk"),
                                                                                                        gig_id=self.gig_id,
                                                                                                        status=GigAttendance.AVAILABLE)),
-                                                                   user__is_active=True)
-        self.fields['song_part'].queryset = SongPart.objects.filter(song__in_gig_rotation=True).order_by('song', '_order')
-        self.fields['gig_instrument'].queryset = GigInstrument.objects.filter(gig_id=self.gig_id)
+                                                                   user__is_active=True).select_related('user')
+        self.fields['song_part'].queryset = SongPart.objects.filter(song__in_gig_rotation=True).select_related('song') \
+            .order_by('song', '_order')
+        self.fields['gig_instrument'].queryset = GigInstrument.objects.filter(gig_id=self.gig_id).select_related('instrument')
         self.fields['performance_readiness'].required = False
 
     def clean(self):
@@ -674,9 +849,9 @@ class GigPartAssignmentPrintView(generic.TemplateView):
             break_duration__isnull=True,
             id__in=Subquery(subquery)
         )
-        ordering = {entry.song: entry._order for entry in first_entries}
+        ordering = {entry.song_id: entry._order for entry in first_entries}
 
-        return sorted(assignments, key=lambda e: ordering.get(e.song))
+        return sorted(assignments, key=lambda e: ordering.get(e.song.id))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -685,9 +860,12 @@ class GigPartAssignmentPrintView(generic.TemplateView):
         context['gig'] = gig = Gig.objects.get(id=gig_id)
 
         overrides = GigPartAssignmentOverride.objects.filter(
-            gig_instrument__gig=gig).order_by('song_part__song', 'song_part', 'member')
+            gig_instrument__gig=gig).select_related('member__user', 'song_part__song', 'gig_instrument__instrument') \
+            .order_by('song_part__song', 'song_part', 'member')
 
-        assignments, _, _ = get_gig_part_assignments(gig, overrides)
+        assignments, _, _, stats = get_gig_part_assignments_with_stats(gig, overrides, _requested_setlist_mode(self.request),
+                                                                       allow_stale=True)
+        context['stale'] = stats.stale
 
         ordering_method = self.request.GET.get('order', 'alphabetic')
         if ordering_method == 'setlist':
@@ -709,9 +887,11 @@ class GigPartAssignmentByMemberView(generic.TemplateView):
 
         overrides = GigPartAssignmentOverride.objects.filter(
             gig_instrument__gig=gig
-        ).order_by('song_part__song', 'song_part', 'member')
+        ).select_related('member__user', 'song_part__song', 'gig_instrument__instrument').order_by('song_part__song', 'song_part', 'member')
 
-        setlist_assignments, _, _ = get_gig_part_assignments(gig, list(overrides))
+        setlist_assignments, _, _, stats = get_gig_part_assignments_with_stats(gig, list(overrides), _requested_setlist_mode(self.request),
+                                                                               allow_stale=True)
+        context['stale'] = stats.stale
         setlist_sorted = GigPartAssignmentPrintView._sort_by_setlist_order(gig, setlist_assignments)
 
         # 1-based song number by setlist order
@@ -42,6 +42,12 @@ SECRET_KEY = get_env_var(
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = bool(get_env_var('DEBUG', default='False', required=False))
 
+# directory to capture every part assignment MILP to, for replay with scripts.gig_part_assignment_capture
+SOLVER_CAPTURE_DIR = get_env_var('SOLVER_CAPTURE_DIR', required=False)
+
+# recompute the part assignments of upcoming gigs on a background thread whenever their inputs change
+GIG_PRECOMPUTE = get_env_var('GIG_PRECOMPUTE', default='False' if RUNNING_TESTS else 'True', required=False) == 'True'
+
 ALLOWED_HOSTS = get_env_var("ALLOWED_HOSTS", "127.0.0.1").split(',')
 
 CSRF_TRUSTED_ORIGINS = get_env_var("CSRF_TRUSTED_ORIGINS", "http://127.0.0.1,http://localhost").split(',')
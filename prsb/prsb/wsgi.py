@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'prsb.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings
+
+if settings.GIG_PRECOMPUTE:
+    # warm this process' solution cache, so the first visitor after a deploy doesn't pay for the solves
+    from scripts.gig_part_assignment_precompute import precomputer
+    precomputer.schedule_upcoming()
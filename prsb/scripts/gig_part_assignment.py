@@ -1,19 +1,29 @@
-import itertools
+import copy
+import hashlib
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from itertools import groupby
-from typing import Tuple
+from typing import Generator, Tuple
 
 import django
 import numpy as np
-from django.db.models import Exists, OuterRef
-from scipy import optimize
+from django.db.models import Exists, OuterRef, prefetch_related_objects
+from scipy import optimize, sparse
 from scipy.optimize import LinearConstraint
 from collections import Counter
 
 django.setup()
-from band.models import Song, SongPart, PartAssignment, Gig, GigAttendance, GigInstrument, BandMember, \
+from django.conf import settings
+from band.models import Song, SongPart, PartAssignment, Gig, GigAttendance, GigInstrument, BandMember, Instrument, \
     PerformanceReadiness, GigPartAssignmentOverride, GigSetlistEntry, OverrideType
+from scripts.gig_part_assignment_cache import solution_cache
+from scripts.gig_part_assignment_capture import capture_song_problem
 
+logger = logging.getLogger(__name__)
 
 RAND_SEED = 0
 
@@ -25,72 +35,372 @@ class ScoringConfig:
     ASSIGNMENT_WEIGHT_RANDOM = 0.000001
 
 
+# HiGHS' default relative MIP gap, which the per-song solves use
+DEFAULT_MIP_REL_GAP = 1e-4
+
+
+SETLIST_MODES = ("greedy", "global")
+
+
+class SolverConfig:
+    # how setlist songs are solved, one of SETLIST_MODES:
+    #   "greedy" - one by one, each seeing the song counts of the setlist songs before it
+    #   "global" - as one MILP over the whole setlist, falling back to greedy if it hits GLOBAL_TIME_LIMIT
+    SETLIST_MODE = "greedy"
+    GLOBAL_TIME_LIMIT = 10
+    # the fairness term is tiny next to the rest of the objective, so the joint solve needs a tight gap
+    GLOBAL_MIP_REL_GAP = 1e-7
+    # how recommendation songs are solved after the setlist:
+    #   "sequential" - one by one, each seeing the song counts of the recommendations before it
+    #   "pool" - in chunks on a pool of RECOMMENDATION_WORKERS workers, all against the counts left by the setlist
+    #   "batched" - as one block-diagonal MILP, also against the counts left by the setlist
+    #   "ranked" - also against the counts left by the setlist, but exactly only where that can change the top
+    #              RECOMMENDATION_TOP_K; the rest get an estimated score from the LP relaxation
+    RECOMMENDATION_MODE = "sequential"
+    RECOMMENDATION_TOP_K = 10
+    RECOMMENDATION_WORKERS = 4
+    RECOMMENDATION_BATCH_SIZE = 20
+    # "process" or "thread"
+    RECOMMENDATION_EXECUTOR = "process"
+    # solve songs without overrides or instrument contention as an assignment problem instead of a MILP
+    MATCHING_FAST_PATH = True
+    # merge members with identical candidates and song counts before solving a song's MILP
+    AGGREGATE_MEMBERS = True
+    # recommendation songs where fewer than this fraction of the parts have a READY available player on a gig
+    # instrument are not solved, just listed; setlist songs and songs with overrides are always solved. 0 solves
+    # every song
+    MIN_READY_PART_COVERAGE = 0
+    # time budgets in seconds: a song's MILP stops at SONG_TIME_LIMIT, and once GIG_TIME_BUDGET is spent on a gig
+    # the remaining songs get a greedy heuristic instead; either way the songs are flagged as approximate
+    SONG_TIME_LIMIT = 5
+    GIG_TIME_BUDGET = 30
+    # how many gigs one process solves at once; views serve a gig's last results, marked stale, rather than wait
+    MAX_CONCURRENT_SOLVES = 2
+    MIP_REL_GAP = DEFAULT_MIP_REL_GAP
+    # directory to save every per-song problem and its solution to for offline replay, or None
+    CAPTURE_DIR = settings.SOLVER_CAPTURE_DIR
+    # also save captured problems as MPS files, for other solvers
+    CAPTURE_MPS = False
+
+
+class GigRoster:
+    """What every song of a gig is laid out against: the attendees, each song's parts by song id, and how many
+    of each instrument the gig has. One is shared by all of a gig's GigPartAssignments."""
+    __slots__ = ("attendees", "song_parts", "instrument_capacity")
+
+    def __init__(self, attendees: list[BandMember], song_parts: dict[int, list[SongPart]], gig_instruments: list[GigInstrument]):
+        self.attendees = attendees
+        self.song_parts = song_parts
+        self.instrument_capacity = {gi.instrument: gi.gig_quantity for gi in gig_instruments}
+
+
 class GigPartAssignment:
-    def __init__(self, song: Song, part_assignments: list[PartAssignment], score: float,
-                 attendees: list[BandMember], gig_instruments: list[GigInstrument]):
+    """The part assignments picked for one song.
+
+    non_players, unplayed_parts and unplayed_instruments are worked out from the gig's GigRoster the first time
+    they are read, since most recommendations are never expanded.
+    """
+    __slots__ = ("song", "score", "part_assignments", "approximate", "estimated", "_roster", "_non_players",
+                 "_unplayed_parts", "_unplayed_instruments")
+
+    def __init__(self, song: Song, part_assignments: list[PartAssignment], score: float, roster: GigRoster,
+                 approximate: bool = False, estimated: bool = False):
         self.song = song
         self.score = score
         self.part_assignments = part_assignments
+        # the solver ran out of time on this song, so a better assignment may exist
+        self.approximate = approximate
+        # the song ranked below the exactly solved recommendations, so score is only an upper bound
+        self.estimated = estimated
+        self._roster = roster
+        self._non_players = None
+        self._unplayed_parts = None
+        self._unplayed_instruments = None
 
-        playing_attendees = {pa.member for pa in part_assignments}
-        self.non_players = [a for a in attendees if a not in playing_attendees]
+    @property
+    def non_players(self) -> list[BandMember]:
+        if self._non_players is None:
+            playing_attendees = {pa.member for pa in self.part_assignments}
+            self._non_players = [a for a in self._roster.attendees if a not in playing_attendees]
+        return self._non_players
 
-        covered_parts = {pa.song_part for pa in part_assignments}
-        self.unplayed_parts = {sp for sp in song.parts.all() if sp not in covered_parts}
+    @property
+    def unplayed_parts(self) -> list[SongPart]:
+        if self._unplayed_parts is None:
+            covered_parts = {pa.song_part for pa in self.part_assignments}
+            self._unplayed_parts = [sp for sp in self._roster.song_parts[self.song.id] if sp not in covered_parts]
+        return self._unplayed_parts
 
-        played_instruments = Counter(pa.instrument for pa in part_assignments)
-        remaining_instrument_counts = {gi.instrument: gi.gig_quantity - played_instruments[gi.instrument] for gi in gig_instruments}
-        self.unplayed_instruments = {i: c for i, c in remaining_instrument_counts.items() if c != 0}
+    @property
+    def unplayed_instruments(self) -> dict[Instrument, int]:
+        if self._unplayed_instruments is None:
+            played_instruments = Counter(pa.instrument for pa in self.part_assignments)
+            remaining_instrument_counts = {i: c - played_instruments[i] for i, c in self._roster.instrument_capacity.items()}
+            self._unplayed_instruments = {i: c for i, c in remaining_instrument_counts.items() if c != 0}
+        return self._unplayed_instruments
 
 
-def _partition_overrides(part_assignment_overrides: list[GigPartAssignmentOverride]) -> Tuple[list[GigPartAssignmentOverride], set[tuple]]:
-    assign_overrides = []
-    not_playing = set()
-    for override in part_assignment_overrides:
-        if override.override_type == OverrideType.NOT_PLAYING:
-            not_playing.add((override.member_id, override.song_part_id, override.gig_instrument.instrument_id))
-        else:
-            assign_overrides.append(override)
-    return assign_overrides, not_playing
+# readiness is stored as a small integer code in the problem model; index into this tuple to get it back
+READINESS_CODES = (PerformanceReadiness.READY, PerformanceReadiness.BACKUP)
 
 
-def get_gig_song_part_assignments(part_list: list[SongPart], all_assignments: list[PartAssignment],
-                                  gig_instruments: list[GigInstrument], member_song_counts: Counter,
-                                  part_assignment_overrides: list[GigPartAssignmentOverride]) -> Tuple[list[PartAssignment] | None, float]:
-    assign_overrides, not_playing = _partition_overrides(part_assignment_overrides)
-    all_assignments = [
-        assignment for assignment in all_assignments
-        if (assignment.member_id, assignment.song_part_id, assignment.instrument_id) not in not_playing
-    ]
-    members = {}
-    instruments = {}
-    parts = {}
-
-    instrument_to_count_map = {gi.instrument: gi.gig_quantity for gi in gig_instruments}
-
-    num_vars = 0
-
-    for i, assignment in enumerate(all_assignments):
-        members.setdefault(assignment.member, []).append(i)
-        instruments.setdefault(assignment.instrument, []).append(i)
-        if assignment.performance_readiness == PerformanceReadiness.READY:
-            parts.setdefault(assignment.song_part, []).append(i)
-    num_assignments = len(all_assignments)
-    num_vars += num_assignments
-
-    for i, override in enumerate(assign_overrides, start=num_vars):
-        members.setdefault(override.member, []).append(i)
-        instruments.setdefault(override.gig_instrument.instrument, []).append(i)
-        if override.performance_readiness == PerformanceReadiness.READY:
-            parts.setdefault(override.song_part, []).append(i)
-    num_overrides = len(assign_overrides)
-    num_vars += num_overrides
+class SongProblem:
+    """Integer-indexed candidates for one song.
 
-    num_members = len(members)
-    num_instruments = len(instruments)
+    Each candidate is one (member, part, instrument) the solver may pick. The first num_assignments
+    candidates come from PartAssignments (with ids in assignment_ids), the rest are assign overrides
+    that must be picked. member and instrument index into the owning GigProblem, part indexes into the
+    song's parts in order.
+    """
+    __slots__ = ("song_id", "title", "in_setlist", "num_parts", "member", "part", "instrument", "readiness",
+                 "num_assignments", "assignment_ids")
+
+    def __init__(self, song_id: int, title: str, in_setlist: bool, num_parts: int, member: np.ndarray, part: np.ndarray,
+                 instrument: np.ndarray, readiness: np.ndarray, num_assignments: int, assignment_ids: np.ndarray):
+        self.song_id = song_id
+        self.title = title
+        self.in_setlist = in_setlist
+        self.num_parts = num_parts
+        self.member = member
+        self.part = part
+        self.instrument = instrument
+        self.readiness = readiness
+        self.num_assignments = num_assignments
+        self.assignment_ids = assignment_ids
+
+    @property
+    def num_candidates(self) -> int:
+        return len(self.member)
+
+
+class GigProblem:
+    """The solver's view of a gig: plain arrays and ints only, so it is cheap to build, copy and pickle.
+
+    member_ids and instrument_ids map the member and instrument indices back to primary keys.
+    Songs are stored in solve order (setlist songs first, then by number of candidates and title).
+    """
+    __slots__ = ("gig_id", "member_ids", "instrument_ids", "instrument_capacity", "instrument_counts_songs", "songs")
+
+    def __init__(self, gig_id: int, member_ids: np.ndarray, instrument_ids: np.ndarray, instrument_capacity: np.ndarray,
+                 instrument_counts_songs: np.ndarray, songs: list[SongProblem]):
+        self.gig_id = gig_id
+        self.member_ids = member_ids
+        self.instrument_ids = instrument_ids
+        self.instrument_capacity = instrument_capacity
+        self.instrument_counts_songs = instrument_counts_songs
+        self.songs = songs
+
+    @property
+    def num_members(self) -> int:
+        return len(self.member_ids)
+
+
+class SongCoverage:
+    """How many of a song's parts have at least one READY available player on a gig instrument."""
+    __slots__ = ("song", "num_parts", "num_ready_parts")
+
+    def __init__(self, song: Song, num_parts: int, num_ready_parts: int):
+        self.song = song
+        self.num_parts = num_parts
+        self.num_ready_parts = num_ready_parts
+
+    @property
+    def coverage(self) -> float:
+        return self.num_ready_parts / self.num_parts if self.num_parts else 0.0
+
+
+class GigAssignmentData:
+    """A GigProblem plus the ORM objects its indices refer to, used to turn solutions back into model instances.
+
+    skipped_songs are the songs left out of the problem for too low a SongCoverage.
+    """
+    def __init__(self, problem: GigProblem, attendees: list[BandMember], gig_instruments: list[GigInstrument],
+                 members: list[BandMember], songs: dict[int, Song], song_parts: dict[int, list[SongPart]],
+                 skipped_songs: list[SongCoverage] | None = None):
+        self.problem = problem
+        self.attendees = attendees
+        self.gig_instruments = gig_instruments
+        self.members = members
+        self.instruments = [gi.instrument for gi in gig_instruments]
+        self.songs = songs
+        self.song_parts = song_parts
+        self.skipped_songs = skipped_songs if skipped_songs is not None else []
+        self.roster = GigRoster(attendees, song_parts, gig_instruments)
+
+    def to_gig_part_assignment(self, song_problem: SongProblem, selected: np.ndarray, score: float,
+                               approximate: bool = False, estimated: bool = False) -> GigPartAssignment:
+        """Rehydrate the selected candidates of a song into PartAssignment instances."""
+        song_parts = self.song_parts[song_problem.song_id]
+        part_assignments = [
+            PartAssignment(id=song_problem.assignment_ids[i] if i < song_problem.num_assignments else None,
+                           member=self.members[song_problem.member[i]],
+                           song_part=song_parts[song_problem.part[i]],
+                           instrument=self.instruments[song_problem.instrument[i]],
+                           performance_readiness=READINESS_CODES[song_problem.readiness[i]])
+            for i in selected
+        ]
+        part_assignments = sorted(part_assignments, key=lambda gpa: (gpa.song_part._order, gpa.member.user.get_full_name()))
+        return GigPartAssignment(song=self.songs[song_problem.song_id], part_assignments=part_assignments, score=score,
+                                 roster=self.roster, approximate=approximate, estimated=estimated)
+
+    def to_member_song_counts(self, member_song_counts: np.ndarray) -> Counter:
+        return Counter({self.members[i]: int(count) for i, count in enumerate(member_song_counts) if count})
+
+
+class SongSolveStats:
+    """Where the time went for one song, and how big and how well solved its problem was.
+
+    method is "milp", "matching" (the assignment fast path), "batched" (part of a block-diagonal MILP, whose
+    solve time is split evenly between its songs), "global" (part of a whole-setlist MILP, likewise),
+    "aggregated" (a MILP with interchangeable members merged, whose size is given), "greedy"
+    (the heuristic used once the time budget ran out), "bound" (the LP relaxation only, for a song ranked out
+    of the top recommendations) or "reused" (taken from an earlier solve). status is the HiGHS status code (0 is
+    optimal, 1 a time limit) and mip_gap the relative gap it stopped at. approximate means the solution may not
+    be optimal because a time limit was hit, estimated that its score is the LP bound rather than its own.
+    """
+    __slots__ = ("song_id", "title", "method", "num_vars", "num_constraints", "build_seconds", "solve_seconds", "status", "mip_gap",
+                 "approximate", "estimated")
+
+    def __init__(self, song_id: int, title: str, method: str = "reused", num_vars: int = 0, num_constraints: int = 0,
+                 build_seconds: float = 0.0, solve_seconds: float = 0.0, status: int = 0, mip_gap: float = 0.0,
+                 approximate: bool = False, estimated: bool = False):
+        self.song_id = song_id
+        self.title = title
+        self.method = method
+        self.num_vars = num_vars
+        self.num_constraints = num_constraints
+        self.build_seconds = build_seconds
+        self.solve_seconds = solve_seconds
+        self.status = status
+        self.mip_gap = mip_gap
+        self.approximate = approximate
+        self.estimated = estimated
+
+    def record(self, method: str, model: "SongModel", build_seconds: float, solve_seconds: float, status: int, mip_gap: float | None,
+               approximate: bool = False, estimated: bool = False):
+        self.method = method
+        self.num_vars, self.num_constraints = len(model.c), model.A.shape[0]
+        self.build_seconds = build_seconds
+        self.solve_seconds = solve_seconds
+        self.status = status
+        self.mip_gap = 0.0 if mip_gap is None else mip_gap
+        self.approximate = approximate
+        self.estimated = estimated
+
+
+class GigSolveStats:
+    """Per-gig timings for get_gig_part_assignments_with_stats, with the per-song stats of the solve it used.
+
+    setlist_mode and setlist_seconds say how the setlist was solved and how long that took, which may be an
+    earlier request's solve if it was reused. skipped_songs are the songs not solved at all for too low a
+    SongCoverage, best covered first. stale means the solver was busy, so these are the results of an earlier
+    request, which may predate the latest changes.
+    """
+    __slots__ = ("gig_id", "cache_hit", "load_seconds", "solve_seconds", "rehydrate_seconds", "songs", "setlist_mode",
+                 "setlist_seconds", "skipped_songs", "stale")
+
+    def __init__(self, gig_id: int, cache_hit: bool, load_seconds: float, solve_seconds: float, rehydrate_seconds: float,
+                 songs: list[SongSolveStats], setlist_mode: str = "greedy", setlist_seconds: float = 0.0,
+                 skipped_songs: list[SongCoverage] | None = None, stale: bool = False):
+        self.gig_id = gig_id
+        self.cache_hit = cache_hit
+        self.load_seconds = load_seconds
+        self.solve_seconds = solve_seconds
+        self.rehydrate_seconds = rehydrate_seconds
+        self.songs = songs
+        self.setlist_mode = setlist_mode
+        self.setlist_seconds = setlist_seconds
+        self.skipped_songs = skipped_songs if skipped_songs is not None else []
+        self.stale = stale
+
+    def is_approximate(self, i: int) -> bool:
+        return i < len(self.songs) and self.songs[i].approximate
+
+    @property
+    def approximate(self) -> bool:
+        return any(song.approximate for song in self.songs)
+
+    @property
+    def total_seconds(self) -> float:
+        return self.load_seconds + self.solve_seconds + self.rehydrate_seconds
+
+    @property
+    def build_seconds(self) -> float:
+        return sum(song.build_seconds for song in self.songs)
+
+    @property
+    def milp_seconds(self) -> float:
+        return sum(song.solve_seconds for song in self.songs if song.method in ("milp", "aggregated", "batched", "global"))
+
+    @property
+    def num_solved(self) -> int:
+        return sum(song.method != "reused" for song in self.songs)
+
+    @property
+    def num_approximate(self) -> int:
+        return sum(song.approximate for song in self.songs)
+
+    @property
+    def num_estimated(self) -> int:
+        return sum(song.estimated for song in self.songs)
+
+
+def _incidence_matrix(rows: np.ndarray, cols: np.ndarray, num_rows: int, num_vars: int) -> sparse.csr_array:
+    """Build a sparse 0/1 matrix with a 1 at each (rows[k], cols[k])."""
+    return sparse.csr_array((np.ones(len(cols)), (rows, cols)), shape=(num_rows, num_vars))
+
+
+class SongModel:
+    """The MILP for one song: minimise c @ x subject to lb <= A @ x <= ub with binary x.
+
+    The first num_candidates variables are the song's candidates, the rest are the missing part indicators.
+    score_coeffs holds the parts of c that make up the displayed score.
+    """
+    __slots__ = ("c", "A", "lb", "ub", "score_coeffs", "num_candidates")
+
+    def __init__(self, c: np.ndarray, A: sparse.csr_array, lb: np.ndarray, ub: np.ndarray, score_coeffs: np.ndarray,
+                 num_candidates: int):
+        self.c = c
+        self.A = A
+        self.lb = lb
+        self.ub = ub
+        self.score_coeffs = score_coeffs
+        self.num_candidates = num_candidates
+
+    def solution_from(self, x: np.ndarray) -> Tuple[np.ndarray, float]:
+        """Return the selected candidate indices and the score for a solution vector."""
+        chosen = x > 0.5
+
+        score = self.score_coeffs[chosen].sum()
+        score = ScoringConfig.SCORE_RANGE / 2 - score
+
+        return np.flatnonzero(chosen[:self.num_candidates]), score
+
+
+def _song_seed(problem: GigProblem, song: SongProblem) -> tuple:
+    # every song gets its own generator, so its result doesn't depend on the solve order, the worker or
+    # on other requests solving at the same time
+    return RAND_SEED, problem.gig_id, song.song_id
 
-    num_parts = len(part_list)
-    num_vars += num_parts
+
+def build_song_model(problem: GigProblem, song: SongProblem, member_song_counts: np.ndarray,
+                     rng: np.random.Generator | None = None) -> SongModel:
+    """Build the part assignment MILP for one song.
+
+    The random tie-breaker is drawn from rng if given, otherwise from a generator seeded by the gig and song ids.
+    """
+    num_assignments = song.num_assignments
+    num_candidates = song.num_candidates
+    num_overrides = num_candidates - num_assignments
+    num_parts = song.num_parts
+    num_vars = num_candidates + num_parts
+
+    song_members, member_rows = np.unique(song.member, return_inverse=True)
+    song_instruments, instrument_rows = np.unique(song.instrument, return_inverse=True)
+    num_members = len(song_members)
+    num_instruments = len(song_instruments)
+    candidate_cols = np.arange(num_candidates)
+    is_ready = song.readiness == READINESS_CODES.index(PerformanceReadiness.READY)
 
     ##########################################################################################
     # Constraints
@@ -114,39 +424,30 @@ def get_gig_song_part_assignments(part_list: list[SongPart], all_assignments: li
     constraints = []
 
     # ensure each member only plays once
-    coeff_member = np.zeros((num_members, num_vars))
+    coeff_member = _incidence_matrix(member_rows, candidate_cols, num_members, num_vars)
     lb_member = np.zeros(num_members)
     ub_member = np.ones(num_members)
-    for i, member_indices in enumerate(members.values()):
-        coeff_member[i, member_indices] = 1
     constraints.append(LinearConstraint(coeff_member, lb_member, ub_member))
 
     # ensure each instrument only played up to the correct number of times
-    coeff_instrument = np.zeros((num_instruments, num_vars))
+    coeff_instrument = _incidence_matrix(instrument_rows, candidate_cols, num_instruments, num_vars)
     lb_instrument = np.zeros(num_instruments)
-    ub_instrument = np.zeros(num_instruments)
-    for i, instrument in enumerate(instruments):
-        coeff_instrument[i, instruments[instrument]] = 1
-        ub_instrument[i] = instrument_to_count_map[instrument]
+    ub_instrument = problem.instrument_capacity[song_instruments]
     constraints.append(LinearConstraint(coeff_instrument, lb_instrument, ub_instrument))
 
     # ensure each part is played by at least one (primary / ready) person, or that there's a penalty applied
-    coeff_part = np.zeros((num_parts, num_vars))
+    coeff_part = _incidence_matrix(np.concatenate([song.part[is_ready], np.arange(num_parts)]),
+                                   np.concatenate([candidate_cols[is_ready], num_candidates + np.arange(num_parts)]),
+                                   num_parts, num_vars)
     lb_part = np.ones(num_parts)
     ub_part = np.inf * np.ones(num_parts)
-    for i, part in enumerate(part_list):
-        part_indices = parts.get(part, [])
-        coeff_part[i, part_indices] = 1
-        coeff_part[i, num_assignments + num_overrides + i] = 1
     constraints.append(LinearConstraint(coeff_part, lb_part, ub_part))
 
     # ensure overrides are respected
     if num_overrides > 0:
-        coeff_overrides = np.zeros((num_overrides, num_vars))
+        coeff_overrides = _incidence_matrix(np.arange(num_overrides), num_assignments + np.arange(num_overrides), num_overrides, num_vars)
         lb_overrides = np.ones(num_overrides)
         ub_overrides = np.ones(num_overrides)
-        for i in range(num_overrides):
-            coeff_overrides[i, num_assignments + i] = 1
         constraints.append(LinearConstraint(coeff_overrides, lb_overrides, ub_overrides))
 
     ##########################################################################################
@@ -158,106 +459,1124 @@ def get_gig_song_part_assignments(part_list: list[SongPart], all_assignments: li
     # The last variables are there to catch when no one is assigned to a particular part.
     # When we use one of these variables, the coefficient is MISSING_PART_PENALTY / num_parts.
     ##########################################################################################
-    c_instrument = np.zeros(num_vars)
-    for instrument, instrument_indices in instruments.items():
-        c_instrument[instrument_indices] = -ScoringConfig.SCORE_RANGE / 2 / len(instrument_to_count_map) / instrument_to_count_map[instrument]
+    # each variable belongs to exactly one member and one instrument, so the per-variable
+    # coefficients are the per-row weights pushed through the transposed incidence matrices
+    instrument_weights = np.divide(-ScoringConfig.SCORE_RANGE / 2 / len(problem.instrument_capacity), ub_instrument,
+                                   out=np.zeros(num_instruments), where=ub_instrument > 0)
+    c_instrument = coeff_instrument.T @ instrument_weights
 
-    c_random = ScoringConfig.ASSIGNMENT_WEIGHT_RANDOM * np.random.random(num_vars)
+    if rng is None:
+        rng = np.random.default_rng(_song_seed(problem, song))
+    c_random = ScoringConfig.ASSIGNMENT_WEIGHT_RANDOM * rng.random(num_vars)
     c_random[num_assignments:] = 0
 
-    c_per_song_penalty = np.zeros(num_vars)
-    for member, member_indices in members.items():
-        c_per_song_penalty[member_indices] += ScoringConfig.ASSIGNMENT_PENALTY_PER_SONG * member_song_counts[member]**2
+    member_penalties = ScoringConfig.ASSIGNMENT_PENALTY_PER_SONG * member_song_counts[song_members].astype(float)**2
+    c_per_song_penalty = coeff_member.T @ member_penalties
 
     c_missing_part_penalty = np.zeros(num_vars)
-    c_missing_part_penalty[-num_parts:] = ScoringConfig.SCORE_RANGE / num_parts / 2
+    c_missing_part_penalty[num_candidates:] = ScoringConfig.SCORE_RANGE / num_parts / 2
 
     c = c_instrument + c_random + c_per_song_penalty + c_missing_part_penalty
 
+    return SongModel(c=c, A=sparse.vstack([constraint.A for constraint in constraints], format="csr"),
+                     lb=np.concatenate([constraint.lb for constraint in constraints]),
+                     ub=np.concatenate([constraint.ub for constraint in constraints]),
+                     score_coeffs=c_instrument + c_missing_part_penalty, num_candidates=num_candidates)
+
+
+class AggregatedSongModel:
+    """A song's MILP with interchangeable members merged: minimise c @ y subject to lb <= A @ y <= ub, with
+    integer 0 <= y <= var_ub.
+
+    Each y before the missing part indicators counts how many members of one class of interchangeable members
+    play one of their shared candidates. classes holds, per class, its members' candidate indices as a
+    (members, shared candidates) array, in the order of the class' variables.
+    """
+    __slots__ = ("c", "A", "lb", "ub", "var_ub", "classes")
+
+    def __init__(self, c: np.ndarray, A: sparse.csr_array, lb: np.ndarray, ub: np.ndarray, var_ub: np.ndarray,
+                 classes: list[np.ndarray]):
+        self.c = c
+        self.A = A
+        self.lb = lb
+        self.ub = ub
+        self.var_ub = var_ub
+        self.classes = classes
+
+    def expand(self, y: np.ndarray, model: SongModel, rng: np.random.Generator) -> np.ndarray:
+        """Turn a solution of the aggregated problem into one of the song's full problem.
+
+        Which members of a class play which of its counted candidates is drawn from rng, standing in for the
+        random tie-breaker that decides it in the full problem.
+        """
+        x = np.zeros(len(model.c))
+        counts = np.rint(y).astype(np.int64)
+        first_var = 0
+        for candidates in self.classes:
+            members = rng.permutation(len(candidates))
+            taken = 0
+            for j in range(candidates.shape[1]):
+                playing = members[taken:taken + counts[first_var + j]]
+                x[candidates[playing, j]] = 1
+                taken += len(playing)
+            first_var += candidates.shape[1]
+        x[model.num_candidates:] = counts[first_var:]
+        return x
+
+
+def aggregate_song_model(problem: GigProblem, song: SongProblem, model: SongModel,
+                         member_song_counts: np.ndarray) -> AggregatedSongModel | None:
+    """Presolve a song's MILP by merging interchangeable members, or return None if no two are.
+
+    Members with the same (part, instrument, readiness, forced) candidates and the same song count differ only
+    in the random tie-breaker, so each class of them becomes one integer variable per shared candidate, counting
+    how many of them play it. The class' member constraint bounds the total by the class size, and a forced
+    override forces all of it. The costs are taken from the class' first member.
+    """
+    num_candidates = song.num_candidates
+    num_parts = song.num_parts
+    forced = np.arange(num_candidates) >= song.num_assignments
+    is_ready = song.readiness == READINESS_CODES.index(PerformanceReadiness.READY)
+
+    # every member's candidates in a canonical order, so interchangeable members get equal signatures
+    order = np.lexsort((forced, song.readiness, song.instrument, song.part, song.member))
+    members, starts = np.unique(song.member[order], return_index=True)
+    classes = {}
+    for member, rows in zip(members, np.split(order, starts[1:])):
+        signature = (int(member_song_counts[member]), song.part[rows].tobytes(), song.instrument[rows].tobytes(),
+                     song.readiness[rows].tobytes(), forced[rows].tobytes())
+        classes.setdefault(signature, []).append(rows)
+    if len(classes) == len(members):
+        return None
+
+    classes = [np.array(rows) for rows in classes.values()]
+    representative = np.concatenate([candidates[0] for candidates in classes])
+    class_sizes = np.array([len(candidates) for candidates in classes])
+    var_class = np.repeat(np.arange(len(classes)), [candidates.shape[1] for candidates in classes])
+    num_counts = len(representative)
+    num_vars = num_counts + num_parts
+    count_cols = np.arange(num_counts)
+
+    # the same four kinds of constraints as build_song_model, with each class in place of a member
+    coeff_class = _incidence_matrix(var_class, count_cols, len(classes), num_vars)
+    song_instruments, instrument_rows = np.unique(song.instrument[representative], return_inverse=True)
+    coeff_instrument = _incidence_matrix(instrument_rows, count_cols, len(song_instruments), num_vars)
+    ready = is_ready[representative]
+    coeff_part = _incidence_matrix(np.concatenate([song.part[representative][ready], np.arange(num_parts)]),
+                                   np.concatenate([count_cols[ready], num_counts + np.arange(num_parts)]), num_parts, num_vars)
+    forced_cols = np.flatnonzero(forced[representative])
+    coeff_forced = _incidence_matrix(np.arange(len(forced_cols)), forced_cols, len(forced_cols), num_vars)
+
+    return AggregatedSongModel(
+        c=np.concatenate([model.c[representative], model.c[num_candidates:]]),
+        A=sparse.vstack([coeff_class, coeff_instrument, coeff_part, coeff_forced], format="csr"),
+        lb=np.concatenate([np.zeros(len(classes)), np.zeros(len(song_instruments)), np.ones(num_parts),
+                           class_sizes[var_class[forced_cols]]]),
+        ub=np.concatenate([class_sizes, problem.instrument_capacity[song_instruments], np.full(num_parts, np.inf),
+                           class_sizes[var_class[forced_cols]]]),
+        var_ub=np.concatenate([class_sizes[var_class], np.ones(num_parts)]),
+        classes=classes)
+
+
+def is_matching_song(problem: GigProblem, song: SongProblem) -> bool:
+    """Whether a song's MILP reduces to a bipartite matching: no overrides, and every instrument has room for
+    every member who could play it, so the instrument constraints can never bind."""
+    if song.num_assignments != song.num_candidates:
+        return False
+    member_instrument_pairs = np.unique(song.instrument.astype(np.int64) * problem.num_members + song.member)
+    members_per_instrument = np.bincount(member_instrument_pairs // problem.num_members, minlength=len(problem.instrument_capacity))
+    return bool(np.all(members_per_instrument <= problem.instrument_capacity))
+
+
+def solve_matching_song(song: SongProblem, model: SongModel) -> np.ndarray:
+    """Solve a song that passes is_matching_song exactly, without a MILP, and return the solution vector.
+
+    With the instrument constraints slack, each member independently takes their cheapest candidate (or nothing
+    if every candidate costs more than it saves), except that covering a part saves its missing part penalty once.
+    So the optimum is: pick a set of (member, part) covers, at most one per member and per part, minimising
+    cover cost - part penalty - the member's best independent cost, and let everyone else play their best option.
+    That is a rectangular assignment problem, padded with zero-cost "no cover" columns so members can stay out.
+    """
+    num_candidates = song.num_candidates
+    candidate_cost = model.c[:num_candidates]
+    part_penalty = model.c[num_candidates:]
+    is_ready = song.readiness == READINESS_CODES.index(PerformanceReadiness.READY)
+
+    members, member_rows = np.unique(song.member, return_inverse=True)
+    num_members = len(members)
+
+    best_cost = np.zeros(num_members)
+    best_candidate = np.full(num_members, -1)
+    cover_cost = np.full((num_members, song.num_parts), np.inf)
+    cover_candidate = np.full((num_members, song.num_parts), -1)
+    for k in range(num_candidates):
+        row = member_rows[k]
+        if candidate_cost[k] < best_cost[row]:
+            best_cost[row] = candidate_cost[k]
+            best_candidate[row] = k
+        if is_ready[k] and candidate_cost[k] < cover_cost[row, song.part[k]]:
+            cover_cost[row, song.part[k]] = candidate_cost[k]
+            cover_candidate[row, song.part[k]] = k
+
+    gain = cover_cost - part_penalty[np.newaxis, :] - best_cost[:, np.newaxis]
+    gain[cover_candidate < 0] = 0
+    rows, cols = optimize.linear_sum_assignment(np.hstack([gain, np.zeros((num_members, num_members))]))
+
+    x = np.zeros(len(model.c))
+    for row, col in zip(rows, cols):
+        if col < song.num_parts and gain[row, col] < 0:
+            x[cover_candidate[row, col]] = 1
+        elif best_candidate[row] >= 0:
+            x[best_candidate[row]] = 1
+
+    covered = np.zeros(song.num_parts, dtype=bool)
+    covered[song.part[(x[:num_candidates] > 0.5) & is_ready]] = True
+    x[num_candidates:] = ~covered
+    return x
+
+
+def solve_greedy_song(problem: GigProblem, song: SongProblem, model: SongModel) -> np.ndarray | None:
+    """Quickly find a feasible, but not necessarily optimal, solution vector for a song whose time has run out.
+
+    Forced overrides go first, then the cheapest ready candidate for each part that is still uncovered, then any
+    other candidate that lowers the objective, each only if its member and instrument are still free. Returns
+    None if the overrides alone break the member or instrument limits.
+    """
+    num_candidates = song.num_candidates
+    cost = model.c[:num_candidates]
+    is_ready = song.readiness == READINESS_CODES.index(PerformanceReadiness.READY)
+
+    x = np.zeros(len(model.c))
+    member_free = np.ones(problem.num_members, dtype=bool)
+    instrument_left = problem.instrument_capacity.copy()
+    part_covered = np.zeros(song.num_parts, dtype=bool)
+
+    def fits(k):
+        return member_free[song.member[k]] and instrument_left[song.instrument[k]] >= 1
+
+    def take(k):
+        x[k] = 1
+        member_free[song.member[k]] = False
+        instrument_left[song.instrument[k]] -= 1
+        part_covered[song.part[k]] |= is_ready[k]
+
+    for k in range(song.num_assignments, num_candidates):
+        if not fits(k):
+            return None
+        take(k)
+
+    by_cost = np.argsort(cost[:song.num_assignments], kind="stable")
+    for k in by_cost:
+        if is_ready[k] and not part_covered[song.part[k]] and fits(k):
+            take(k)
+    for k in by_cost:
+        if cost[k] < 0 and fits(k):
+            take(k)
+
+    x[num_candidates:] = ~part_covered
+    return x
+
+
+def _time_limit(limit: float, deadline: float | None) -> float:
+    return limit if deadline is None else min(limit, deadline - time.time())
+
+
+def _capture(problem: GigProblem, song: SongProblem, model: SongModel, x: np.ndarray | None, status: int, method: str,
+             solve_seconds: float):
+    capture_song_problem(SolverConfig.CAPTURE_DIR, problem.gig_id, song.song_id, model.c, model.A, model.lb, model.ub,
+                         member_ids=problem.member_ids[song.member], part=song.part,
+                         instrument_ids=problem.instrument_ids[song.instrument], assignment_ids=song.assignment_ids,
+                         num_candidates=song.num_candidates, x=x, status=status, method=method, solve_seconds=solve_seconds,
+                         mps=SolverConfig.CAPTURE_MPS)
+
+
+def get_gig_song_part_assignments(problem: GigProblem, song: SongProblem, member_song_counts: np.ndarray,
+                                  rng: np.random.Generator | None = None,
+                                  stats: SongSolveStats | None = None,
+                                  deadline: float | None = None) -> Tuple[np.ndarray | None, float]:
+    """Solve the part assignment MILP for one song.
+
+    Returns the indices of the selected candidates and the song's score, or (None, -1) if the constraints are infeasible.
+    Timings and problem sizes are recorded in stats if given, and the problem is saved for replay if
+    SolverConfig.CAPTURE_DIR is set.
+
+    The MILP gets SolverConfig.SONG_TIME_LIMIT seconds, or whatever is left before deadline (a time.time()
+    value) if that is sooner. If it runs out, the best solution found so far is used, or solve_greedy_song's if
+    there is none yet, and stats.approximate is set.
+    """
+    start = time.perf_counter()
+    model = build_song_model(problem, song, member_song_counts, rng)
+    built = time.perf_counter()
+
+    if SolverConfig.MATCHING_FAST_PATH and is_matching_song(problem, song):
+        x = solve_matching_song(song, model)
+        solve_seconds = time.perf_counter() - built
+        if stats is not None:
+            stats.record("matching", model, built - start, solve_seconds, status=0, mip_gap=0.0)
+        if SolverConfig.CAPTURE_DIR is not None:
+            _capture(problem, song, model, x, 0, "matching", solve_seconds)
+        return model.solution_from(x)
+
+    time_limit = _time_limit(SolverConfig.SONG_TIME_LIMIT, deadline)
+    if time_limit <= 0:
+        return _solve_song_greedily(problem, song, model, built - start, stats)
+
+    aggregated = aggregate_song_model(problem, song, model, member_song_counts) if SolverConfig.AGGREGATE_MEMBERS else None
+    solved_model = model if aggregated is None else aggregated
+    built = time.perf_counter()
+
     ##########################################################################################
     # Other Settings
-    # all variables are binary (integers from 0 to 1 inclusive)
+    # all variables are binary (integers from 0 to 1 inclusive), or counts of class members if aggregated
     ##########################################################################################
-    bounds = optimize.Bounds(0, 1)
-    integrality = np.ones_like(c)
+    bounds = optimize.Bounds(0, 1 if aggregated is None else aggregated.var_ub)
+    integrality = np.ones_like(solved_model.c)
+    options = {"time_limit": time_limit, "mip_rel_gap": SolverConfig.MIP_REL_GAP}
 
     ##########################################################################################
     # Solve
     ##########################################################################################
-    result = optimize.milp(c=c, constraints=constraints, bounds=bounds, integrality=integrality)
+    result = optimize.milp(c=solved_model.c, constraints=LinearConstraint(solved_model.A, solved_model.lb, solved_model.ub),
+                           bounds=bounds, integrality=integrality, options=options)
+    x = result.x
+    if x is not None and aggregated is not None:
+        x = aggregated.expand(x, model, np.random.default_rng(_song_seed(problem, song) + (1,)))
+    solve_seconds = time.perf_counter() - built
+
+    if result.status == 1 and x is None:
+        # out of time without a feasible solution
+        return _solve_song_greedily(problem, song, model, built - start, stats, solve_seconds)
 
-    if not result.success:
+    approximate = result.status == 1
+    method = "milp" if aggregated is None else "aggregated"
+    if stats is not None:
+        stats.record(method, solved_model, built - start, solve_seconds, result.status, getattr(result, "mip_gap", None), approximate)
+    # an incumbent cut off by the time limit is no golden result to replay against
+    if SolverConfig.CAPTURE_DIR is not None and not approximate:
+        _capture(problem, song, model, x if result.success else None, result.status, method, solve_seconds)
+
+    if x is None:
         return None, -1
 
-    ##########################################################################################
-    # Process Results
-    ##########################################################################################
-    overrides_as_part_assignments = [PartAssignment(member=pao.member,
-                                                    song_part=pao.song_part,
-                                                    instrument=pao.gig_instrument.instrument,
-                                                    performance_readiness=pao.performance_readiness)
-                                     for pao in assign_overrides]
-    gig_part_assignments = list(itertools.compress(all_assignments + overrides_as_part_assignments, result.x))
-    gig_part_assignments = sorted(gig_part_assignments, key=lambda gpa: (gpa.song_part._order, gpa.member.user.get_full_name()))
+    return model.solution_from(x)
+
 
-    score = sum(itertools.compress(c_instrument + c_missing_part_penalty, result.x))
-    score = ScoringConfig.SCORE_RANGE / 2 - score
+def _solve_song_greedily(problem: GigProblem, song: SongProblem, model: SongModel, build_seconds: float,
+                         stats: SongSolveStats | None, spent_seconds: float = 0.0) -> Tuple[np.ndarray | None, float]:
+    start = time.perf_counter()
+    x = solve_greedy_song(problem, song, model)
+    if stats is not None:
+        stats.record("greedy", model, build_seconds, spent_seconds + time.perf_counter() - start, status=1, mip_gap=None,
+                     approximate=True)
+    if x is None:
+        return None, -1
+    return model.solution_from(x)
 
-    return gig_part_assignments, score
 
+def solve_songs_batched(problem: GigProblem, songs: list[SongProblem], member_song_counts: np.ndarray,
+                        rngs: list[np.random.Generator] | None = None,
+                        stats: list[SongSolveStats] | None = None,
+                        deadline: float | None = None) -> list[Tuple[np.ndarray | None, float]]:
+    """Solve independent songs as block-diagonal MILPs of up to RECOMMENDATION_BATCH_SIZE songs each, paying
+    HiGHS' setup and presolve cost once per batch instead of once per song.
 
-def get_gig_part_assignments(gig: Gig, part_assignment_overrides: list[GigPartAssignmentOverride]) -> Tuple[list[GigPartAssignment], list[GigPartAssignment], Counter]:
-    np.random.seed(RAND_SEED)
-    attendees = BandMember.objects.filter(gigattendance__gig=gig, gigattendance__status=GigAttendance.AVAILABLE)
-    gig_instruments: list[GigInstrument] = list(GigInstrument.objects.filter(gig=gig))
+    The blocks share no variables, so the joint optimum is the per-song optimum of every block. The relative gap
+    is divided by the number of blocks so each block gets the same absolute tolerance as a standalone solve;
+    within that tolerance the random tie-breaker may pick a different, equally scored assignment. Batches much
+    bigger than the default make branch and bound slower than solving the songs one at a time.
+    If any block is infeasible the joint problem is too, so that batch's songs are then solved one at a time.
+    Songs that qualify for the matching fast path skip the MILP altogether.
+    rngs and stats, if given, are aligned with songs; stats are filled in. Each batch gets SONG_TIME_LIMIT
+    seconds per song, within deadline, and its songs are flagged approximate if that runs out.
+    """
+    if stats is None:
+        stats = [SongSolveStats(song.song_id, song.title) for song in songs]
+    if rngs is None:
+        rngs = [np.random.default_rng(_song_seed(problem, song)) for song in songs]
 
-    gig_part_assignments_setlist = []
-    gig_part_assignments_recs = []
+    results = []
+    batch_size = SolverConfig.RECOMMENDATION_BATCH_SIZE
+    for batch_start in range(0, len(songs), batch_size):
+        batch = list(zip(songs[batch_start:batch_start + batch_size], rngs[batch_start:batch_start + batch_size],
+                         stats[batch_start:batch_start + batch_size]))
+        batch_results = []
+        milp_batch = []
+        for song, rng, song_stats in batch:
+            start = time.perf_counter()
+            model = build_song_model(problem, song, member_song_counts, rng)
+            built = time.perf_counter()
+            if SolverConfig.MATCHING_FAST_PATH and is_matching_song(problem, song):
+                batch_results.append(model.solution_from(solve_matching_song(song, model)))
+                song_stats.record("matching", model, built - start, time.perf_counter() - built, status=0, mip_gap=0.0)
+            else:
+                batch_results.append(None)
+                milp_batch.append((song, model, song_stats))
+                song_stats.build_seconds = built - start
+
+        milp_results = iter(_solve_block_diagonal(problem, milp_batch, member_song_counts, deadline))
+        results += [result if result is not None else next(milp_results) for result in batch_results]
+
+    return results
+
+
+def _solve_block_diagonal(problem: GigProblem, batch: list[Tuple[SongProblem, SongModel, SongSolveStats]],
+                          member_song_counts: np.ndarray, deadline: float | None = None) -> list[Tuple[np.ndarray | None, float]]:
+    if not batch:
+        return []
+    models = [model for _, model, _ in batch]
 
-    member_song_counts = Counter()
+    time_limit = _time_limit(SolverConfig.SONG_TIME_LIMIT * len(batch), deadline)
+    if time_limit <= 0:
+        return [_solve_song_greedily(problem, song, model, song_stats.build_seconds, song_stats) for song, model, song_stats in batch]
 
-    all_part_assignments = PartAssignment.objects.filter(~Exists(GigPartAssignmentOverride.objects.filter(gig_instrument__gig=gig,
-                                                                                                          song_part__song=OuterRef("song_part__song"),
-                                                                                                          member=OuterRef("member"),
-                                                                                                          override_type=OverrideType.ASSIGN)),
-                                                         member__gigattendance__gig=gig,
-                                                         member__gigattendance__status=GigAttendance.AVAILABLE,
-                                                         instrument__giginstrument__in=gig_instruments,
-                                                         song_part__song__in_gig_rotation=True) \
+    c = np.concatenate([model.c for model in models])
+
+    start = time.perf_counter()
+    result = optimize.milp(c=c,
+                           constraints=LinearConstraint(sparse.block_diag([model.A for model in models], format="csr"),
+                                                        np.concatenate([model.lb for model in models]),
+                                                        np.concatenate([model.ub for model in models])),
+                           bounds=optimize.Bounds(0, 1), integrality=np.ones_like(c),
+                           options={"time_limit": time_limit, "mip_rel_gap": SolverConfig.MIP_REL_GAP / len(models)})
+    solve_seconds = time.perf_counter() - start
+
+    if result.x is None:
+        return [get_gig_song_part_assignments(problem, song, member_song_counts, stats=song_stats, deadline=deadline)
+                for song, _, song_stats in batch]
+
+    approximate = result.status == 1
+    for _, model, song_stats in batch:
+        song_stats.record("batched", model, song_stats.build_seconds, solve_seconds / len(batch), result.status,
+                          getattr(result, "mip_gap", None), approximate)
+
+    offsets = np.cumsum([0] + [len(model.c) for model in models])
+    if SolverConfig.CAPTURE_DIR is not None and not approximate:
+        for (song, model, _), start, end in zip(batch, offsets[:-1], offsets[1:]):
+            _capture(problem, song, model, result.x[start:end], result.status, "batched", solve_seconds / len(batch))
+    return [model.solution_from(result.x[start:end]) for model, start, end in zip(models, offsets[:-1], offsets[1:])]
+
+
+def solve_setlist_globally(problem: GigProblem, songs: list[SongProblem], stats: list[SongSolveStats],
+                           deadline: float | None = None) -> list[Tuple[np.ndarray, float]] | None:
+    """Solve all setlist songs as one MILP, balancing the song counts over the whole setlist at once.
+
+    Solved greedily, the c-th song a member is put on costs them ASSIGNMENT_PENALTY_PER_SONG * c**2, so a
+    member who plays L songs adds up to the penalty times 0**2 + 1**2 + ... + (L - 1)**2 however the songs are
+    ordered, but each song only sees the songs before it. Here that total is part of the joint objective. It is
+    convex in L, so it is linearized with one continuous load variable per member and possible song count,
+    costing the marginal penalty of that count; the loads always fill up from the cheapest.
+
+    Returns None, for the caller to fall back to the greedy solve, if the MILP is infeasible or not solved to
+    optimality within GLOBAL_TIME_LIMIT seconds or before deadline. stats is aligned with songs and filled in.
+    """
+    if not songs:
+        # nothing to balance, and no arrays to join up
+        return []
+    time_limit = _time_limit(SolverConfig.GLOBAL_TIME_LIMIT, deadline)
+    if time_limit <= 0:
+        return None
+
+    no_counts = np.zeros(problem.num_members, dtype=np.int64)
+    models = []
+    for song, song_stats in zip(songs, stats):
+        start = time.perf_counter()
+        models.append(build_song_model(problem, song, no_counts))
+        song_stats.build_seconds = time.perf_counter() - start
+    offsets = np.cumsum([0] + [len(model.c) for model in models])
+    num_song_vars = offsets[-1]
+
+    # the member of each candidate that counts towards the song counts, and its column in the joint problem
+    counted = [problem.instrument_counts_songs[song.instrument] for song in songs]
+    load_members = np.concatenate([song.member[mask] for song, mask in zip(songs, counted)])
+    load_cols = np.concatenate([offset + np.flatnonzero(mask) for offset, mask in zip(offsets, counted)])
+    # a member plays at most one part per song, so their count is at most the number of songs they could play
+    max_songs = np.zeros(problem.num_members, dtype=np.int64)
+    for song, mask in zip(songs, counted):
+        max_songs[np.unique(song.member[mask])] += 1
+
+    load_owner = np.repeat(np.arange(problem.num_members), max_songs)
+    load_count = np.concatenate([np.arange(n) for n in max_songs] + [np.zeros(0, dtype=np.int64)])
+    num_vars = num_song_vars + len(load_owner)
+
+    # each member's counted candidates equal the sum of their load variables
+    coeff_load = sparse.csr_array((np.concatenate([np.ones(len(load_cols)), -np.ones(len(load_owner))]),
+                                   (np.concatenate([load_members, load_owner]), np.concatenate([load_cols, num_song_vars + np.arange(len(load_owner))]))),
+                                  shape=(problem.num_members, num_vars))
+    # the empty block pads the song constraints out to the load variables
+    coeff_songs = sparse.block_diag([model.A for model in models] + [sparse.csr_array((0, len(load_owner)))], format="csr")
+
+    c = np.concatenate([model.c for model in models] + [ScoringConfig.ASSIGNMENT_PENALTY_PER_SONG * load_count.astype(float)**2])
+    constraints = LinearConstraint(sparse.vstack([coeff_songs, coeff_load], format="csr"),
+                                   np.concatenate([model.lb for model in models] + [np.zeros(problem.num_members)]),
+                                   np.concatenate([model.ub for model in models] + [np.zeros(problem.num_members)]))
+    integrality = np.concatenate([np.ones(num_song_vars), np.zeros(len(load_owner))])
+
+    start = time.perf_counter()
+    result = optimize.milp(c=c, constraints=constraints, bounds=optimize.Bounds(0, 1), integrality=integrality,
+                           options={"time_limit": time_limit, "mip_rel_gap": SolverConfig.GLOBAL_MIP_REL_GAP})
+    solve_seconds = time.perf_counter() - start
+
+    for model, song_stats in zip(models, stats):
+        song_stats.record("global", model, song_stats.build_seconds, solve_seconds / len(songs), result.status,
+                          getattr(result, "mip_gap", None))
+    if result.status != 0:
+        logger.info("gig %s global setlist solve gave up after %.3fs (%s), falling back to greedy",
+                    problem.gig_id, solve_seconds, result.message)
+        return None
+
+    return [model.solution_from(result.x[start:end]) for model, start, end in zip(models, offsets[:-1], offsets[1:])]
+
+
+def load_gig_assignment_data(gig: Gig, part_assignment_overrides: list[GigPartAssignmentOverride]) -> GigAssignmentData:
+    """Load the solver inputs for a gig in a fixed number of queries, independent of the number of songs,
+    members or overrides, and build its GigProblem.
+
+    Recommendation songs below SolverConfig.MIN_READY_PART_COVERAGE are left out of the problem, so they cost
+    no solve, and returned in skipped_songs instead."""
+    attendees = list(BandMember.objects.filter(gigattendance__gig=gig, gigattendance__status=GigAttendance.AVAILABLE)
+                     .select_related("user"))
+    gig_instruments: list[GigInstrument] = list(GigInstrument.objects.filter(gig=gig).select_related("instrument"))
+
+    candidate_rows = PartAssignment.objects.filter(~Exists(GigPartAssignmentOverride.objects.filter(gig_instrument__gig=gig,
+                                                                                                    song_part__song=OuterRef("song_part__song"),
+                                                                                                    member=OuterRef("member"),
+                                                                                                    override_type=OverrideType.ASSIGN)),
+                                                   member__gigattendance__gig=gig,
+                                                   member__gigattendance__status=GigAttendance.AVAILABLE,
+                                                   instrument__giginstrument__gig=gig,
+                                                   song_part__song__in_gig_rotation=True) \
         .exclude(performance_readiness=PerformanceReadiness.NOT_READY) \
-        .order_by("song_part__song")
+        .order_by("song_part__song", "id") \
+        .values_list("song_part__song_id", "id", "member_id", "song_part_id", "instrument_id", "performance_readiness")
 
-    song_to_part_assignments = {s: list(p) for s, p in groupby(all_part_assignments, lambda pa: pa.song_part.song)}
-    song_to_overrides = {s: list(o) for s, o in groupby(part_assignment_overrides, lambda pao: pao.song_part.song)}
+    check_coverage = SolverConfig.MIN_READY_PART_COVERAGE > 0
+    song_part_query = SongPart.objects.filter(song__in_gig_rotation=True).order_by("song", "_order")
+    if check_coverage:
+        # whether each part has a READY player, worked out alongside the parts so the coverage costs no extra query
+        song_part_query = song_part_query.annotate(has_ready_player=Exists(PartAssignment.objects.filter(
+            song_part=OuterRef("pk"), performance_readiness=PerformanceReadiness.READY, member__gigattendance__gig=gig,
+            member__gigattendance__status=GigAttendance.AVAILABLE, instrument__giginstrument__gig=gig)))
 
-    setlist_songs = {entry.song for entry in GigSetlistEntry.objects.filter(gig=gig, song__isnull=False)}
+    songs = {song.id: song for song in Song.objects.filter(in_gig_rotation=True)}
+    song_parts = {}
+    for song_part in song_part_query:
+        song_part.song = songs[song_part.song_id]
+        song_parts.setdefault(song_part.song_id, []).append(song_part)
 
-    song_counts_to_return = None
+    # a no-op for relations the caller already loaded with select_related
+    part_assignment_overrides = list(part_assignment_overrides)
+    prefetch_related_objects(part_assignment_overrides, "member__user", "song_part__song", "gig_instrument__instrument")
 
-    for song, attendee_part_assignments in sorted(song_to_part_assignments.items(), key=lambda s_apa: (s_apa[0] not in setlist_songs, len(s_apa[1]), s_apa[0].title)):
-        is_in_setlist = song in setlist_songs
-        part_list = list(song.parts.all())
+    setlist_song_ids = set(GigSetlistEntry.objects.filter(gig=gig, song__isnull=False).values_list("song_id", flat=True))
+
+    # overrides may name a member whose attendance has since changed, so they get indices too
+    members = list(attendees)
+    member_index = {member.pk: i for i, member in enumerate(members)}
+    for override in part_assignment_overrides:
+        if override.member_id not in member_index:
+            member_index[override.member_id] = len(members)
+            members.append(override.member)
+    instrument_index = {gi.instrument_id: i for i, gi in enumerate(gig_instruments)}
+    readiness_index = {readiness: i for i, readiness in enumerate(READINESS_CODES)}
+
+    song_to_overrides = {}
+    for override in part_assignment_overrides:
+        song_to_overrides.setdefault(override.song_part.song_id, []).append(override)
 
-        part_assignments, score = get_gig_song_part_assignments(part_list, list(attendee_part_assignments), gig_instruments, member_song_counts, song_to_overrides.get(song, []))
-        if part_assignments is None:
-            # invalid constraints
+    low_coverage = {}
+    for song_id, parts in song_parts.items():
+        if not check_coverage or song_id in setlist_song_ids or song_id in song_to_overrides:
             continue
+        coverage = SongCoverage(song=songs[song_id], num_parts=len(parts), num_ready_parts=sum(sp.has_ready_player for sp in parts))
+        if coverage.coverage < SolverConfig.MIN_READY_PART_COVERAGE:
+            low_coverage[song_id] = coverage
+
+    song_problems = []
+    skipped_songs = []
+    for song_id, rows in groupby(candidate_rows, lambda row: row[0]):
+        if song_id in low_coverage:
+            skipped_songs.append(low_coverage[song_id])
+            continue
+        rows = list(rows)
+        num_candidate_rows = len(rows)
+        part_index = {sp.id: i for i, sp in enumerate(song_parts[song_id])}
+
+        assign_overrides = []
+        not_playing = set()
+        for override in song_to_overrides.get(song_id, []):
+            if override.override_type == OverrideType.NOT_PLAYING:
+                not_playing.add((override.member_id, override.song_part_id, override.gig_instrument.instrument_id))
+            else:
+                assign_overrides.append(override)
+        rows = [row for row in rows if (row[2], row[3], row[4]) not in not_playing]
+
+        candidates = [(member_index[member_id], part_index[song_part_id], instrument_index[instrument_id], readiness_index[readiness])
+                      for _, _, member_id, song_part_id, instrument_id, readiness in rows]
+        candidates += [(member_index[o.member_id], part_index[o.song_part_id], instrument_index[o.gig_instrument.instrument_id],
+                        readiness_index[o.performance_readiness])
+                       for o in assign_overrides]
+        member, part, instrument, readiness = np.array(candidates, dtype=np.int32).reshape(-1, 4).T
+
+        song_problem = SongProblem(song_id=song_id, title=songs[song_id].title, in_setlist=song_id in setlist_song_ids,
+                                   num_parts=len(part_index), member=member, part=part, instrument=instrument,
+                                   readiness=readiness.astype(np.int8), num_assignments=len(rows),
+                                   assignment_ids=np.array([row[1] for row in rows], dtype=np.int64))
+        song_problems.append((num_candidate_rows, song_problem))
+
+    song_problems = [sp for _, sp in sorted(song_problems, key=lambda n_sp: (not n_sp[1].in_setlist, n_sp[0], n_sp[1].title))]
+
+    problem = GigProblem(gig_id=gig.id, member_ids=np.array([member.pk for member in members], dtype=np.int64),
+                         instrument_ids=np.array([gi.instrument_id for gi in gig_instruments], dtype=np.int64),
+                         instrument_capacity=np.array([gi.gig_quantity for gi in gig_instruments], dtype=float),
+                         instrument_counts_songs=np.array([gi.instrument.include_in_gig_song_count for gi in gig_instruments], dtype=bool),
+                         songs=song_problems)
+
+    skipped_songs = sorted(skipped_songs, key=lambda coverage: (-coverage.coverage, coverage.song.title))
+
+    return GigAssignmentData(problem=problem, attendees=attendees, gig_instruments=gig_instruments, members=members,
+                             songs=songs, song_parts=song_parts, skipped_songs=skipped_songs)
+
+
+class GigSolution:
+    """Solver output for a GigProblem, in index form.
+
+    song_results is aligned with problem.songs and holds (selected candidate indices, score), with selected None
+    when the song's constraints were infeasible. member_song_counts is indexed like the problem's members.
+    recommendation_counts holds the frozen counts the recommendations were solved against, or None if they
+    were solved sequentially. song_stats is aligned with song_results. setlist_mode is how the setlist was
+    actually solved, "greedy" or "global", and setlist_seconds how long that took.
+    """
+    __slots__ = ("song_results", "member_song_counts", "recommendation_counts", "song_stats", "setlist_mode", "setlist_seconds")
+
+    def __init__(self, song_results: list[Tuple[np.ndarray | None, float]], member_song_counts: np.ndarray,
+                 recommendation_counts: np.ndarray | None = None, song_stats: list[SongSolveStats] | None = None,
+                 setlist_mode: str = "greedy", setlist_seconds: float = 0.0):
+        self.song_results = song_results
+        self.member_song_counts = member_song_counts
+        self.recommendation_counts = recommendation_counts
+        self.song_stats = song_stats if song_stats is not None else []
+        self.setlist_mode = setlist_mode
+        self.setlist_seconds = setlist_seconds
+
+    def is_approximate(self, i: int) -> bool:
+        return i < len(self.song_stats) and self.song_stats[i].approximate
+
+    def is_estimated(self, i: int) -> bool:
+        return i < len(self.song_stats) and self.song_stats[i].estimated
+
+    @property
+    def approximate(self) -> bool:
+        return any(stats.approximate for stats in self.song_stats)
+
+
+def _config_key(setlist_mode: str | None = None) -> tuple:
+    settings = {k: v for config in (ScoringConfig, SolverConfig) for k, v in vars(config).items() if k.isupper()}
+    return RAND_SEED, setlist_mode or SolverConfig.SETLIST_MODE, tuple(sorted(settings.items()))
+
+
+def problem_fingerprint(problem: GigProblem, setlist_mode: str | None = None) -> str:
+    """Hash everything that can change a GigProblem's solution, including the scoring constants."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((_config_key(setlist_mode), problem.gig_id)).encode())
+    for array in (problem.member_ids, problem.instrument_ids, problem.instrument_capacity, problem.instrument_counts_songs):
+        digest.update(array.tobytes())
+    for song in problem.songs:
+        digest.update(repr((song.song_id, song.title, song.in_setlist, song.num_parts, song.num_assignments)).encode())
+        for array in (song.member, song.part, song.instrument, song.readiness, song.assignment_ids):
+            digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def _same_gig_inputs(a: GigProblem, b: GigProblem) -> bool:
+    return a.gig_id == b.gig_id and all(np.array_equal(getattr(a, field), getattr(b, field))
+                                        for field in ("member_ids", "instrument_ids", "instrument_capacity", "instrument_counts_songs"))
+
+
+def _same_song(a: SongProblem, b: SongProblem) -> bool:
+    return (a.song_id, a.title, a.in_setlist, a.num_parts, a.num_assignments) == \
+        (b.song_id, b.title, b.in_setlist, b.num_parts, b.num_assignments) and \
+        all(np.array_equal(getattr(a, field), getattr(b, field)) for field in ("member", "part", "instrument", "readiness", "assignment_ids"))
+
+
+class SolutionTrail:
+    """The last problem solved for a gig and its solution, kept so that a small edit only re-solves what it affects."""
+    __slots__ = ("config_key", "problem", "solution")
+
+    def __init__(self, config_key: tuple, problem: GigProblem, solution: GigSolution):
+        self.config_key = config_key
+        self.problem = problem
+        self.solution = solution
+
+
+def _count_song(problem: GigProblem, song: SongProblem, selected: np.ndarray, member_song_counts: np.ndarray):
+    # a member plays at most one part per song, so the indices are unique
+    counted = selected[problem.instrument_counts_songs[song.instrument[selected]]]
+    member_song_counts[song.member[counted]] += 1
+
+
+def _solve_recommendation_chunk(problem: GigProblem, songs: list[SongProblem], member_song_counts: np.ndarray,
+                                deadline: float | None = None) -> list[Tuple[np.ndarray | None, float, SongSolveStats]]:
+    results = []
+    for song in songs:
+        stats = SongSolveStats(song.song_id, song.title)
+        selected, score = get_gig_song_part_assignments(problem, song, member_song_counts, stats=stats, deadline=deadline)
+        results.append((selected, score, stats))
+    return results
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _get_executor(kind: str, max_workers: int) -> Executor:
+    """Return a long-lived pool so requests don't pay for starting workers."""
+    with _executors_lock:
+        executor = _executors.get((kind, max_workers))
+        if executor is None:
+            executor_class = {"process": ProcessPoolExecutor, "thread": ThreadPoolExecutor}[kind]
+            executor = _executors[(kind, max_workers)] = executor_class(max_workers=max_workers)
+        return executor
+
+
+def _solve_recommendations_in_pool(problem: GigProblem, songs: list[SongProblem], member_song_counts: np.ndarray,
+                                   deadline: float | None = None) -> list[Tuple[np.ndarray | None, float, SongSolveStats]]:
+    workers = SolverConfig.RECOMMENDATION_WORKERS
+    executor = _get_executor(SolverConfig.RECOMMENDATION_EXECUTOR, workers)
+
+    # ship only the gig-level arrays with each chunk, not every song
+    gig_only = GigProblem(gig_id=problem.gig_id, member_ids=problem.member_ids, instrument_ids=problem.instrument_ids,
+                          instrument_capacity=problem.instrument_capacity, instrument_counts_songs=problem.instrument_counts_songs,
+                          songs=[])
+    chunk_size = max(1, -(-len(songs) // (workers * 4)))
+    chunks = [songs[i:i + chunk_size] for i in range(0, len(songs), chunk_size)]
+    futures = [executor.submit(_solve_recommendation_chunk, gig_only, chunk, member_song_counts, deadline) for chunk in chunks]
+    return [result for future in futures for result in future.result()]
+
+
+def song_score_bound(model: SongModel, deadline: float | None = None) -> float:
+    """An optimistic score for a song: the best score the LP relaxation of its model allows.
 
-        member_song_counts.update([pa.member for pa in part_assignments if pa.instrument.include_in_gig_song_count])
+    The relaxation only scores the terms that make up the score, not the tie-breaker or the song count penalties,
+    so no assignment the MILP can pick scores higher. Returns inf if there is no time left to solve it, and -inf
+    if the song is infeasible.
+    """
+    time_limit = _time_limit(SolverConfig.SONG_TIME_LIMIT, deadline)
+    if time_limit <= 0:
+        return np.inf
+    result = optimize.milp(c=model.score_coeffs, constraints=LinearConstraint(model.A, model.lb, model.ub),
+                           bounds=optimize.Bounds(0, 1), options={"time_limit": time_limit})
+    if result.status == 2:
+        return -np.inf
+    if result.status != 0:
+        return np.inf
+    return ScoringConfig.SCORE_RANGE / 2 - result.fun
+
+
+def solve_recommendations_ranked(problem: GigProblem, songs: list[SongProblem], member_song_counts: np.ndarray,
+                                 known_scores: list[float] | None = None, deadline: float | None = None) \
+        -> list[Tuple[np.ndarray | None, float, SongSolveStats]]:
+    """Solve recommendation songs exactly only where that can change the top SolverConfig.RECOMMENDATION_TOP_K.
+
+    Every song first gets its song_score_bound. Songs are then solved exactly, best bound first, until there are
+    K exact scores (counting known_scores, those of songs reused from an earlier solve) and no bound left can
+    beat the K-th best of them. The rest get solve_greedy_song's assignment, with their bound as an estimated
+    score, so they still rank below every exact score that beat them. Results are aligned with songs.
+    """
+    top_k = SolverConfig.RECOMMENDATION_TOP_K
+    best = []  # min-heap of the K best exact scores
+
+    def add_exact(score):
+        heapq.heappush(best, score)
+        if len(best) > top_k:
+            heapq.heappop(best)
+
+    for score in known_scores or []:
+        add_exact(score)
+
+    models = []
+    bounds = []
+    seconds = []
+    for song in songs:
+        start = time.perf_counter()
+        models.append(build_song_model(problem, song, member_song_counts))
+        built = time.perf_counter()
+        bounds.append(song_score_bound(models[-1], deadline))
+        seconds.append((built - start, time.perf_counter() - built))
+
+    results = [None] * len(songs)
+    for i in sorted(range(len(songs)), key=lambda i: -bounds[i]):
+        song = songs[i]
+        stats = SongSolveStats(song.song_id, song.title)
+        if len(best) >= top_k and bounds[i] < best[0]:
+            x = solve_greedy_song(problem, song, models[i])
+            if x is not None:
+                stats.record("bound", models[i], *seconds[i], 0, None, estimated=True)
+                results[i] = (models[i].solution_from(x)[0], bounds[i], stats)
+                continue
+
+        selected, score = get_gig_song_part_assignments(problem, song, member_song_counts, stats=stats, deadline=deadline)
+        results[i] = (selected, score, stats)
+        if selected is not None:
+            add_exact(score)
+    return results
+
+
+def _run_to_completion(events: Generator):
+    """Drain a generator and return its return value."""
+    while True:
+        try:
+            next(events)
+        except StopIteration as stop:
+            return stop.value
+
+
+def solve_gig_problem(problem: GigProblem, trail: SolutionTrail | None = None, setlist_mode: str | None = None) -> GigSolution:
+    """Solve every song of a GigProblem.
+
+    Songs are solved in order, each seeing the song counts of the songs before it, so an edit to one song only
+    changes the results from that song onwards. Given the trail of an earlier solve of the same gig, the
+    unchanged leading songs are taken from it instead of being solved again. If the members, gig instruments
+    or solver settings changed, everything is solved from scratch.
+
+    setlist_mode overrides SolverConfig.SETLIST_MODE. In "global" mode the setlist songs are solved together by
+    solve_setlist_globally, and only reused if none of them changed.
+
+    The whole solve gets SolverConfig.GIG_TIME_BUDGET seconds; songs still unsolved when it runs out get a greedy
+    heuristic. Songs flagged approximate are never reused.
+    """
+    return _run_to_completion(iter_solve_gig_problem(problem, trail, setlist_mode))
+
+
+def iter_solve_gig_problem(problem: GigProblem, trail: SolutionTrail | None = None, setlist_mode: str | None = None) \
+        -> Generator[tuple, None, GigSolution]:
+    """solve_gig_problem, reporting each song as soon as its result is final.
+
+    Yields ("song", index into problem.songs, (selected, score), stats) for every song, and ("setlist", setlist mode,
+    setlist seconds, member song counts) once the setlist songs are all done, even if there are none. Returns the
+    GigSolution.
+    """
+    deadline = time.time() + SolverConfig.GIG_TIME_BUDGET
+    setlist_mode = setlist_mode or SolverConfig.SETLIST_MODE
+    if trail is not None and (trail.config_key != _config_key(setlist_mode) or not _same_gig_inputs(trail.problem, problem)):
+        trail = None
+
+    reusable = 0
+    if trail is not None:
+        for previous_song, song in zip(trail.problem.songs, problem.songs):
+            if not _same_song(previous_song, song) or trail.solution.is_approximate(reusable):
+                break
+            reusable += 1
+
+    song_results = []
+    song_stats = []
+    member_song_counts = np.zeros(problem.num_members, dtype=np.int64)
+
+    song_counts_to_return = None
+
+    if SolverConfig.RECOMMENDATION_MODE == "sequential":
+        sequential_songs = problem.songs
+    else:
+        # setlist songs come first in the solve order
+        sequential_songs = [song for song in problem.songs if song.in_setlist]
+
+    setlist_songs = [song for song in problem.songs if song.in_setlist]
+    setlist_results = None
+    setlist_stats = [SongSolveStats(song.song_id, song.title) for song in setlist_songs]
+    setlist_reused = trail is not None and reusable >= len(setlist_songs)
+    setlist_seconds = trail.solution.setlist_seconds if setlist_reused else 0.0
+    if setlist_reused:
+        setlist_mode = trail.solution.setlist_mode
+    start = time.perf_counter()
+    if setlist_mode == "global" and not setlist_reused:
+        setlist_results = solve_setlist_globally(problem, setlist_songs, setlist_stats, deadline)
+        if setlist_results is None:
+            # the greedy solve can't build on a globally solved setlist, and the failed attempt still counts
+            # towards the setlist solve time
+            setlist_mode = "greedy"
+            setlist_stats = [SongSolveStats(song.song_id, song.title) for song in setlist_songs]
+            reusable = 0
+
+    if not setlist_songs:
+        yield "setlist", setlist_mode, setlist_seconds, member_song_counts.copy()
+
+    for i, song in enumerate(sequential_songs):
+        stats = setlist_stats[i] if i < len(setlist_songs) else SongSolveStats(song.song_id, song.title)
+        if setlist_results is not None and i < len(setlist_songs):
+            selected, score = setlist_results[i]
+        elif i < reusable:
+            selected, score = trail.solution.song_results[i]
+        else:
+            selected, score = get_gig_song_part_assignments(problem, song, member_song_counts, stats=stats, deadline=deadline)
+        song_results.append((selected, score))
+        song_stats.append(stats)
+        if song.in_setlist and not setlist_reused:
+            setlist_seconds = time.perf_counter() - start
+        # selected is None for invalid constraints
+        if selected is not None:
+            _count_song(problem, song, selected, member_song_counts)
+            if song.in_setlist:
+                song_counts_to_return = member_song_counts.copy()
+
+        yield "song", i, (selected, score), stats
+        if i == len(setlist_songs) - 1:
+            yield "setlist", setlist_mode, setlist_seconds, member_song_counts.copy()
+
+    recommendation_counts = None
+    pooled_songs = problem.songs[len(sequential_songs):]
+    if pooled_songs:
+        recommendation_counts = member_song_counts.copy()
+
+        # pooled songs don't depend on each other, so any unchanged one can be reused if the counts they were
+        # solved against are unchanged too
+        previous_results = {}
+        if trail is not None and trail.solution.recommendation_counts is not None \
+                and np.array_equal(trail.solution.recommendation_counts, recommendation_counts):
+            previous_results = {song.song_id: (song, result)
+                                for i, (song, result) in enumerate(zip(trail.problem.songs, trail.solution.song_results))
+                                if not song.in_setlist and not trail.solution.is_approximate(i) and not trail.solution.is_estimated(i)}
+        to_solve = [song for song in pooled_songs
+                    if song.song_id not in previous_results or not _same_song(previous_results[song.song_id][0], song)]
 
-        if is_in_setlist:
-            gig_part_assignments_setlist.append(GigPartAssignment(song=song, part_assignments=part_assignments, score=score, attendees=attendees, gig_instruments=gig_instruments))
-            song_counts_to_return = member_song_counts.copy()
+        if SolverConfig.RECOMMENDATION_MODE == "ranked":
+            to_solve_ids = {song.song_id for song in to_solve}
+            reused_results = [previous_results[song.song_id][1] for song in pooled_songs if song.song_id not in to_solve_ids]
+            known_scores = [score for selected, score in reused_results if selected is not None]
+            solved = solve_recommendations_ranked(problem, to_solve, recommendation_counts, known_scores, deadline)
+        elif SolverConfig.RECOMMENDATION_MODE == "batched":
+            solved_stats = [SongSolveStats(song.song_id, song.title) for song in to_solve]
+            solved = solve_songs_batched(problem, to_solve, recommendation_counts, stats=solved_stats, deadline=deadline)
+            solved = [(selected, score, stats) for (selected, score), stats in zip(solved, solved_stats)]
         else:
-            gig_part_assignments_recs.append(GigPartAssignment(song=song, part_assignments=part_assignments, score=score, attendees=attendees, gig_instruments=gig_instruments))
+            solved = _solve_recommendations_in_pool(problem, to_solve, recommendation_counts, deadline)
+        solved = {song.song_id: result for song, result in zip(to_solve, solved)}
+
+        for song in pooled_songs:
+            if song.song_id in solved:
+                selected, score, stats = solved[song.song_id]
+            else:
+                (selected, score), stats = previous_results[song.song_id][1], SongSolveStats(song.song_id, song.title)
+            song_results.append((selected, score))
+            song_stats.append(stats)
+            if selected is not None:
+                _count_song(problem, song, selected, member_song_counts)
+            yield "song", len(song_results) - 1, (selected, score), stats
 
     if song_counts_to_return is None:
         song_counts_to_return = member_song_counts
 
-    gig_part_assignments_setlist = sorted(gig_part_assignments_setlist, key=lambda x: x.song.title)
+    return GigSolution(song_results=song_results, member_song_counts=song_counts_to_return,
+                       recommendation_counts=recommendation_counts, song_stats=song_stats, setlist_mode=setlist_mode,
+                       setlist_seconds=setlist_seconds)
+
+
+class SolverBusy(Exception):
+    """Raised by get_gig_solution when it may not wait for a solve slot and none is free."""
+
+
+# bounds the solves running at once in this process, across request threads and the background worker
+_solve_slots = threading.BoundedSemaphore(SolverConfig.MAX_CONCURRENT_SOLVES)
+# (gig id, fingerprint) -> Future of the solve in progress, shared by every request for the same inputs. It resolves
+# to None if its leader gave up without solving, being busy or abandoned, for a waiting request to take over.
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def get_gig_solution(problem: GigProblem, setlist_mode: str | None = None, allow_stale: bool = False) -> Tuple[GigSolution, bool]:
+    """Solve a GigProblem, reusing a cached solution if the same inputs were solved before, or the unchanged
+    part of the gig's last solve otherwise. Also returns whether the cache was hit.
+
+    Concurrent calls for the same inputs share one solve, and count as cache hits for all but the one that ran
+    it. Solves take one of SolverConfig.MAX_CONCURRENT_SOLVES slots; with allow_stale, SolverBusy is raised
+    instead of waiting for one, though a solve of the same inputs in progress is still waited for.
+
+    Solutions with approximate songs are not cached, so the next request gets another chance to solve them."""
+    return _run_to_completion(iter_gig_solution(problem, setlist_mode, allow_stale))
+
+
+def iter_gig_solution(problem: GigProblem, setlist_mode: str | None = None, allow_stale: bool = False) \
+        -> Generator[tuple, None, Tuple[GigSolution, bool]]:
+    """get_gig_solution, passing on iter_solve_gig_problem's events if it runs the solve itself. Cached and shared
+    solves yield nothing."""
+    fingerprint = problem_fingerprint(problem, setlist_mode)
+    solution = solution_cache.get(problem.gig_id, fingerprint)
+    if solution is not None:
+        solution_cache.put_trail(problem.gig_id, SolutionTrail(config_key=_config_key(setlist_mode), problem=problem, solution=solution))
+        return solution, True
+
+    key = (problem.gig_id, fingerprint)
+    while True:
+        with _in_flight_lock:
+            in_flight = _in_flight.get(key)
+            leader = in_flight is None
+            if leader:
+                in_flight = _in_flight[key] = Future()
+        if leader:
+            break
+        solution = in_flight.result()
+        if solution is not None:
+            return solution, True
+        # the leader gave up, so take over the solve
+
+    try:
+        if not _solve_slots.acquire(blocking=not allow_stale):
+            in_flight.set_result(None)
+            raise SolverBusy(f"no free solve slot for gig {problem.gig_id}")
+        try:
+            solution = yield from iter_solve_gig_problem(problem, solution_cache.get_trail(problem.gig_id), setlist_mode)
+        finally:
+            _solve_slots.release()
+        if not solution.approximate:
+            solution_cache.put(problem.gig_id, fingerprint, solution)
+        solution_cache.put_trail(problem.gig_id, SolutionTrail(config_key=_config_key(setlist_mode), problem=problem, solution=solution))
+        in_flight.set_result(solution)
+    except GeneratorExit:
+        # the streamed page was closed mid-solve
+        in_flight.set_result(None)
+        raise
+    except BaseException as e:
+        if not in_flight.done():
+            in_flight.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+    return solution, False
+
+
+def _log_solve_stats(stats: GigSolveStats):
+    logger.info("gig %s part assignments: %d songs (%d solved, %d skipped, cache %s) in %.3fs: load %.3fs, build %.3fs, milp %.3fs, "
+                "rehydrate %.3fs",
+                stats.gig_id, len(stats.songs), stats.num_solved, len(stats.skipped_songs), "hit" if stats.cache_hit else "miss",
+                stats.total_seconds, stats.load_seconds, stats.build_seconds, stats.milp_seconds, stats.rehydrate_seconds)
+    if stats.num_approximate:
+        logger.warning("gig %s part assignments: ran out of time on %d songs, their assignments are approximate",
+                       stats.gig_id, stats.num_approximate)
+    if logger.isEnabledFor(logging.DEBUG):
+        for song_stats in stats.songs:
+            logger.debug("gig %s song %s (%s): %s, %d vars, %d constraints, build %.4fs, solve %.4fs, status %d, gap %.2g",
+                         stats.gig_id, song_stats.song_id, song_stats.title, song_stats.method, song_stats.num_vars, song_stats.num_constraints,
+                         song_stats.build_seconds, song_stats.solve_seconds, song_stats.status, song_stats.mip_gap)
+
+
+def get_gig_part_assignments_with_stats(gig: Gig, part_assignment_overrides: list[GigPartAssignmentOverride],
+                                        setlist_mode: str | None = None, allow_stale: bool = False) \
+        -> Tuple[list[GigPartAssignment], list[GigPartAssignment], Counter, GigSolveStats]:
+    """get_gig_part_assignments, plus where the time went. setlist_mode overrides SolverConfig.SETLIST_MODE.
+
+    With allow_stale, if every solve slot is taken, the gig's last results are returned instead of waiting for one,
+    with stats.stale set. Without any earlier results it waits all the same."""
+    for event in iter_gig_part_assignments(gig, part_assignment_overrides, setlist_mode, allow_stale):
+        if event[0] == "done":
+            return event[1]
+
+
+def iter_gig_results(results: Tuple[list[GigPartAssignment], list[GigPartAssignment], Counter, GigSolveStats]) \
+        -> Generator[tuple, None, None]:
+    """The events of iter_gig_part_assignments for results that are already complete."""
+    setlist, recs, member_song_counts, stats = results
+    yield "setlist", setlist, member_song_counts, stats.setlist_mode, stats.setlist_seconds, stats.stale
+    for gig_part_assignment in recs:
+        yield "recommendation", gig_part_assignment
+    yield "done", results
+
+
+def iter_gig_part_assignments(gig: Gig, part_assignment_overrides: list[GigPartAssignmentOverride],
+                              setlist_mode: str | None = None, allow_stale: bool = False) -> Generator[tuple, None, None]:
+    """get_gig_part_assignments_with_stats as a stream of results, for pages that show the songs as they are solved.
+
+    Yields ("setlist", setlist, member song counts, setlist mode, setlist seconds, stale) once the setlist songs are done,
+    then ("recommendation", gig part assignment) for each recommendation as it is solved, and finally ("done",
+    (setlist, recommendations, member song counts, stats)) with everything in its usual order. Results that are
+    already cached come all at once, recommendations best first.
+    """
+    start = time.perf_counter()
+    data = load_gig_assignment_data(gig, part_assignment_overrides)
+    loaded = time.perf_counter()
+    results_key = setlist_mode or SolverConfig.SETLIST_MODE
+    rehydrate_seconds = 0.0
+
+    def rehydrate(i, selected, score, stats):
+        nonlocal rehydrate_seconds
+        rehydrate_start = time.perf_counter()
+        gig_part_assignment = data.to_gig_part_assignment(data.problem.songs[i], selected, score, stats.approximate, stats.estimated)
+        rehydrate_seconds += time.perf_counter() - rehydrate_start
+        return gig_part_assignment
+
+    gig_part_assignments_setlist = []
+    gig_part_assignments_recs = []
+    setlist_done = False
+    try:
+        solving = iter_gig_solution(data.problem, setlist_mode, allow_stale)
+        while True:
+            try:
+                event = next(solving)
+            except StopIteration as stop:
+                solution, cache_hit = stop.value
+                break
+            if event[0] == "setlist":
+                _, solved_setlist_mode, setlist_seconds, counts = event
+                gig_part_assignments_setlist = sorted(gig_part_assignments_setlist, key=lambda x: x.song.title)
+                setlist_done = True
+                yield "setlist", gig_part_assignments_setlist, data.to_member_song_counts(counts), solved_setlist_mode, setlist_seconds, False
+            else:
+                _, i, (selected, score), stats = event
+                if selected is None:
+                    continue
+                gig_part_assignment = rehydrate(i, selected, score, stats)
+                if data.problem.songs[i].in_setlist:
+                    gig_part_assignments_setlist.append(gig_part_assignment)
+                else:
+                    gig_part_assignments_recs.append(gig_part_assignment)
+                    yield "recommendation", gig_part_assignment
+    except SolverBusy:
+        latest = solution_cache.get_results(gig.id, results_key)
+        if latest is not None:
+            logger.info("gig %s part assignments: solver busy, serving the last results", gig.id)
+            setlist, recs, member_song_counts, stats = latest
+            stats = copy.copy(stats)
+            stats.stale = True
+            yield from iter_gig_results((setlist, recs, member_song_counts, stats))
+            return
+        solution, cache_hit = get_gig_solution(data.problem, setlist_mode)
+    solved = time.perf_counter()
+
+    if not setlist_done:
+        # nothing was streamed, so the solution came whole from the cache or another request
+        for i, (song, (selected, score)) in enumerate(zip(data.problem.songs, solution.song_results)):
+            if selected is None:
+                continue
+            gig_part_assignment = rehydrate(i, selected, score, solution.song_stats[i])
+            if song.in_setlist:
+                gig_part_assignments_setlist.append(gig_part_assignment)
+            else:
+                gig_part_assignments_recs.append(gig_part_assignment)
+        gig_part_assignments_setlist = sorted(gig_part_assignments_setlist, key=lambda x: x.song.title)
+        gig_part_assignments_recs = sorted(gig_part_assignments_recs, key=lambda x: (-x.score, x.song.title))
+        yield "setlist", gig_part_assignments_setlist, data.to_member_song_counts(solution.member_song_counts), \
+            solution.setlist_mode, solution.setlist_seconds, False
+        for gig_part_assignment in gig_part_assignments_recs:
+            yield "recommendation", gig_part_assignment
+
     gig_part_assignments_recs = sorted(gig_part_assignments_recs, key=lambda x: (-x.score, x.song.title))
+    member_song_counts = data.to_member_song_counts(solution.member_song_counts)
+
+    stats = GigSolveStats(gig_id=gig.id, cache_hit=cache_hit, load_seconds=loaded - start,
+                          solve_seconds=solved - loaded - rehydrate_seconds, rehydrate_seconds=rehydrate_seconds,
+                          songs=solution.song_stats, setlist_mode=solution.setlist_mode, setlist_seconds=solution.setlist_seconds,
+                          skipped_songs=data.skipped_songs)
+    _log_solve_stats(stats)
+
+    results = gig_part_assignments_setlist, gig_part_assignments_recs, member_song_counts, stats
+    solution_cache.put_results(gig.id, results_key, results)
+    yield "done", results
+
 
-    return gig_part_assignments_setlist, gig_part_assignments_recs, song_counts_to_return
+def get_gig_part_assignments(gig: Gig, part_assignment_overrides: list[GigPartAssignmentOverride],
+                             setlist_mode: str | None = None, allow_stale: bool = False) \
+        -> Tuple[list[GigPartAssignment], list[GigPartAssignment], Counter]:
+    gig_part_assignments_setlist, gig_part_assignments_recs, member_song_counts, _ = \
+        get_gig_part_assignments_with_stats(gig, part_assignment_overrides, setlist_mode, allow_stale)
+    return gig_part_assignments_setlist, gig_part_assignments_recs, member_song_counts
 
 
 def get_max_instrument_usage(
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# gig_part_assignment_benchmark.py
+# Created: 10/18/26
+
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone, timedelta
+from typing import Callable
+
+import django
+import numpy as np
+
+django.setup()
+from django.contrib.auth.models import User
+from band.models import Gig, GigAttendance, GigInstrument, GigPartAssignmentOverride, Instrument, OverrideType, \
+    PartAssignment, PerformanceReadiness, Song, SongPart
+from scripts.gig_part_assignment import GigProblem, SongProblem, READINESS_CODES, get_gig_part_assignments, \
+    get_gig_song_part_assignments, load_gig_assignment_data, solve_gig_problem, solve_songs_batched
+from scripts.gig_part_assignment_cache import solution_cache
+
+
+class BandSpec:
+    """The shape of a synthetic band.
+
+    Every member gets up to max_assignments_per_member random (part, instrument) assignments per song, a
+    backup_fraction of them as backups. num_overrides songs get one override each, alternating between
+    assigning a member to a part and taking one of their assignments away.
+    """
+    __slots__ = ("num_songs", "num_members", "num_instruments", "max_parts_per_song", "max_assignments_per_member",
+                 "backup_fraction", "num_overrides", "seed")
+
+    def __init__(self, num_songs: int = 200, num_members: int = 40, num_instruments: int = 8, max_parts_per_song: int = 6,
+                 max_assignments_per_member: int = 3, backup_fraction: float = 0.2, num_overrides: int = 0, seed: int = 0):
+        self.num_songs = num_songs
+        self.num_members = num_members
+        self.num_instruments = num_instruments
+        self.max_parts_per_song = max_parts_per_song
+        self.max_assignments_per_member = max_assignments_per_member
+        self.backup_fraction = backup_fraction
+        self.num_overrides = num_overrides
+        self.seed = seed
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _synthetic_band(spec: BandSpec):
+    """Draw the band described by spec.
+
+    Returns the instrument capacities and, per song, its number of parts, its sorted (member, part, instrument,
+    is_backup) assignments and its override as (type, member, part, instrument), or None.
+    """
+    rng = np.random.default_rng(spec.seed)
+    capacity = rng.integers(1, 6, size=spec.num_instruments)
+    override_songs = set(rng.choice(spec.num_songs, size=min(spec.num_overrides, spec.num_songs), replace=False).tolist())
+
+    songs = []
+    num_overridden = 0
+    for song_index in range(spec.num_songs):
+        num_parts = int(rng.integers(1, spec.max_parts_per_song + 1))
+        candidates = set()
+        for member in range(spec.num_members):
+            for _ in range(rng.integers(0, spec.max_assignments_per_member + 1)):
+                candidates.add((member, int(rng.integers(num_parts)), int(rng.integers(spec.num_instruments))))
+        assignments = [(*candidate, bool(rng.random() < spec.backup_fraction)) for candidate in sorted(candidates)]
+
+        override = None
+        if song_index in override_songs and assignments:
+            member, part, instrument, _ = assignments[rng.integers(len(assignments))]
+            override_type = OverrideType.ASSIGN if num_overridden % 2 == 0 else OverrideType.NOT_PLAYING
+            override = (override_type, member, part, instrument)
+            num_overridden += 1
+        songs.append((num_parts, assignments, override))
+
+    return capacity, songs
+
+
+def make_synthetic_problem(spec: BandSpec) -> GigProblem:
+    """Build the GigProblem of a synthetic band directly, without touching the database."""
+    capacity, band_songs = _synthetic_band(spec)
+    backup = READINESS_CODES.index(PerformanceReadiness.BACKUP)
+
+    songs = []
+    for song_id, (num_parts, assignments, override) in enumerate(band_songs):
+        forced = []
+        if override is not None:
+            override_type, member, part, instrument = override
+            if override_type == OverrideType.ASSIGN:
+                # an assign override replaces all of that member's own assignments for the song
+                assignments = [a for a in assignments if a[0] != member]
+                forced = [(member, part, instrument, False)]
+            else:
+                assignments = [a for a in assignments if a[:3] != (member, part, instrument)]
+        if not assignments and not forced:
+            continue
+
+        member, part, instrument, is_backup = np.array(assignments + forced, dtype=np.int32).reshape(-1, 4).T
+        songs.append(SongProblem(song_id=song_id, title=f"Song {song_id}", in_setlist=False, num_parts=num_parts,
+                                 member=member, part=part, instrument=instrument,
+                                 readiness=np.where(is_backup, backup, 0).astype(np.int8),
+                                 num_assignments=len(assignments), assignment_ids=np.arange(len(assignments), dtype=np.int64)))
+    songs.sort(key=lambda song: (song.num_assignments, song.title))
+
+    return GigProblem(gig_id=0, member_ids=np.arange(spec.num_members, dtype=np.int64),
+                      instrument_ids=np.arange(spec.num_instruments, dtype=np.int64), instrument_capacity=capacity.astype(float),
+                      instrument_counts_songs=np.ones(spec.num_instruments, dtype=bool), songs=songs)
+
+
+def populate_synthetic_band(spec: BandSpec) -> Gig:
+    """Create the synthetic band in the database and return its gig. Meant for a test database."""
+    capacity, band_songs = _synthetic_band(spec)
+    prefix = f"bench{spec.seed}"
+
+    gig = Gig.objects.create(name=f"Benchmark Gig {spec.seed}", start_datetime=datetime.now(timezone.utc),
+                             end_datetime=datetime.now(timezone.utc) + timedelta(hours=2))
+    instruments = [Instrument.objects.create(name=f"{prefix} Instrument {i}", order=i) for i in range(spec.num_instruments)]
+    gig_instruments = [GigInstrument.objects.create(gig=gig, instrument=instrument, gig_quantity=int(quantity))
+                       for instrument, quantity in zip(instruments, capacity)]
+    members = [User.objects.create_user(username=f"{prefix}-{i}", first_name=f"Member{i}").bandmember
+               for i in range(spec.num_members)]
+    GigAttendance.objects.bulk_create(GigAttendance(gig=gig, member=member, status=GigAttendance.AVAILABLE) for member in members)
+
+    songs = Song.objects.bulk_create(Song(title=f"{prefix} Song {i}", in_gig_rotation=True) for i in range(spec.num_songs))
+    song_parts = [[SongPart.objects.create(song=song, name=f"Part {p}") for p in range(num_parts)]
+                  for song, (num_parts, _, _) in zip(songs, band_songs)]
+
+    PartAssignment.objects.bulk_create(
+        PartAssignment(member=members[member], song_part=parts[part], instrument=instruments[instrument],
+                       performance_readiness=PerformanceReadiness.BACKUP if is_backup else PerformanceReadiness.READY)
+        for parts, (_, assignments, _) in zip(song_parts, band_songs)
+        for member, part, instrument, is_backup in assignments)
+    GigPartAssignmentOverride.objects.bulk_create(
+        GigPartAssignmentOverride(member=members[member], song_part=parts[part], gig_instrument=gig_instruments[instrument],
+                                  override_type=override_type)
+        for parts, (_, _, override) in zip(song_parts, band_songs) if override is not None
+        for override_type, member, part, instrument in [override])
+
+    return gig
+
+
+def measure(run: Callable[[], object], repeats: int) -> dict:
+    """Time run repeats times and report latency percentiles and peak memory.
+
+    Peak memory is what tracemalloc saw allocated through Python, which includes NumPy arrays but not
+    HiGHS' own C++ allocations; max_rss_kb is the process' peak resident set so far, which does.
+    """
+    samples = []
+    tracemalloc.start()
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run()
+            samples.append(time.perf_counter() - start)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "repeats": repeats,
+        "p50_seconds": float(np.percentile(samples, 50)),
+        "p95_seconds": float(np.percentile(samples, 95)),
+        "mean_seconds": float(np.mean(samples)),
+        "peak_traced_bytes": peak,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def benchmark_song_solves(problem: GigProblem, repeats: int = 1) -> dict:
+    """Latency of get_gig_song_part_assignments, one sample per song solve."""
+    member_song_counts = np.zeros(problem.num_members, dtype=np.int64)
+    songs = iter(problem.songs * repeats)
+
+    def solve_next_song():
+        song = next(songs)
+        get_gig_song_part_assignments(problem, song, member_song_counts, rng=np.random.default_rng(song.song_id))
+
+    return measure(solve_next_song, len(problem.songs) * repeats)
+
+
+def benchmark_gig_solves(problem: GigProblem, repeats: int = 3) -> dict:
+    """Latency of solving a whole in-memory gig problem, without loading or rehydration."""
+    return measure(lambda: solve_gig_problem(problem), repeats)
+
+
+def benchmark_gig_part_assignments(gig: Gig, repeats: int = 3) -> dict:
+    """End-to-end latency of get_gig_part_assignments, from the database to rehydrated results, with a cold cache."""
+    overrides = list(GigPartAssignmentOverride.objects.filter(gig_instrument__gig=gig))
+
+    def solve_cold():
+        solution_cache.clear()
+        get_gig_part_assignments(gig, overrides)
+
+    return measure(solve_cold, repeats)
+
+
+def benchmark_batched_recommendations(problem: GigProblem, seed: int = 0) -> dict:
+    """Time solving every song of a problem one MILP at a time against block-diagonal batches."""
+    member_song_counts = np.zeros(problem.num_members, dtype=np.int64)
+
+    start = time.perf_counter()
+    per_song = [get_gig_song_part_assignments(problem, song, member_song_counts, rng=np.random.default_rng((seed, song.song_id)))
+                for song in problem.songs]
+    per_song_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = solve_songs_batched(problem, problem.songs, member_song_counts,
+                                  [np.random.default_rng((seed, song.song_id)) for song in problem.songs])
+    batched_seconds = time.perf_counter() - start
+
+    return {
+        "per_song_seconds": per_song_seconds,
+        "batched_seconds": batched_seconds,
+        # the tie-breaker may pick a different assignment within solver tolerance, but never a different score
+        "same_scores": all(np.isclose(a[1], b[1]) for a, b in zip(per_song, batched)),
+    }
+
+
+def run_suite(spec: BandSpec, repeats: int = 3, use_db: bool = False, batched: bool = False) -> dict:
+    """Run every benchmark on one synthetic band and return the results as a JSON-ready dict."""
+    if use_db:
+        gig = populate_synthetic_band(spec)
+        problem = load_gig_assignment_data(gig, list(GigPartAssignmentOverride.objects.filter(gig_instrument__gig=gig))).problem
+    else:
+        problem = make_synthetic_problem(spec)
+
+    results = {
+        "num_candidates": sum(song.num_candidates for song in problem.songs),
+        "song": benchmark_song_solves(problem),
+        "gig": benchmark_gig_solves(problem, repeats),
+    }
+    if use_db:
+        results["gig_part_assignments"] = benchmark_gig_part_assignments(gig, repeats)
+    if batched:
+        results["batched"] = benchmark_batched_recommendations(problem, spec.seed)
+
+    return {"spec": spec.as_dict(), "source": "db" if use_db else "memory", "results": results}
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_runs(runs: list[dict], baseline: dict | None = None):
+    baseline_runs = {json.dumps(run["spec"], sort_keys=True) + run["source"]: run for run in (baseline or {}).get("runs", [])}
+
+    print(f"{'songs':>6} {'members':>7} {'benchmark':>20} {'p50 (s)':>9} {'p95 (s)':>9} {'peak MiB':>9}"
+          + ("  p50 vs baseline" if baseline else ""))
+    for run in runs:
+        previous = baseline_runs.get(json.dumps(run["spec"], sort_keys=True) + run["source"])
+        for name, result in run["results"].items():
+            if not isinstance(result, dict) or "p50_seconds" not in result:
+                continue
+            line = (f"{run['spec']['num_songs']:>6} {run['spec']['num_members']:>7} {name:>20} {result['p50_seconds']:>9.4f} "
+                    f"{result['p95_seconds']:>9.4f} {result['peak_traced_bytes'] / 2**20:>9.1f}")
+            if previous is not None and name in previous["results"]:
+                line += f"  {result['p50_seconds'] / previous['results'][name]['p50_seconds']:>8.2f}x"
+            print(line)
+        if "batched" in run["results"]:
+            row = run["results"]["batched"]
+            print(f"{'':>6} {'':>7} {'batched speedup':>20} {row['per_song_seconds'] / row['batched_seconds']:>9.2f}x"
+                  f"  same scores: {row['same_scores']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the gig part assignment solver on synthetic bands.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 1000], help="numbers of songs to solve")
+    parser.add_argument("--members", type=int, default=40)
+    parser.add_argument("--instruments", type=int, default=8)
+    parser.add_argument("--max-parts", type=int, default=6, help="maximum parts per song")
+    parser.add_argument("--max-assignments", type=int, default=3, help="maximum assignments per member per song")
+    parser.add_argument("--backup-fraction", type=float, default=0.2)
+    parser.add_argument("--overrides", type=int, default=0, help="number of songs with an override")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3, help="whole-gig solves per size")
+    parser.add_argument("--db", action="store_true", help="build the band in a throwaway test database and time end to end")
+    parser.add_argument("--batched", action="store_true", help="also compare per-song and batched MILPs")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="a previous --output file to compare p50 latencies against")
+    args = parser.parse_args()
+
+    specs = [BandSpec(num_songs=size, num_members=args.members, num_instruments=args.instruments, max_parts_per_song=args.max_parts,
+                      max_assignments_per_member=args.max_assignments, backup_fraction=args.backup_fraction,
+                      num_overrides=args.overrides, seed=args.seed)
+             for size in args.sizes]
+
+    if args.db:
+        from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            runs = [run_suite(spec, args.repeats, use_db=True, batched=args.batched) for spec in specs]
+        finally:
+            teardown_databases(old_config, verbosity=0)
+    else:
+        runs = [run_suite(spec, args.repeats, batched=args.batched) for spec in specs]
+
+    report = {
+        "commit": _git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "runs": runs,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    _print_runs(runs, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# gig_part_assignment_cache.py
+# Created: 10/18/26
+
+import logging
+import threading
+from collections import OrderedDict
+
+import django
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+django.setup()
+from band.models import Song, SongPart, PartAssignment, GigAttendance, GigInstrument, Instrument, \
+    GigPartAssignmentOverride, GigSetlistEntry
+
+logger = logging.getLogger(__name__)
+
+SOLUTION_CACHE_SIZE = 32
+
+
+class GigSolutionCache:
+    """Bounded LRU cache of solved gig problems, keyed by (gig id, input fingerprint).
+
+    The fingerprint already changes whenever the solver inputs do, so stale entries can never be served;
+    the signal receivers below just evict them early instead of letting them age out.
+
+    It also keeps the trail of the last solve of each gig. Trails are compared against the new inputs before
+    any of them is reused, so they are left alone by invalidation; they are what makes re-solving after an
+    edit cheap. Likewise the last rehydrated results of each gig and setlist mode are kept regardless of
+    invalidation, for views to serve, marked stale, while the solver is busy.
+    """
+    def __init__(self, max_size: int = SOLUTION_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._trails = OrderedDict()
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, gig_id: int, fingerprint: str):
+        with self._lock:
+            solution = self._entries.get((gig_id, fingerprint))
+            if solution is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end((gig_id, fingerprint))
+        logger.debug("gig %s solution cache %s (hits=%d, misses=%d)", gig_id, "miss" if solution is None else "hit",
+                     self.hits, self.misses)
+        return solution
+
+    def put(self, gig_id: int, fingerprint: str, solution):
+        with self._lock:
+            self._entries[(gig_id, fingerprint)] = solution
+            self._entries.move_to_end((gig_id, fingerprint))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_trail(self, gig_id: int):
+        with self._lock:
+            return self._trails.get(gig_id)
+
+    def put_trail(self, gig_id: int, trail):
+        with self._lock:
+            self._trails[gig_id] = trail
+            self._trails.move_to_end(gig_id)
+            while len(self._trails) > self.max_size:
+                self._trails.popitem(last=False)
+
+    def get_results(self, gig_id: int, setlist_mode: str):
+        with self._lock:
+            return self._results.get((gig_id, setlist_mode))
+
+    def put_results(self, gig_id: int, setlist_mode: str, results):
+        with self._lock:
+            self._results[(gig_id, setlist_mode)] = results
+            self._results.move_to_end((gig_id, setlist_mode))
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+
+    def invalidate(self, gig_id: int | None = None):
+        """Drop the entries for one gig, or every entry if gig_id is None."""
+        with self._lock:
+            if gig_id is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == gig_id]:
+                    del self._entries[key]
+
+    def clear(self):
+        """Drop every entry, trail and result."""
+        with self._lock:
+            self._entries.clear()
+            self._trails.clear()
+            self._results.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "max_size": self.max_size}
+
+
+solution_cache = GigSolutionCache()
+
+
+@receiver([post_save, post_delete], sender=GigAttendance)
+@receiver([post_save, post_delete], sender=GigInstrument)
+@receiver([post_save, post_delete], sender=GigSetlistEntry)
+def invalidate_gig_solutions(sender, instance, **kwargs):
+    solution_cache.invalidate(instance.gig_id)
+
+
+@receiver([post_save, post_delete], sender=GigPartAssignmentOverride)
+def invalidate_override_gig_solutions(sender, instance, **kwargs):
+    # the gig instrument may already be gone when the override is deleted in a cascade
+    gig_id = GigInstrument.objects.filter(pk=instance.gig_instrument_id).values_list("gig_id", flat=True).first()
+    solution_cache.invalidate(gig_id)
+
+
+@receiver([post_save, post_delete], sender=PartAssignment)
+@receiver([post_save, post_delete], sender=SongPart)
+@receiver([post_save, post_delete], sender=Song)
+@receiver([post_save, post_delete], sender=Instrument)
+def invalidate_all_solutions(sender, instance, **kwargs):
+    solution_cache.invalidate()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# gig_part_assignment_capture.py
+# Created: 10/18/26
+
+import argparse
+import hashlib
+import os
+import time
+from glob import glob
+
+import numpy as np
+from scipy import optimize, sparse
+from scipy.optimize import LinearConstraint
+
+# objectives of replayed problems may differ from the golden ones by the solver's gap tolerances
+REPLAY_ABS_TOLERANCE = 1e-6
+REPLAY_REL_TOLERANCE = 1e-4
+
+
+def capture_song_problem(directory: str, gig_id: int, song_id: int, c: np.ndarray, A: sparse.csr_array, lb: np.ndarray,
+                         ub: np.ndarray, member_ids: np.ndarray, part: np.ndarray, instrument_ids: np.ndarray,
+                         assignment_ids: np.ndarray, num_candidates: int, x: np.ndarray | None, status: int, method: str,
+                         solve_seconds: float, mps: bool = False) -> str:
+    """Write one per-song MILP and its solution to directory as a compressed .npz, and optionally as an MPS file.
+
+    member_ids and instrument_ids are the database ids of each candidate's member and instrument, part the
+    index of its song part in _order; candidates past len(assignment_ids) are forced overrides. The golden
+    objective is c @ x, or NaN if the problem was infeasible. Files are named by a hash of the problem, so
+    capturing the same problem twice keeps one copy. Returns the path of the .npz.
+    """
+    A = sparse.csr_array(A)
+    digest = hashlib.blake2b(digest_size=8)
+    for array in (c, A.data, A.indices, A.indptr, lb, ub):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    name = f"gig{gig_id}_song{song_id}_{digest.hexdigest()}"
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name + ".npz")
+    np.savez_compressed(path, gig_id=gig_id, song_id=song_id, c=c, A_data=A.data, A_indices=A.indices, A_indptr=A.indptr,
+                        A_shape=np.array(A.shape), lb=lb, ub=ub, member_ids=member_ids, part=part, instrument_ids=instrument_ids,
+                        assignment_ids=assignment_ids, num_candidates=num_candidates,
+                        x=np.full(len(c), np.nan) if x is None else x, objective=np.nan if x is None else float(c @ x),
+                        status=status, method=method, solve_seconds=solve_seconds)
+    if mps:
+        write_mps(os.path.join(directory, name + ".mps"), name, c, A, lb, ub)
+    return path
+
+
+def load_song_problem(path: str) -> dict:
+    """Read back a capture_song_problem file, with the constraint matrix reassembled as A."""
+    with np.load(path) as f:
+        captured = {key: f[key] for key in f.files}
+    captured["A"] = sparse.csr_array((captured.pop("A_data"), captured.pop("A_indices"), captured.pop("A_indptr")),
+                                     shape=tuple(captured.pop("A_shape")))
+    for key in ("gig_id", "song_id", "num_candidates", "status"):
+        captured[key] = int(captured[key])
+    for key in ("objective", "solve_seconds"):
+        captured[key] = float(captured[key])
+    captured["method"] = str(captured["method"])
+    return captured
+
+
+def write_mps(path: str, name: str, c: np.ndarray, A: sparse.csr_array, lb: np.ndarray, ub: np.ndarray):
+    """Write a binary program min c @ x subject to lb <= A @ x <= ub in free MPS format, for other solvers."""
+    rows = []
+    rhs = []
+    ranges = []
+    for i, (low, high) in enumerate(zip(lb, ub)):
+        if low == high:
+            rows.append(("E", f"r{i}"))
+            rhs.append((f"r{i}", high))
+        elif np.isinf(low):
+            rows.append(("L", f"r{i}"))
+            rhs.append((f"r{i}", high))
+        else:
+            rows.append(("G", f"r{i}"))
+            rhs.append((f"r{i}", low))
+            if not np.isinf(high):
+                ranges.append((f"r{i}", high - low))
+
+    A = sparse.csc_array(A)
+    lines = [f"NAME {name}", "ROWS", " N obj"] + [f" {kind} {row}" for kind, row in rows]
+    lines += ["COLUMNS", " MARKER 'MARKER' 'INTORG'"]
+    for j in range(len(c)):
+        lines.append(f" x{j} obj {float(c[j])!r}")
+        for i, value in zip(A.indices[A.indptr[j]:A.indptr[j + 1]], A.data[A.indptr[j]:A.indptr[j + 1]]):
+            lines.append(f" x{j} r{i} {float(value)!r}")
+    lines.append(" MARKER 'MARKER' 'INTEND'")
+    lines += ["RHS"] + [f" rhs {row} {float(value)!r}" for row, value in rhs if value != 0]
+    if ranges:
+        lines += ["RANGES"] + [f" rng {row} {float(value)!r}" for row, value in ranges]
+    lines += ["BOUNDS"] + [f" BV bnd x{j}" for j in range(len(c))]
+    lines.append("ENDATA")
+
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def replay_song_problem(captured: dict) -> dict:
+    """Re-solve a captured problem with the MILP solver and check its objective against the golden one."""
+    start = time.perf_counter()
+    result = optimize.milp(c=captured["c"], constraints=LinearConstraint(captured["A"], captured["lb"], captured["ub"]),
+                           bounds=optimize.Bounds(0, 1), integrality=np.ones_like(captured["c"]))
+    solve_seconds = time.perf_counter() - start
+
+    golden = captured["objective"]
+    objective = float(result.fun) if result.success else np.nan
+    if np.isnan(golden) or np.isnan(objective):
+        matches = bool(np.isnan(golden) and np.isnan(objective))
+    else:
+        matches = abs(objective - golden) <= max(REPLAY_ABS_TOLERANCE, REPLAY_REL_TOLERANCE * abs(golden))
+
+    return {
+        "gig_id": captured["gig_id"],
+        "song_id": captured["song_id"],
+        "num_vars": len(captured["c"]),
+        "num_constraints": captured["A"].shape[0],
+        "golden_objective": golden,
+        "objective": objective,
+        "matches": matches,
+        "golden_seconds": captured["solve_seconds"],
+        "solve_seconds": solve_seconds,
+    }
+
+
+def replay_corpus(directory: str) -> list[dict]:
+    """Replay every captured problem in directory, in file name order."""
+    return [replay_song_problem(load_song_problem(path)) for path in sorted(glob(os.path.join(directory, "*.npz")))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-solve captured gig part assignment problems and check them against "
+                                                 "their golden objectives.")
+    parser.add_argument("directory", help="directory the problems were captured to (SolverConfig.CAPTURE_DIR)")
+    parser.add_argument("--verbose", action="store_true", help="print every problem, not just mismatches")
+    args = parser.parse_args()
+
+    results = replay_corpus(args.directory)
+    for row in results:
+        if args.verbose or not row["matches"]:
+            print(f"{'ok ' if row['matches'] else 'BAD'} gig {row['gig_id']} song {row['song_id']}: "
+                  f"{row['num_vars']} vars, {row['num_constraints']} constraints, objective {row['objective']:.9f} "
+                  f"(golden {row['golden_objective']:.9f}), {row['solve_seconds']:.4f}s (golden {row['golden_seconds']:.4f}s)")
+
+    mismatches = sum(not row["matches"] for row in results)
+    print(f"{len(results)} problems, {mismatches} mismatches, "
+          f"{sum(row['solve_seconds'] for row in results):.3f}s replayed vs {sum(row['golden_seconds'] for row in results):.3f}s captured")
+    raise SystemExit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
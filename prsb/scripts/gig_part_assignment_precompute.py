@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# gig_part_assignment_precompute.py
+# Created: 10/18/26
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+django.setup()
+from django.conf import settings
+from band.models import Gig, GigAttendance, GigInstrument, GigPartAssignmentOverride, GigSetlistEntry, PartAssignment
+from scripts.gig_part_assignment import get_gig_part_assignments_with_stats
+
+logger = logging.getLogger(__name__)
+
+
+def upcoming_gig_ids() -> list[int]:
+    return list(Gig.objects.filter(end_datetime__gte=timezone.now()).values_list("id", flat=True))
+
+
+class GigPrecomputer:
+    """Recomputes the part assignments of upcoming gigs on a background thread after their inputs change, so the
+    next page view finds them in the solution cache instead of paying for the solve.
+
+    A gig is queued at most once: a change to a gig that is already queued is covered by that run, and a change
+    to a gig that is being solved queues one more run after it. A page view during a run of the same inputs waits
+    for it instead of solving again.
+    """
+    def __init__(self, max_workers: int = 1):
+        self.max_workers = max_workers
+        self._executor = None
+        self._queued = set()
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, gig_id: int):
+        with self._lock:
+            if gig_id in self._queued:
+                return
+            self._queued.add(gig_id)
+            if gig_id in self._running:
+                # _run queues it again once the current run is done
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="gig-precompute")
+            self._executor.submit(self._run, gig_id)
+
+    def schedule_upcoming(self):
+        for gig_id in upcoming_gig_ids():
+            self.schedule(gig_id)
+
+    def compute(self, gig_id: int):
+        """Solve one gig now, on the calling thread, which leaves its results as the latest. Returns None for a gig
+        that no longer exists or is over."""
+        gig = Gig.objects.filter(id=gig_id, end_datetime__gte=timezone.now()).first()
+        if gig is None:
+            return None
+        overrides = list(GigPartAssignmentOverride.objects.filter(gig_instrument__gig=gig)
+                         .select_related("member__user", "song_part__song", "gig_instrument__instrument"))
+        return get_gig_part_assignments_with_stats(gig, overrides)
+
+    def _run(self, gig_id: int):
+        with self._lock:
+            self._queued.discard(gig_id)
+            self._running.add(gig_id)
+        # the worker thread gets its own connection, and must not hold on to it past its lifetime
+        close_old_connections()
+        start = time.perf_counter()
+        try:
+            self.compute(gig_id)
+            logger.info("gig %s part assignments precomputed in %.3fs", gig_id, time.perf_counter() - start)
+        except Exception:
+            logger.exception("gig %s part assignments failed to precompute", gig_id)
+        finally:
+            close_old_connections()
+            with self._lock:
+                self._running.discard(gig_id)
+                if gig_id in self._queued:
+                    self._executor.submit(self._run, gig_id)
+
+
+precomputer = GigPrecomputer()
+
+
+def _schedule_after_commit(gig_id: int | None):
+    # the worker must see the change, so it only starts once the transaction making it has committed
+    if gig_id is not None:
+        transaction.on_commit(lambda: precomputer.schedule(gig_id))
+
+
+@receiver([post_save, post_delete], sender=GigAttendance)
+@receiver([post_save, post_delete], sender=GigInstrument)
+@receiver([post_save, post_delete], sender=GigSetlistEntry)
+def precompute_gig(sender, instance, **kwargs):
+    if settings.GIG_PRECOMPUTE:
+        _schedule_after_commit(instance.gig_id)
+
+
+@receiver([post_save, post_delete], sender=GigPartAssignmentOverride)
+def precompute_override_gig(sender, instance, **kwargs):
+    if settings.GIG_PRECOMPUTE:
+        # the gig instrument may already be gone when the override is deleted in a cascade
+        _schedule_after_commit(GigInstrument.objects.filter(pk=instance.gig_instrument_id).values_list("gig_id", flat=True).first())
+
+
+@receiver([post_save, post_delete], sender=PartAssignment)
+def precompute_upcoming_gigs(sender, instance, **kwargs):
+    if settings.GIG_PRECOMPUTE:
+        transaction.on_commit(precomputer.schedule_upcoming)